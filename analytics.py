@@ -0,0 +1,127 @@
+import bisect
+import threading
+from collections import Counter
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = [50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 7500, 10000, 15000, 30000, 60000]
+
+# ─── Materialized Analytics ──────────────────────────────────────────
+# Counters are folded in as conversations are appended and as clients /
+# appointments change, so the dashboard reads a snapshot instead of
+# rescanning every file on each refresh.
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, ms)] += 1
+        self.total += 1
+
+    def percentile(self, p):
+        if not self.total: return None
+        target, seen = p / 100 * self.total, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target: return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1]
+        return LATENCY_BUCKETS[-1]
+
+class StatusCounts:
+    # Record count plus a status breakdown, updated by diffing old/new records
+    def __init__(self):
+        self.total = 0
+        self.by_status = Counter()
+        self.sig = None
+
+    def rebuild(self, records, sig):
+        self.total = len(records)
+        self.by_status = Counter(r.get("status", "") for r in records.values())
+        self.sig = sig
+
+    def change(self, old, new, sig):
+        if old is not None:
+            self.total -= 1
+            self.by_status[old.get("status", "")] -= 1
+        if new is not None:
+            self.total += 1
+            self.by_status[new.get("status", "")] += 1
+        self.sig = sig
+
+class Analytics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.position = (0, 0)
+        self.conversations = 0
+        self.tokens = 0
+        self.daily = Counter()
+        self.languages = Counter()
+        self.sectors = Counter()
+        self.latency = LatencyHistogram()
+        self.prompts = 0
+        self.prompt_tokens = 0
+        self.section_tokens = Counter()
+        self.section_truncations = Counter()
+        self.clients = StatusCounts()
+        self.appointments = StatusCounts()
+
+    def _fold(self, convo):
+        self.conversations += 1
+        self.tokens += convo.get("tokens", 0) or 0
+        ts = convo.get("timestamp", "")
+        if ts: self.daily[ts[:10]] += 1
+        self.languages[convo.get("language") or "unknown"] += 1
+        self.sectors[convo.get("sector") or "unknown"] += 1
+        if convo.get("latency_ms") is not None: self.latency.add(convo["latency_ms"])
+        prompt = convo.get("prompt")
+        if prompt:
+            self.prompts += 1
+            self.prompt_tokens += prompt.get("total", 0)
+            self.section_tokens.update(prompt.get("sections", {}))
+            self.section_truncations.update(prompt.get("truncated", {}).keys())
+
+    def catch_up(self, log):
+        # Fold in records appended since the last call, including other workers' appends
+        with self.lock:
+            records, self.position = log.read_from(self.position)
+            for convo in records: self._fold(convo)
+
+    def sync_records(self, counts, load, version):
+        # Fall back to a recount only when the file changed outside our own write hooks.
+        # The version is re-read after loading so a concurrent write can't be counted twice
+        # (once in the rebuilt totals and again by its record_changed hook).
+        with self.lock:
+            sig = version()
+            while counts.sig != sig:
+                records, after = load(), version()
+                if after == sig: counts.rebuild(records, sig)
+                sig = after
+
+    def record_changed(self, counts, old, new, before_sig, after_sig):
+        # Apply the delta only if our counts matched the file we just overwrote
+        with self.lock:
+            if counts.sig == before_sig: counts.change(old, new, after_sig)
+
+    def _prompt_snapshot(self):
+        n = self.prompts or 1
+        return {"prompts": self.prompts, "avg_total": round(self.prompt_tokens / n),
+                "avg_per_section": {k: round(v / n) for k, v in self.section_tokens.most_common()},
+                "truncations": dict(self.section_truncations)}
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "total_clients": self.clients.total,
+                "active_clients": self.clients.by_status["active"],
+                "total_appointments": self.appointments.total,
+                "scheduled_appointments": self.appointments.by_status["scheduled"],
+                "completed_appointments": self.appointments.by_status["completed"],
+                "total_conversations": self.conversations,
+                "total_tokens": self.tokens,
+                "conversations_per_day": dict(sorted(self.daily.items())[-7:]),
+                "conversations_per_language": dict(self.languages),
+                "conversations_per_sector": dict(self.sectors),
+                "latency_ms": {"p50": self.latency.percentile(50), "p95": self.latency.percentile(95), "samples": self.latency.total},
+                "prompt_tokens": self._prompt_snapshot(),
+                "log_position": list(self.position),
+            }
@@ -3,16 +3,36 @@ import time
 import json
 import traceback
 import uuid
+import hashlib
+import threading
 from datetime import datetime
+from collections import deque
+from urllib.parse import urlencode
 from functools import wraps
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, render_template, abort, session, redirect, url_for, send_from_directory
+from flask import Flask, Response, request, jsonify, make_response, render_template, abort, session, redirect, url_for, send_from_directory, stream_with_context, g, has_request_context
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import secure_filename
 from flask_cors import CORS
-import pypdf
 import requests
 import urllib3
-from bs4 import BeautifulSoup
+from conversation_log import ConversationLog
+from cache import TTLCache
+from gemini_client import GeminiClient, GeminiBusy
+from ratelimit import make_rate_limiter
+from usage import ALL_SCOPES, UsageMeter
+from analytics import Analytics
+from crawler import Crawler, PageCache, canonicalize, normalize_url
+from jobs import JobQueue
+from storage import RECORD_TABLES, make_store as _make_store
+from search import ConversationIndex
+from sessions import SessionMemory
+from documents import DocumentExtractor
+from prompt import Prompt, Section
+from tenants import DEFAULT_TENANT, Tenant, TenantRegistry
+from tracing import Metrics, SamplingProfiler, Tracer, current_trace, log, new_request_id
+from speech import AudioCache, SpeechToText, TextToSpeech, PayloadTooLarge, audio_type, make_speech_backend, read_limited
+from retrieval import RecordIndex, BM25Index, chunk_text, render_records, tokenize, estimate_tokens
 
 # Suppress insecure request warnings for SSL verification disabled
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -20,9 +40,25 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 load_dotenv()
 
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 30))
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", 8))
+GEMINI_RETRIES = int(os.getenv("GEMINI_RETRIES", 2))
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT") or None
 HF_API_TOKEN = os.environ.get("HF_API_TOKEN")
 CLIENT_API_KEY = os.getenv("CLIENT_API_KEY", "dev-client-key")
 ADMIN_KEY = os.getenv("ADMIN_KEY", "admin-secret")
+# Dashboard accounts that see activity and usage across all tenants
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+RATE_LIMIT = int(os.getenv("RATE_LIMIT", 100))
+RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", 3600))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+USAGE_LOG_CAPACITY = int(os.getenv("USAGE_LOG_CAPACITY", 200))
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+SPEECH_BACKEND = os.getenv("SPEECH_BACKEND", "hf")
+SPEECH_TIMEOUT = float(os.getenv("SPEECH_TIMEOUT", 30))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", 64))
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", 0))
 
 IS_VERCEL = "VERCEL" in os.environ
 
@@ -32,6 +68,17 @@ if IS_VERCEL:
     APPOINTMENTS_FILE = "/tmp/appointments.json"
     CLIENTS_FILE = "/tmp/clients.json"
     CONVERSATIONS_FILE = "/tmp/conversations.json"
+    SESSIONS_FILE = "/tmp/sessions.json"
+    CONVERSATION_LOG_DIR = "/tmp/conversation_log"
+    RATE_LIMIT_DB = "/tmp/rate_limits.db"
+    USAGE_TOTALS_FILE = "/tmp/usage_totals.json"
+    JOBS_DIR = "/tmp/jobs"
+    DATABASE_FILE = "/tmp/lucy.db"
+    PAGE_CACHE_FILE = "/tmp/page_cache.json"
+    EXTRACT_CACHE_DIR = "/tmp/extract_cache"
+    TTS_CACHE_DIR = "/tmp/tts_cache"
+    TENANTS_FILE = "/tmp/tenants.json"
+    TENANTS_DIR = "/tmp/tenants"
     UPLOAD_FOLDER = "/tmp/uploads"
     if not os.path.exists("/tmp"):
         os.makedirs("/tmp", exist_ok=True)
@@ -41,6 +88,17 @@ else:
     APPOINTMENTS_FILE = "appointments.json"
     CLIENTS_FILE = "clients.json"
     CONVERSATIONS_FILE = "conversations.json"
+    SESSIONS_FILE = "sessions.json"
+    CONVERSATION_LOG_DIR = "conversation_log"
+    RATE_LIMIT_DB = "rate_limits.db"
+    USAGE_TOTALS_FILE = "usage_totals.json"
+    JOBS_DIR = "jobs"
+    DATABASE_FILE = "lucy.db"
+    PAGE_CACHE_FILE = "page_cache.json"
+    EXTRACT_CACHE_DIR = "extract_cache"
+    TTS_CACHE_DIR = "tts_cache"
+    TENANTS_FILE = "tenants.json"
+    TENANTS_DIR = "tenants"
     UPLOAD_FOLDER = "uploads"
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -56,13 +114,30 @@ DEFAULT_CONFIG = {
     "theme_color": "#4F46E5",
     "user_msg_color": "#4F46E5",
     "bot_msg_color": "#ffffff",
-    "send_btn_color": "#4F46E5"
+    "send_btn_color": "#4F46E5",
+    "data_token_budget": 1500,
+    "record_match_limit": 5,
+    "kb_chunk_size": 200,
+    "kb_top_k": 4,
+    "conversation_max_mb": 50,
+    "conversation_retention_days": 0,
+    "response_cache_ttl": 3600,
+    "crawl_workers": 8,
+    "crawl_per_host": 4,
+    "crawl_time_budget": 60,
+    "session_window_turns": 6,
+    "session_summary_chars": 1500,
+    "session_ttl_days": 7,
+    "prompt_token_budget": 6000,
+    "context_cache_ttl": 3600,
+    "context_cache_min_tokens": 1024,
+    "context_cache_max_tokens": 4096
 }
 
 try:
     import google.generativeai as genai
     if GOOGLE_API_KEY:
-        genai.configure(api_key=GOOGLE_API_KEY)
+        genai.configure(api_key=GOOGLE_API_KEY, transport=GEMINI_TRANSPORT)
         GEMINI_AVAILABLE = True
     else:
         GEMINI_AVAILABLE = False
@@ -71,13 +146,34 @@ except Exception as e:
     GEMINI_AVAILABLE = False
     print(f"Lucy AI: Gemini Error: {e}")
 
+# One cached context per hot tenant (plus a spare for the model/prompt change in flight)
+GEMINI = GeminiClient(genai, max_in_flight=GEMINI_MAX_IN_FLIGHT, timeout=GEMINI_TIMEOUT, retries=GEMINI_RETRIES,
+                      max_contexts=TENANT_CACHE_SIZE * 2) if GEMINI_AVAILABLE else None
+
 app = Flask(__name__, template_folder="templates", static_folder="static")
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "lucy-secret-777")
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 CORS(app)
 
-USAGE_LOGS = []
-RATE_TRACKER = {}
+# Recent activity only; billing totals live in USAGE_METER
+USAGE_LOGS = deque(maxlen=USAGE_LOG_CAPACITY)
+USAGE_METER = UsageMeter(USAGE_TOTALS_FILE)
+ANALYTICS = Analytics()
+CONVERSATION_INDEX = ConversationIndex()
+PAGE_CACHE = PageCache(PAGE_CACHE_FILE)
+SPEECH = make_speech_backend(SPEECH_BACKEND, HF_API_TOKEN, timeout=SPEECH_TIMEOUT)
+# Operator routing, e.g. ASR_MODELS="am=https://mms.example/asr,om=org/oromo-asr"; tenants may only pick HF model ids
+ASR_MODELS = dict(item.split("=", 1) for item in os.getenv("ASR_MODELS", "").split(",") if "=" in item)
+ASR = SpeechToText(SPEECH, models=ASR_MODELS, default_model=os.getenv("ASR_MODEL"), max_bytes=int(os.getenv("ASR_MAX_KB", 10240)) * 1024)
+TTS = TextToSpeech(SPEECH, AudioCache(TTS_CACHE_DIR, max_bytes=int(os.getenv("TTS_CACHE_MB", 200)) * 1024 * 1024),
+                   workers=int(os.getenv("TTS_WORKERS", 4)))
+EXTRACTOR = DocumentExtractor(EXTRACT_CACHE_DIR, workers=int(os.getenv("PDF_WORKERS", min(4, os.cpu_count() or 1))))
+# Vercel freezes the function once the response is sent, so jobs run inside the request there
+JOBS = JobQueue(JOBS_DIR, workers=int(os.getenv("JOB_WORKERS", 2)), inline=IS_VERCEL)
+RATE_LIMITER = make_rate_limiter(RATE_LIMIT_BACKEND, limit=RATE_LIMIT, window=RATE_LIMIT_WINDOW, path=RATE_LIMIT_DB)
+# Profiling is off unless PROFILER_INTERVAL_MS is set; PROFILE_SAMPLE_RATE picks the share of requests sampled
+TRACER = Tracer(Metrics(), SamplingProfiler(PROFILER_INTERVAL_MS / 1000) if PROFILER_INTERVAL_MS > 0 else None,
+                sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 1.0)))
 
 SUPPORTED_LANGUAGES = [
     {"code": "am", "name": "Amharic"}, {"code": "om", "name": "Oromo"},
@@ -85,80 +181,193 @@ SUPPORTED_LANGUAGES = [
 ]
 
 # ─── Data Helpers ─────────────────────────────────────────────────────
+# STORE is the JSON files (dev) or a shared SQLite database (STORAGE_BACKEND=sqlite).
+# It holds users, the tenant registry and the default tenant's data; every other
+# tenant has its own store under TENANTS_DIR (see tenant_store()).
+# Loaded tables are shared across requests: callers that mutate one must save it.
+
+def make_store(backend=None):
+    paths = {"users": USERS_FILE, "clients": CLIENTS_FILE, "appointments": APPOINTMENTS_FILE,
+             "sessions": SESSIONS_FILE, "tenants": TENANTS_FILE, "config": BOT_CONFIG_FILE}
+    store = _make_store(backend or STORAGE_BACKEND, DATABASE_FILE, paths, CONVERSATION_LOG_DIR, CONVERSATIONS_FILE)
+    store.on_change = on_record_change
+    return store
+
+def on_record_change(table, old, new, before, after, analytics=None):
+    analytics = analytics or ANALYTICS
+    if table in ("clients", "appointments"): analytics.record_changed(getattr(analytics, table), old, new, before, after)
+
+STORE = make_store()
+
+# ─── Tracing ─────────────────────────────────────────────────────────
+# Every request gets an ID (X-Request-ID, honoured from a proxy or minted),
+# which prefixes log lines and is returned in the response headers. Stage
+# spans (TRACER.span) and per-route latency feed the Prometheus histograms
+# served by /metrics; Server-Timing shows the stage breakdown per response.
+# Registered before enter_tenant, so requests it rejects (401) are traced too.
+
+@app.before_request
+def start_trace():
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.trace_token = TRACER.begin(new_request_id(request.headers.get("X-Request-ID")), route)
+
+@app.after_request
+def trace_headers(response):
+    trace = current_trace()
+    token = g.pop("trace_token", None)
+    if trace is None or token is None: return response
+    trace.status = response.status_code
+    response.headers["X-Request-ID"] = trace.request_id
+    # Streamed bodies haven't run yet, so their stages are only in /metrics
+    if trace.spans and not response.is_streamed: response.headers["Server-Timing"] = trace.server_timing()
+    method = request.method
+    # The server closes the response once the body is sent, so SSE latency covers the whole stream
+    def finish():
+        TRACER.end(token)
+        TRACER.observe_request(trace.route, method, trace.status, time.perf_counter() - trace.started)
+    response.call_on_close(finish)
+    return response
+
+# ─── Tenants ─────────────────────────────────────────────────────────
+# Each API key belongs to one tenant. The tenant is resolved once per request
+# (before_request) and every data helper below reads through it, so prompts,
+# record lookups, caches and analytics only ever see that tenant's data.
+
+def open_tenant(tenant_id):
+    if tenant_id == DEFAULT_TENANT: return Tenant(tenant_id, STORE, ANALYTICS, CONVERSATION_INDEX)
+    directory = os.path.join(TENANTS_DIR, tenant_id)
+    os.makedirs(directory, exist_ok=True)
+    paths = {table: os.path.join(directory, f"{table}.json") for table in RECORD_TABLES}
+    paths["config"] = os.path.join(directory, "bot_config.json")
+    store = _make_store(STORAGE_BACKEND, os.path.join(directory, "lucy.db"), paths, os.path.join(directory, "conversation_log"))
+    tenant = Tenant(tenant_id, store, Analytics(), ConversationIndex())
+    store.on_change = lambda table, *change: on_record_change(table, *change, analytics=tenant.analytics)
+    return tenant
+
+def make_tenants():
+    return TenantRegistry(lambda: STORE, open_tenant, max_hot=TENANT_CACHE_SIZE)
+
+TENANTS = make_tenants()
+
+def current_tenant():
+    # TENANTS.use() (threads, tenant setup), else the request's tenant, else the default
+    return TENANTS.current(g.get("tenant") if has_request_context() else None)
+
+def tenant_store():
+    return current_tenant().store
+
+def create_tenant(name, owner=None):
+    # Registers the tenant and seeds its config with the new API key
+    tenant_id, record = TENANTS.create(name, owner)
+    with TENANTS.use(TENANTS.get(tenant_id)):
+        save_config(dict(DEFAULT_CONFIG, client_api_key=record["api_key"], bot_name=name or DEFAULT_CONFIG["bot_name"]))
+    return tenant_id
+
+def api_key_available(key, tenant_id):
+    # The key is also the tenant's identity, so it must not match another tenant's key, the
+    # default tenant's (kept in its config, not the tenants table) or the shared demo key.
+    # "/" is reserved for the tenant scope in usage totals.
+    if not key or "/" in key or key == "dashboard-demo-key": return False
+    if TENANTS.lookup(key) not in (None, tenant_id): return False
+    if tenant_id == DEFAULT_TENANT: return True
+    with TENANTS.use(TENANTS.get(DEFAULT_TENANT)): default_key = load_config().get("client_api_key", CLIENT_API_KEY)
+    return key not in (default_key, CLIENT_API_KEY)
+
+def resolve_tenant():
+    # Dashboard users always act in their own tenant, whatever headers they send. Otherwise
+    # X-API-KEY (or ?key= for the widget config) picks the tenant; requests without a key
+    # (and the dashboard demo key) use the default tenant. Returns None for an unknown key.
+    if "user" in session:
+        tenant_id = session.get("tenant")
+        if tenant_id is None: tenant_id = (STORE.get("users", session["user"]) or {}).get("tenant_id")
+        return TENANTS.get(tenant_id if tenant_id and TENANTS.exists(tenant_id) else DEFAULT_TENANT)
+    key = request.headers.get("X-API-KEY") or (request.args.get("key") if request.endpoint == "widget_config" else None)
+    if not key or key == "dashboard-demo-key": return TENANTS.get(DEFAULT_TENANT)
+    tenant_id = TENANTS.lookup(key)
+    if tenant_id: return TENANTS.get(tenant_id)
+    default = TENANTS.get(DEFAULT_TENANT)
+    with TENANTS.use(default): default_key = load_config().get("client_api_key", CLIENT_API_KEY)
+    return default if key == default_key else None
+
+@app.before_request
+def enter_tenant():
+    # On g, so streamed bodies (stream_with_context) still see it
+    tenant = resolve_tenant()
+    if tenant is None:
+        log(f"Auth Failure: Unknown API key on {request.path}")
+        return jsonify({"error": "Unauthorized"}), 401
+    g.tenant = tenant
 
 def load_users():
-    if not os.path.exists(USERS_FILE): return {}
-    try:
-        with open(USERS_FILE, 'r') as f: return json.load(f)
-    except: return {}
+    return STORE.load("users")
 
 def save_users(users):
-    try:
-        with open(USERS_FILE, 'w') as f: json.dump(users, f)
-    except: pass
+    STORE.save("users", users)
 
 def load_appointments():
-    if not os.path.exists(APPOINTMENTS_FILE): return {}
-    try:
-        with open(APPOINTMENTS_FILE, 'r', encoding='utf-8') as f: return json.load(f)
-    except: return {}
+    return tenant_store().load("appointments")
 
 def save_appointments(data):
-    try:
-        with open(APPOINTMENTS_FILE, 'w', encoding='utf-8') as f: json.dump(data, f, indent=2)
-    except: pass
+    tenant_store().save("appointments", data)
 
 def load_clients():
-    if not os.path.exists(CLIENTS_FILE): return {}
-    try:
-        with open(CLIENTS_FILE, 'r', encoding='utf-8') as f: return json.load(f)
-    except: return {}
+    return tenant_store().load("clients")
 
 def save_clients(data):
-    try:
-        with open(CLIENTS_FILE, 'w', encoding='utf-8') as f: json.dump(data, f, indent=2)
-    except: pass
+    tenant_store().save("clients", data)
 
-def load_conversations():
-    if not os.path.exists(CONVERSATIONS_FILE): return []
-    try:
-        with open(CONVERSATIONS_FILE, 'r', encoding='utf-8') as f: return json.load(f)
-    except: return []
+def get_conversation_log():
+    config = load_config()
+    max_mb = float(config.get("conversation_max_mb", 50) or 0)
+    days = float(config.get("conversation_retention_days", 0) or 0)
+    store, memo = tenant_store(), current_tenant().slot("conversation_log")
+    key = (id(store), max_mb, days)
+    if memo.get("key") != key:
+        memo["log"] = store.conversation_log(max_bytes=int(max_mb * 1024 * 1024) or None, max_age_days=days or None)
+        memo["key"] = key
+    return memo["log"]
 
-def save_conversations(data):
-    try:
-        with open(CONVERSATIONS_FILE, 'w', encoding='utf-8') as f: json.dump(data, f, indent=2)
-    except: pass
+def load_conversations():
+    return list(get_conversation_log())
+
+def append_conversation(record):
+    get_conversation_log().append(record)
+
+def get_session_memory(config):
+    window = int(config.get("session_window_turns", 6))
+    chars = int(config.get("session_summary_chars", 1500))
+    days = float(config.get("session_ttl_days", 7) or 0)
+    store, memo = tenant_store(), current_tenant().slot("sessions")
+    key = (id(store), window, chars, days)
+    if memo.get("key") != key:
+        memo["memory"] = SessionMemory(store, window_turns=window, summary_chars=chars, ttl_days=days)
+        memo["key"] = key
+    return memo["memory"]
 
 def load_config():
-    if not os.path.exists(BOT_CONFIG_FILE):
-        if os.path.exists("bot_config.json"):
-            try:
-                with open("bot_config.json", 'r') as src: data = json.load(src)
-                save_config(data)
-                return data
-            except: pass
-        return DEFAULT_CONFIG.copy()
-    try:
-        with open(BOT_CONFIG_FILE, 'r', encoding='utf-8') as f: return json.load(f)
-    except: return DEFAULT_CONFIG.copy()
+    store = tenant_store()
+    config = store.get_config()
+    if config is not None: return config
+    if store is STORE and STORE.backend == "json" and os.path.exists("bot_config.json") and BOT_CONFIG_FILE != "bot_config.json":
+        try:
+            with open("bot_config.json", 'r') as src: data = json.load(src)
+        except (OSError, ValueError) as e: log(f"Failed to import bot_config.json: {e}")
+        else:
+            save_config(data)
+            return data
+    return DEFAULT_CONFIG.copy()
 
 def save_config(config):
-    try:
-        with open(BOT_CONFIG_FILE, 'w', encoding='utf-8') as f: json.dump(config, f, indent=2)
-    except: pass
+    tenant_store().set_config(config)
 
-def extract_text_from_file(filepath):
-    ext = os.path.splitext(filepath)[1].lower()
-    text = ""
-    try:
-        if ext == '.pdf':
-            reader = pypdf.PdfReader(filepath)
-            for page in reader.pages: text += page.extract_text() + "\n"
-        elif ext in ['.txt', '.md', '.csv']:
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f: text = f.read()
-    except Exception as e: return f"Error: {str(e)}"
-    return text.strip()
+def extract_text_from_file(filepath, pages=None, on_progress=None, on_chunk=None):
+    # on_chunk gets each page (or text block) as soon as it is extracted. Errors propagate,
+    # so the upload job is marked failed rather than "done" with an error as its text
+    parts = []
+    for chunk in EXTRACTOR.iter_chunks(filepath, pages=pages, on_progress=on_progress):
+        parts.append(chunk)
+        if on_chunk and chunk.strip(): on_chunk(chunk)
+    return "".join(parts).strip()
 
 # ─── Auth Helpers ─────────────────────────────────────────────────────
 
@@ -183,24 +392,91 @@ def require_client_key(f):
         key = request.headers.get("X-API-KEY")
         config = load_config()
         expected = config.get("client_api_key", CLIENT_API_KEY)
-        if key == "dashboard-demo-key": return f(*args, **kwargs)
-        if not key or key != expected:
-            print(f"Lucy AI Auth Failure: Received '{key}', Expected '{expected}'")
+        if key != "dashboard-demo-key" and (not key or key != expected):
+            log(f"Auth Failure: Received '{key}', Expected '{expected}'")
             return jsonify({"error": "Unauthorized"}), 401
-        return f(*args, **kwargs)
+        # The dashboard's demo key is shared by every user, so it is limited per user (or tenant)
+        bucket = f"{key}:{session.get('user') or current_tenant().id}" if key == "dashboard-demo-key" else key
+        allowed, limit_headers = RATE_LIMITER.check(bucket)
+        if not allowed:
+            return jsonify({"error": "Rate limit exceeded"}), 429, limit_headers
+        response = make_response(f(*args, **kwargs))
+        response.headers.update(limit_headers)
+        return response
     return wrapped
 
+def usage_scope():
+    # Usage is metered per tenant, so rotated-out keys still count; the default tenant is unscoped
+    tenant_id = current_tenant().id
+    return None if tenant_id == DEFAULT_TENANT else tenant_id
+
 def log_usage(key, endpoint, payload=None):
-    USAGE_LOGS.append({"key": key, "endpoint": endpoint, "timestamp": time.time(), "payload": payload})
+    payload = dict(payload or {})
+    usage = payload.get("usage") or {}
+    USAGE_METER.record(key, tokens=usage.get("total_tokens", 0), cached=payload.pop("cached", False), scope=usage_scope())
+    if isinstance(payload.get("reply"), str): payload["reply"] = payload["reply"][:200]
+    USAGE_LOGS.append({"key": key, "tenant": current_tenant().id, "endpoint": endpoint, "timestamp": time.time(), "payload": payload})
+
+def is_admin():
+    # Set per account ("admin": true on the user record) or through ADMIN_EMAILS
+    email = session.get("user")
+    if not email: return False
+    return email.lower() in ADMIN_EMAILS or bool((STORE.get("users", email) or {}).get("admin"))
+
+# Admins see activity and usage across all tenants, everyone else only their own
+def visible_usage_logs():
+    entries = list(USAGE_LOGS)  # copied first: other requests append while we filter
+    if is_admin(): return entries
+    tenant_id = current_tenant().id
+    return [e for e in entries if e.get("tenant") == tenant_id]
+
+def visible_usage_scope():
+    return ALL_SCOPES if is_admin() else usage_scope()
+
+# ─── Retrieval ───────────────────────────────────────────────────────
+
+def get_record_index():
+    # Rebuild only when the tenant's clients / appointments change
+    store, memo = tenant_store(), current_tenant().slot("record_index")
+    sig = (id(store), store.version("clients"), store.version("appointments"))
+    if memo.get("index") is None or memo["sig"] != sig:
+        memo["index"] = RecordIndex(load_clients(), load_appointments())
+        memo["sig"] = sig
+    return memo["index"]
+
+def match_records(user_query, context, config):
+    limit = int(config.get("record_match_limit", 5))
+    return get_record_index().lookup(f"{user_query}\n{context or ''}", limit=limit)
+
+def lookup_records(user_query, context, config, records=None):
+    budget = int(config.get("data_token_budget", 1500))
+    clients, appointments = records or match_records(user_query, context, config)
+    clients_json, used = render_records(clients, budget // 2)
+    appts_json, _ = render_records(appointments, budget - used)
+    return (clients_json if clients else ""), (appts_json if appointments else "")
+
+def get_kb_index(config):
+    kb = config.get("knowledge_base", "")
+    chunk_size = int(config.get("kb_chunk_size", 200))
+    key = (hashlib.sha1(kb.encode("utf-8")).hexdigest(), chunk_size)
+    memo = current_tenant().slot("kb_index")
+    if memo.get("key") != key:
+        # Re-scrapes usually change a few pages; unchanged chunks reuse their term counts
+        previous = memo["index"] if memo.get("key") and memo["key"][1] == chunk_size else None
+        memo["index"] = BM25Index(chunk_text(kb, chunk_size), previous=previous)
+        memo["key"] = key
+    return memo["index"]
+
+def retrieve_knowledge(user_query, context, config):
+    index = get_kb_index(config)
+    k = int(config.get("kb_top_k", 4))
+    if len(index.chunks) <= k: return "\n\n".join(c["text"] for c in index.chunks)
+    hits = index.search(f"{user_query}\n{context or ''}", k=k)
+    return "\n\n".join(c["text"] for c in hits)
 
 # ─── AI Prompt & Gemini ──────────────────────────────────────────────
 
-def build_prompt(user_query, language, context, sector):
-    config = load_config()
-    appointments = load_appointments()
-    clients = load_clients()
-    
-    INTERNAL_CORE_INSTRUCTIONS = """
+INTERNAL_CORE_INSTRUCTIONS = """
     You are Lucy AI, an expert customer support AGENT for a company.
     You act ON BEHALF of the company — you ARE the company's representative.
     
@@ -225,42 +501,163 @@ def build_prompt(user_query, language, context, sector):
     9. For complex gov website navigation, guide step-by-step.
     10. If language not well supported, suggest switching to Amharic or English.
     """
-    
-    full_context = config.get('knowledge_base', '')
+
+CORE_RULES = "CORE RULES: Respond in the same language as the user query. If the query is in English, you can respond in English but mention you also speak Amharic, Oromo, and Tigrinya. Stick strictly to the KNOWLEDGE BASE."
+
+def compose_prompt(user_query, language, context, sector, records=None):
+    config = load_config()
+    clients, appointments = records or match_records(user_query, context, config)
+    clients_json, appts_json = lookup_records(user_query, context, config, (clients, appointments))
+    no_match = "No matching records. Ask the user for their Full Name and Client ID."
+
+    full_context = retrieve_knowledge(user_query, context, config)
     history = context or ''
     system = config.get('system_prompt', '')
-    
-    parts = [
-        f"CORE INSTRUCTIONS: {INTERNAL_CORE_INSTRUCTIONS}",
-        f"CLIENT DATABASE: {json.dumps(clients)}",
-        f"APPOINTMENT DATA: {json.dumps(appointments)}",
-        f"ADDITIONAL CONTEXT: {system}" if system else "",
-        "CORE RULES: Respond in the same language as the user query. If the query is in English, you can respond in English but mention you also speak Amharic, Oromo, and Tigrinya. Stick strictly to the KNOWLEDGE BASE.",
-        f"KNOWLEDGE BASE:\n{full_context}",
-        f"CONVERSATION HISTORY:\n{history}",
-        f"USER QUERY: {user_query}",
-        "ASSISTANT RESPONSE:"
-    ]
-    return "\n\n".join([p for p in parts if p])
-
-def call_gemini(prompt, language):
-    if not GEMINI_AVAILABLE: return {"reply": "Gemini not configured.", "usage": {"tokens": 0}}
-    
+    rendered = lambda recs: (lambda budget: render_records(recs, budget)[0] if recs else no_match)
+
+    # Sections with a priority may be shrunk (lowest first) to fit prompt_token_budget
+    prompt = Prompt([
+        Section("core", "CORE INSTRUCTIONS: ", INTERNAL_CORE_INSTRUCTIONS),
+        Section("clients", "CLIENT DATABASE: ", clients_json or no_match, priority=40, floor=100, render=rendered(clients)),
+        Section("appointments", "APPOINTMENT DATA: ", appts_json or no_match, priority=30, floor=100, render=rendered(appointments)),
+        Section("system", "ADDITIONAL CONTEXT: ", system, priority=50) if system else None,
+        Section("rules", "", CORE_RULES),
+        Section("knowledge_base", "KNOWLEDGE BASE:\n", full_context, priority=20, floor=200),
+        Section("history", "CONVERSATION HISTORY:\n", history, priority=10, keep="tail"),
+        Section("query", "USER QUERY: ", user_query),
+        Section("response", "", "ASSISTANT RESPONSE:"),
+    ], budget=int(config.get("prompt_token_budget", 6000)) or None)
+    if prompt.truncated:
+        log(f"Prompt over budget ({prompt.budget} tokens), trimmed {prompt.truncated}")
+    return prompt
+
+def build_prompt(user_query, language, context, sector, records=None):
+    return compose_prompt(user_query, language, context, sector, records).text
+
+# ─── Context Caching ─────────────────────────────────────────────────
+# Instructions, system prompt and the whole knowledge base form a stable
+# prefix that Gemini can hold as cached content; each request then sends only
+# its records, history and query. Only knowledge bases that fit in
+# context_cache_max_tokens are cached whole; larger ones (crawled sites) keep
+# the plain top-k retrieval prompt, which is also the fallback on errors.
+
+CONTEXT_PREFIX_SECTIONS = ("core", "system", "rules", "knowledge_base")
+def context_prefix(config):
+    version = config_version(config)
+    memo = current_tenant().slot("context_prefix")
+    if memo.get("version") != version:
+        system = config.get('system_prompt', '')
+        memo["prefix"] = Prompt([
+            Section("core", "CORE INSTRUCTIONS: ", INTERNAL_CORE_INSTRUCTIONS),
+            Section("system", "ADDITIONAL CONTEXT: ", system) if system else None,
+            Section("rules", "", CORE_RULES),
+            Section("knowledge_base", "KNOWLEDGE BASE:\n", config.get("knowledge_base", "")),
+        ]).text
+        memo["tokens"] = estimate_tokens(memo["prefix"])
+        memo["version"] = version
+    return memo["prefix"]
+
+def context_cache_parts(composed, config):
+    # Extra GEMINI.generate/stream arguments; empty when caching is off or the prefix is too small or too large
+    ttl = int(config.get("context_cache_ttl", 3600))
+    if not (GEMINI_AVAILABLE and ttl): return {}
+    prefix = context_prefix(config)
+    tokens = current_tenant().slot("context_prefix")["tokens"]
+    if not int(config.get("context_cache_min_tokens", 1024)) <= tokens <= int(config.get("context_cache_max_tokens", 4096)): return {}
+    suffix = "\n\n".join(s.text for s in composed.sections if s.name not in CONTEXT_PREFIX_SECTIONS and s.text)
+    return {"prefix": prefix, "suffix": suffix, "context_ttl": ttl}
+
+def refresh_context_cache(old_config, new_config):
+    # After a settings change: drop the stale cached prefix and build the new one off the request path
+    old_version = prompt_config_hash(old_config)
+    if not GEMINI_AVAILABLE or prompt_config_hash(new_config) == old_version: return
+    old_model = old_config.get("model", "gemini-3-flash-preview")
+    memo = current_tenant().slot("context_prefix")
+    old_prefix = memo.get("prefix") if memo.get("version") == old_version else None
+    tenant = current_tenant()
+    def run():
+        with TENANTS.use(tenant):
+            if old_prefix: GEMINI.drop_context(old_model, old_prefix)
+            parts = context_cache_parts(Prompt([]), new_config)
+            if parts: GEMINI.context_model(*_model_settings(), parts["prefix"], parts["context_ttl"])
+    threading.Thread(target=run, daemon=True).start()
+
+def _model_settings():
     config = load_config()
-    temperature = float(config.get("temperature", 0.7))
-    model_name = config.get("model", "gemini-3-flash-preview")
+    return config.get("model", "gemini-3-flash-preview"), float(config.get("temperature", 0.7))
+
+def gemini_usage(metadata):
+    usage = {"total_tokens": metadata.total_token_count}
+    cached = getattr(metadata, "cached_content_token_count", 0)
+    if cached: usage["cached_tokens"] = cached
+    return usage
+
+def call_gemini(prompt, language, **cache_parts):
+    if not GEMINI_AVAILABLE: return {"reply": "Gemini not configured.", "usage": {"tokens": 0}}
 
     try:
-        model = genai.GenerativeModel(
-            model_name,
-            generation_config=genai.types.GenerationConfig(temperature=temperature)
-        )
-        response = model.generate_content(prompt)
+        with TRACER.span("gemini"): response = GEMINI.generate(prompt, *_model_settings(), **cache_parts)
         text = response.text
-        usage = {"total_tokens": response.usage_metadata.total_token_count} if response.usage_metadata else {}
+        usage = gemini_usage(response.usage_metadata) if response.usage_metadata else {}
         return {"reply": text, "usage": usage}
+    except GeminiBusy as e: return {"reply": str(e), "usage": {"tokens": 0}, "error": "busy"}
     except Exception as e: return {"reply": f"Gemini Error: {str(e)}", "usage": {"tokens": 0}}
 
+def stream_gemini(prompt, language, result, **cache_parts):
+    # Yields text deltas as Gemini produces them; fills `result` once the stream ends
+    if not GEMINI_AVAILABLE:
+        result.update({"reply": "Gemini not configured.", "usage": {"tokens": 0}})
+        yield result["reply"]
+        return
+    parts, usage = [], {}
+    try:
+        # Covers time to the last chunk, including time the client takes to read earlier ones
+        with TRACER.span("gemini"):
+            for chunk in GEMINI.stream(prompt, *_model_settings(), **cache_parts):
+                text = chunk.text if chunk.parts else ""
+                if text:
+                    parts.append(text)
+                    yield text
+                if chunk.usage_metadata: usage = gemini_usage(chunk.usage_metadata)
+        result.update({"reply": "".join(parts), "usage": usage})
+    except Exception as e:
+        error = f"Gemini Error: {str(e)}"
+        result.update({"reply": "".join(parts) or error, "usage": {"tokens": 0}})
+        if not parts: yield error
+
+# ─── Metrics ─────────────────────────────────────────────────────────
+
+@TRACER.metrics.collector
+def runtime_metrics():
+    yield "lucy_http_requests_in_flight", "gauge", "Requests currently being served", {}, TRACER.in_flight
+    for name, value in RESPONSE_CACHE.stats().items():
+        if name != "hit_rate": yield "lucy_response_cache", "gauge", "Response cache counters", {"stat": name}, value
+    if GEMINI:
+        for name, value in GEMINI.stats.items(): yield "lucy_gemini_events", "counter", "Gemini client events", {"event": name}, value
+    for name, value in TTS.cache.stats.items(): yield "lucy_tts_cache_events", "counter", "TTS audio cache events", {"event": name}, value
+    for name, value in ASR.stats.items(): yield "lucy_asr_events", "counter", "ASR requests and bytes", {"event": name}, value
+    yield "lucy_tenants_hot", "gauge", "Tenant contexts held in memory", {}, len(TENANTS.hot)
+    for name, value in TENANTS.stats.items(): yield "lucy_tenant_cache_events", "counter", "Tenant context cache events", {"event": name}, value
+
+def has_operator_token():
+    return bool(METRICS_TOKEN) and request.headers.get("Authorization") == f"Bearer {METRICS_TOKEN}"
+
+@app.route("/metrics")
+def metrics():
+    if METRICS_TOKEN and not has_operator_token(): return jsonify({"error": "Unauthorized"}), 401
+    return Response(TRACER.metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/profile", methods=["GET"])
+def get_profile():
+    # Stacks cover every tenant's requests, so only the operator token or an admin session may read them
+    if not (has_operator_token() or is_admin()): return jsonify({"error": "Unauthorized"}), 401
+    # Collapsed stacks ("route;module:function;... count") for flamegraph.pl / speedscope
+    profiler = TRACER.profiler
+    if not profiler: return jsonify({"error": "Profiler disabled (set PROFILER_INTERVAL_MS)"}), 404
+    body = profiler.collapsed(int(request.args["limit"]) if request.args.get("limit") else None)
+    if request.args.get("reset"): profiler.reset()
+    return Response(body, mimetype="text/plain")
+
 # ─── Static Routes ───────────────────────────────────────────────────
 
 @app.route("/favicon.ico")
@@ -274,27 +671,30 @@ def signup():
     data = request.json
     email, password = data.get("email"), data.get("password")
     if not email or not password: return jsonify({"error": "Missing"}), 400
-    users = load_users()
-    if email in users: return jsonify({"error": "Exists"}), 400
-    users[email] = {"password": generate_password_hash(password)}
-    save_users(users)
-    session['user'] = email
+    if STORE.get("users", email): return jsonify({"error": "Exists"}), 400
+    # Every new account gets its own tenant (config, API key and data)
+    tenant_id = create_tenant(data.get("company") or email, owner=email)
+    if not STORE.create("users", {"password": generate_password_hash(password), "tenant_id": tenant_id}, key=email):
+        STORE.delete("tenants", tenant_id)
+        return jsonify({"error": "Exists"}), 400
+    session['user'], session['tenant'] = email, tenant_id
     return jsonify({"status": "success"})
 
 @app.route("/api/login", methods=["POST"])
 def login():
     data = request.json
     email, password = data.get("email"), data.get("password")
-    users = load_users()
-    user = users.get(email)
+    user = STORE.get("users", email) if email else None
     if user and check_password_hash(user['password'], password):
-        session['user'] = email
+        # Accounts from before tenants were added stay on the default tenant
+        session['user'], session['tenant'] = email, user.get("tenant_id") or DEFAULT_TENANT
         return jsonify({"status": "success"})
     return jsonify({"error": "Invalid"}), 401
 
 @app.route("/logout")
 def logout():
     session.pop('user', None)
+    session.pop('tenant', None)
     return redirect(url_for('index'))
 
 # ─── Config Routes ───────────────────────────────────────────────────
@@ -315,27 +715,79 @@ def widget_config():
 @login_required
 def settings():
     if request.method == "POST":
-        current_config = load_config()
-        new_data = request.json
-        current_config.update(new_data)
+        tenant = current_tenant()
+        old_config = load_config()
+        current_config = dict(old_config)
+        current_config.update(request.json)
+        new_key = current_config.get("client_api_key")
+        if new_key != old_config.get("client_api_key"):
+            if not api_key_available(new_key, tenant.id): return jsonify({"error": "API key unavailable"}), 400
+            if tenant.id != DEFAULT_TENANT: TENANTS.set_api_key(tenant.id, new_key)
         save_config(current_config)
+        refresh_context_cache(old_config, current_config)
         return jsonify({"status": "updated"})
     return jsonify(load_config())
 
 @app.route("/api/activity", methods=["GET"])
 @login_required
 def get_activity():
-    return jsonify(USAGE_LOGS[-20:][::-1])
+    return jsonify(visible_usage_logs()[::-1][:20])
+
+@app.route("/api/usage", methods=["GET"])
+@login_required
+def get_usage():
+    # Per-key, per-day request/token totals for billing
+    totals = USAGE_METER.snapshot(visible_usage_scope())
+    key = request.args.get("key")
+    if key: totals = {key: totals.get(key, {})}
+    return jsonify(totals)
+
+def upload_path(filename):
+    # Unique per upload and per tenant: the job reads the file later, so a same-named upload must not replace it
+    base, ext = os.path.splitext(filename or "")
+    ext = secure_filename(ext)
+    name = f"{uuid.uuid4().hex}-{secure_filename(base) or 'upload'}" + (f".{ext}" if ext else "")
+    directory = os.path.join(app.config['UPLOAD_FOLDER'], current_tenant().id)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name)
+
+def job_accepted(job, **extra):
+    # An inline job (Vercel) has already finished: return it whole, as a poll would, since a
+    # poll may land on another instance that never saw it
+    if job.status in ("done", "failed"): return jsonify(dict(job.to_dict(), job_id=job.id, **extra))
+    return jsonify({"job_id": job.id, "status": job.status, **extra}), 202
 
 @app.route("/api/upload", methods=["POST"])
 @login_required
 def upload_file():
     file = request.files.get('file')
     if not file: return jsonify({"error": "No file"}), 400
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
+    filepath = upload_path(file.filename)
     file.save(filepath)
-    text = extract_text_from_file(filepath)
-    return jsonify({"filename": file.filename, "extracted_text": text})
+    filename = file.filename
+    pages = request.form.get("pages")
+
+    def run(job):
+        job.progress(total=1)
+        # Pages reach pollers (?since=N) as they are extracted, not only in the final result
+        try: text = extract_text_from_file(filepath, pages=pages, on_progress=lambda done, total: job.progress(done=done, total=total),
+                                           on_chunk=lambda chunk: job.progress(partial=chunk))
+        finally: os.remove(filepath)
+        return {"filename": filename, "extracted_text": text}
+
+    job = JOBS.submit("upload", run, owner=current_tenant().id)
+    return job_accepted(job, filename=filename)
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+@login_required
+def get_job(job_id):
+    # Pollers pass ?since=N to only receive partial output they haven't seen yet
+    try: since = int(request.args.get("since", 0))
+    except ValueError: return jsonify({"error": "since must be an integer"}), 400
+    if since < 0: return jsonify({"error": "since must not be negative"}), 400
+    job = JOBS.get(job_id, since=since)
+    if not job or (job.get("owner") or DEFAULT_TENANT) != current_tenant().id: return jsonify({"error": "Not found"}), 404
+    return jsonify(job)
 
 # ─── Support API ─────────────────────────────────────────────────────
 
@@ -345,36 +797,129 @@ def support():
     data = request.get_json() or {}
     user_query = data.get("user_query")
     language = data.get("language", "am")
-    context = data.get("context")
     sector = data.get("sector", "general")
     key = request.headers.get("X-API-KEY")
-    session_id = data.get("session_id", str(uuid.uuid4()))
+    session_id = data.get("session_id") or str(uuid.uuid4())
 
     if not user_query: return jsonify({"error": "query required"}), 400
-    
-    prompt = build_prompt(user_query, language, context, sector)
-    result = call_gemini(prompt, language)
-    
-    log_usage(key, "/api/support", {"query": user_query, "reply": result.get("reply"), "usage": result.get("usage")})
-    
+
+    started = time.monotonic()
+    with TRACER.span("load_config"): config = load_config()
+    with TRACER.span("session"):
+        sessions = get_session_memory(config)
+        # Older widgets still send their own transcript; everyone else gets the server-side session
+        context = data.get("context") or sessions.context(session_id)
+    with TRACER.span("match_records"): records = match_records(user_query, context, config)
+    # Personal lookups (a client ID or name was mentioned) are never served from cache
+    with TRACER.span("response_cache"):
+        cache_key = None if any(records) else response_cache_key(user_query, language, sector, context, config)
+        cached = RESPONSE_CACHE.get(cache_key) if cache_key else None
+    cache_status = "BYPASS" if cache_key is None else ("HIT" if cached else "MISS")
+
+    prompt_metrics = None
+    if cached:
+        stream = lambda result: replay_cached(cached, result)
+    else:
+        with TRACER.span("compose_prompt"):
+            composed = compose_prompt(user_query, language, context, sector, records)
+            prompt, prompt_metrics = composed.text, composed.metrics()
+            cache_parts = context_cache_parts(composed, config)
+        stream = lambda result: stream_gemini(prompt, language, result, **cache_parts)
+
+    def finish(result):
+        latency_ms = int((time.monotonic() - started) * 1000)
+        record_exchange(key, session_id, user_query, language, sector, result, latency_ms, prompt_metrics)
+        # Same success test as the response cache: error strings never enter the session
+        if result.get("cached") or result.get("usage", {}).get("total_tokens"):
+            try:
+                with TRACER.span("session_save"): sessions.record(session_id, user_query, result["reply"])
+            except Exception as e: log(f"Failed to update session {session_id}: {e}")
+        if cache_status == "MISS": cache_response(cache_key, result, config)
+
+    headers = {"X-Cache": cache_status, "X-Session-Id": session_id}
+    if data.get("stream") or "text/event-stream" in request.headers.get("Accept", ""):
+        return stream_support(stream, finish, headers)
+
+    result = {"reply": cached["reply"], "usage": {"total_tokens": 0}, "cached": True} if cached else call_gemini(prompt, language, **cache_parts)
+    if result.get("error") == "busy":
+        return jsonify(result), 503, {"Retry-After": "5"}
+    finish(result)
+    return jsonify(dict(result, session_id=session_id)), headers
+
+def sse(data, event=None):
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_support(stream, finish, headers=None):
+    def generate():
+        result, parts = {}, []
+        try:
+            for delta in stream(result):
+                parts.append(delta)
+                yield sse({"delta": delta})
+            yield sse(result, event="done")
+        finally:
+            # Log once the stream closes, including when the client disconnects early
+            if not result: result.update({"reply": "".join(parts), "usage": {}})
+            finish(result)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **(headers or {})}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+def record_exchange(key, session_id, user_query, language, sector, result, latency_ms=None, prompt_metrics=None):
+    log_usage(key, "/api/support", {"query": user_query, "reply": result.get("reply"), "usage": result.get("usage"), "cached": result.get("cached", False)})
+
     # Store conversation
+    trace = current_trace()
     try:
-        convos = load_conversations()
-        convos.append({
+        with TRACER.span("save_conversation"): append_conversation({
             "id": str(uuid.uuid4()),
+            "request_id": trace.request_id if trace else None,
             "session_id": session_id,
             "user_query": user_query,
             "bot_reply": result.get("reply", ""),
             "language": language,
             "sector": sector,
             "tokens": result.get("usage", {}).get("total_tokens", 0),
+            "latency_ms": latency_ms,
+            "prompt": prompt_metrics,
             "timestamp": datetime.now().isoformat()
         })
-        # Keep last 500 conversations
-        save_conversations(convos[-500:])
-    except: pass
-    
-    return jsonify(result)
+    except Exception as e: log(f"Failed to store conversation: {e}")
+
+# ─── Response Cache ──────────────────────────────────────────────────
+
+# Shared by all tenants; keys start with the tenant ID so entries never cross tenants
+RESPONSE_CACHE = TTLCache(maxsize=1000, ttl=3600)
+PROMPT_CONFIG_KEYS = ("system_prompt", "knowledge_base", "model", "temperature", "kb_chunk_size", "kb_top_k")
+
+def prompt_config_hash(config):
+    relevant = json.dumps({k: config.get(k) for k in PROMPT_CONFIG_KEYS}, sort_keys=True, default=str)
+    return hashlib.sha1(relevant.encode("utf-8")).hexdigest()[:16]
+
+def config_version(config):
+    store, memo = tenant_store(), current_tenant().slot("config_version")
+    sig = (id(store), store.version("config"))
+    if memo.get("sig") != sig:
+        memo["version"] = prompt_config_hash(config)
+        memo["sig"] = sig
+    return memo["version"]
+
+def normalize_query(text):
+    return " ".join(tokenize(text))
+
+def response_cache_key(user_query, language, sector, context, config):
+    history = normalize_query(context)
+    history_hash = hashlib.sha1(history.encode("utf-8")).hexdigest()[:16] if history else ""
+    return (current_tenant().id, normalize_query(user_query), language, sector, history_hash, config_version(config))
+
+def replay_cached(cached, result):
+    result.update({"reply": cached["reply"], "usage": {"total_tokens": 0}, "cached": True})
+    yield cached["reply"]
+
+def cache_response(cache_key, result, config):
+    # Only cache real completions, never error strings or truncated streams
+    if not result.get("usage", {}).get("total_tokens"): return
+    RESPONSE_CACHE.set(cache_key, {"reply": result["reply"]}, ttl=float(config.get("response_cache_ttl", 3600)))
 
 # ─── Clients CRUD ────────────────────────────────────────────────────
 
@@ -388,14 +933,7 @@ def get_clients():
 def create_client():
     data = request.json
     if not data or not data.get("name"): return jsonify({"error": "Name required"}), 400
-    clients = load_clients()
-    client_id = f"CLT{str(len(clients) + 1).zfill(3)}"
-    
-    # Ensure unique ID
-    while client_id in clients:
-        client_id = f"CLT{str(int(client_id[3:]) + 1).zfill(3)}"
-    
-    clients[client_id] = {
+    client_id = tenant_store().create("clients", {
         "name": data.get("name"),
         "email": data.get("email", ""),
         "phone": data.get("phone", ""),
@@ -403,27 +941,20 @@ def create_client():
         "status": data.get("status", "active"),
         "notes": data.get("notes", ""),
         "created_at": datetime.now().strftime("%Y-%m-%d")
-    }
-    save_clients(clients)
+    }, prefix="CLT")
     return jsonify({"status": "created", "id": client_id})
 
 @app.route("/api/clients/<client_id>", methods=["PUT"])
 @login_required
 def update_client(client_id):
     data = request.json
-    clients = load_clients()
-    if client_id not in clients: return jsonify({"error": "Not found"}), 404
-    clients[client_id].update(data)
-    save_clients(clients)
+    if not tenant_store().update("clients", client_id, data): return jsonify({"error": "Not found"}), 404
     return jsonify({"status": "updated"})
 
 @app.route("/api/clients/<client_id>", methods=["DELETE"])
 @login_required
 def delete_client(client_id):
-    clients = load_clients()
-    if client_id not in clients: return jsonify({"error": "Not found"}), 404
-    del clients[client_id]
-    save_clients(clients)
+    if tenant_store().delete("clients", client_id) is None: return jsonify({"error": "Not found"}), 404
     return jsonify({"status": "deleted"})
 
 # ─── Appointments CRUD ───────────────────────────────────────────────
@@ -438,13 +969,7 @@ def get_appointments():
 def create_appointment():
     data = request.json
     if not data or not data.get("name"): return jsonify({"error": "Name required"}), 400
-    appts = load_appointments()
-    appt_id = data.get("id") or f"APT{str(len(appts) + 1).zfill(3)}"
-    
-    while appt_id in appts:
-        appt_id = f"APT{str(int(appt_id[3:]) + 1).zfill(3)}"
-    
-    appts[appt_id] = {
+    appt_id = tenant_store().create("appointments", {
         "client_id": data.get("client_id", ""),
         "name": data.get("name"),
         "medications": data.get("medications", []),
@@ -453,27 +978,20 @@ def create_appointment():
         "status": data.get("status", "scheduled"),
         "notes": data.get("notes", ""),
         "created_at": datetime.now().strftime("%Y-%m-%d")
-    }
-    save_appointments(appts)
+    }, key=data.get("id"), prefix="APT")
     return jsonify({"status": "created", "id": appt_id})
 
 @app.route("/api/appointments/<appt_id>", methods=["PUT"])
 @login_required
 def update_appointment(appt_id):
     data = request.json
-    appts = load_appointments()
-    if appt_id not in appts: return jsonify({"error": "Not found"}), 404
-    appts[appt_id].update(data)
-    save_appointments(appts)
+    if not tenant_store().update("appointments", appt_id, data): return jsonify({"error": "Not found"}), 404
     return jsonify({"status": "updated"})
 
 @app.route("/api/appointments/<appt_id>", methods=["DELETE"])
 @login_required
 def delete_appointment(appt_id):
-    appts = load_appointments()
-    if appt_id not in appts: return jsonify({"error": "Not found"}), 404
-    del appts[appt_id]
-    save_appointments(appts)
+    if tenant_store().delete("appointments", appt_id) is None: return jsonify({"error": "Not found"}), 404
     return jsonify({"status": "deleted"})
 
 # ─── Conversations ───────────────────────────────────────────────────
@@ -481,51 +999,54 @@ def delete_appointment(appt_id):
 @app.route("/api/conversations", methods=["GET"])
 @login_required
 def get_conversations():
-    convos = load_conversations()
-    search = request.args.get("search", "").lower()
-    if search:
-        convos = [c for c in convos if search in c.get("user_query","").lower() or search in c.get("bot_reply","").lower()]
-    # Return most recent first
-    return jsonify(convos[::-1][:100])
+    args = request.args
+    try: limit, offset = min(int(args.get("limit", 100)), 500), int(args.get("offset", 0))
+    except ValueError: return jsonify({"error": "limit and offset must be integers"}), 400
+    if limit < 0 or offset < 0: return jsonify({"error": "limit and offset must not be negative"}), 400
+    criteria = {k: args.get(k) for k in ("session_id", "language", "sector", "since", "until") if args.get(k)}
+    log = get_conversation_log()
+    if not (args.get("search") or "cursor" in args or criteria):
+        # Most recent first, paged straight off the log's offset index (pass cursor= to get X-Next-Cursor)
+        return jsonify(log.tail(limit, skip=offset))
+    try:
+        records, next_cursor = current_tenant().conversation_index.page(log, limit=limit, cursor=args.get("cursor"), offset=offset,
+                                                       query=args.get("search", ""), **criteria)
+    except ValueError as e: return jsonify({"error": str(e)}), 400
+    response = jsonify(records)
+    if next_cursor: response.headers["X-Next-Cursor"] = next_cursor
+    return response
 
 # ─── Analytics ───────────────────────────────────────────────────────
 
 @app.route("/api/analytics", methods=["GET"])
 @login_required
 def get_analytics():
-    clients = load_clients()
-    appts = load_appointments()
-    convos = load_conversations()
-    
-    total_tokens = sum(c.get("tokens", 0) for c in convos)
-    active_clients = sum(1 for c in clients.values() if c.get("status") == "active")
-    scheduled_appts = sum(1 for a in appts.values() if a.get("status") == "scheduled")
-    completed_appts = sum(1 for a in appts.values() if a.get("status") == "completed")
-    
-    # Conversations per day (last 7 days)
-    from collections import Counter
-    daily = Counter()
-    for c in convos:
-        ts = c.get("timestamp", "")
-        if ts:
-            day = ts[:10]
-            daily[day] += 1
-    
+    tenant = current_tenant()
+    analytics, store = tenant.analytics, tenant.store
+    analytics.sync_records(analytics.clients, load_clients, lambda: store.version("clients"))
+    analytics.sync_records(analytics.appointments, load_appointments, lambda: store.version("appointments"))
+    analytics.catch_up(get_conversation_log())
+    snapshot = analytics.snapshot()
+
     return jsonify({
-        "total_clients": len(clients),
-        "active_clients": active_clients,
-        "total_appointments": len(appts),
-        "scheduled_appointments": scheduled_appts,
-        "completed_appointments": completed_appts,
-        "total_conversations": len(convos),
-        "total_tokens": total_tokens,
-        "conversations_per_day": dict(sorted(daily.items())[-7:]),
-        "usage_logs_count": len(USAGE_LOGS)
+        **snapshot,
+        "usage_logs_count": len(visible_usage_logs()),
+        "usage": USAGE_METER.summary(scope=visible_usage_scope()),
+        "data_cache": dict(store.stats, backend=store.backend),
+        "response_cache": RESPONSE_CACHE.stats(),
+        "gemini": dict(GEMINI.stats) if GEMINI else {}
     })
 
 # ─── Website Scanning ────────────────────────────────────────────────
 
-from urllib.parse import urljoin, urlparse
+def make_crawler():
+    config = load_config()
+    return Crawler(
+        max_workers=int(config.get("crawl_workers", 8)),
+        per_host=int(config.get("crawl_per_host", 4)),
+        time_budget=float(config.get("crawl_time_budget", 60)),
+        cache=PAGE_CACHE,
+    )
 
 @app.route("/api/scan-site", methods=["POST"])
 @login_required
@@ -533,40 +1054,15 @@ def scan_site():
     data = request.json
     start_url = data.get("url")
     if not start_url: return jsonify({"error": "URL required"}), 400
-    
-    if not start_url.startswith(("http://", "https://")):
-        start_url = "https://" + start_url
-        
-    domain = urlparse(start_url).netloc
-    
+
     try:
-        sess = requests.Session()
-        sess.verify = False
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Connection": "keep-alive"
-        }
-        
-        response = sess.get(start_url, headers=headers, timeout=15)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        links = set()
-        links.add(start_url)
-        
-        for a in soup.find_all('a', href=True):
-            href = a['href']
-            full_url = urljoin(start_url, href)
-            parsed = urlparse(full_url)
-            
-            if parsed.netloc == domain and parsed.scheme in ['http', 'https']:
-                if not any(ext in parsed.path.lower() for ext in ['.jpg', '.png', '.pdf', '.zip']):
-                    links.add(full_url)
-        
-        sorted_links = sorted(list(links))[:20]
-        return jsonify({"links": sorted_links})
+        links, errors = make_crawler().discover(
+            start_url,
+            max_depth=int(data.get("depth", 1)),
+            max_pages=min(int(data.get("max_pages", 100)), 500),
+        )
+        if not links or (len(links) == 1 and errors): raise Exception(errors[0] if errors else "No pages found")
+        return jsonify({"links": links, "errors": errors})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -577,58 +1073,31 @@ def scrape_pages():
     data = request.json
     urls = data.get("urls", [])
     if not urls: return jsonify({"error": "No URLs provided"}), 400
-    
-    combined_text = ""
-    sess = requests.Session()
-    # sess.verify = False # Using verify=True is safer, but if user targets self-signed sites, keep False
-    sess.verify = False
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5"
-    }
-
-    success_count = 0
-    errors = []
-    
-    for url in urls:
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
-            
-        try:
-            print(f"Scraping: {url}")
-            resp = sess.get(url, headers=headers, timeout=15)
-            resp.raise_for_status()
-            
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            
-            for el in soup(["script", "style", "nav", "footer", "header", "noscript", "iframe", "svg"]):
-                el.extract()
-            
-            content = soup.find('main') or soup.find('article') or soup.find('div', class_='content') or soup.body
-            if not content: raise Exception("No content found")
-            
-            text = content.get_text(separator='\n')
-            
-            clean_lines = [line.strip() for line in text.splitlines() if line.strip()]
-            if clean_lines:
-                combined_text += f"\n\n--- Source: {url} ---\n"
-                combined_text += "\n".join(clean_lines)
-                success_count += 1
-            else:
-                raise Exception("Empty content after cleaning")
-                
-        except Exception as e:
-            print(f"Error scraping {url}: {str(e)}")
-            errors.append(f"{url}: {str(e)}")
-            continue
-            
-    if success_count == 0:
-        return jsonify({"error": "Failed to scrape any pages", "details": errors}), 500
-        
-    return jsonify({"text": combined_text, "count": success_count, "errors": errors})
+
+    crawler = make_crawler()
+    job = JOBS.submit("scrape", lambda job: run_scrape(job, crawler, urls), owner=current_tenant().id)
+    return job_accepted(job)
+
+def run_scrape(job, crawler, urls):
+    pages, errors = {}, []
+    job.progress(total=len(urls))
+    for url, text, error in crawler.fetch_pages(urls):
+        if error:
+            log(f"Error scraping {url}: {error}")
+            errors.append(f"{url}: {error}")
+            job.progress(done=len(pages) + len(errors), error=f"{url}: {error}")
+        else:
+            pages[url] = text
+            job.progress(done=len(pages) + len(errors), partial={"url": url, "text": text, "changed": url not in crawler.unchanged})
+
+    if not pages:
+        raise Exception("Failed to scrape any pages")
+
+    # Keep the caller's ordering so the knowledge base reads predictably
+    order = {canonicalize(normalize_url(u)): i for i, u in enumerate(urls)}
+    combined_text = "".join(f"\n\n--- Source: {url} ---\n{pages[url]}" for url in sorted(pages, key=lambda u: order.get(u, 0)))
+    unchanged = sum(1 for url in pages if url in crawler.unchanged)
+    return {"text": combined_text, "count": len(pages), "changed": len(pages) - unchanged, "unchanged": unchanged, "errors": errors}
 
 @app.route("/api/fetch-url", methods=["POST"])
 @login_required
@@ -639,42 +1108,48 @@ def fetch_url():
 
 @app.route("/api/asr", methods=["POST"])
 def asr():
-    if not HF_API_TOKEN: return jsonify({"error": "HF Token missing"}), 500
-    audio_data = request.data
-    lang = request.args.get("lang", "amh")
-    
-    API_URL = "https://api-inference.huggingface.co/models/facebook/mms-1b-all"
-    headers = {"Authorization": f"Bearer {HF_API_TOKEN}"}
-    
+    lang = request.args.get("lang", "am")
+    if (request.content_length or 0) > ASR.max_bytes:
+        return jsonify({"error": f"Audio exceeds {ASR.max_bytes // 1024} KB"}), 413
     try:
-        response = requests.post(API_URL, headers=headers, data=audio_data)
-        return jsonify(response.json())
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        # Read from the socket in chunks rather than buffering request.data
+        upload = read_limited(request.stream, ASR.max_bytes)
+        with upload, TRACER.span("asr"): result = ASR.transcribe(lang, upload, request.mimetype, load_config().get("asr_models"))
+        return jsonify(result)
+    except PayloadTooLarge as e: return jsonify({"error": str(e)}), 413
+    except Exception as e: return jsonify({"error": str(e)}), 502
 
 @app.route("/api/tts", methods=["POST"])
 def tts():
-    if not HF_API_TOKEN: return jsonify({"error": "HF Token missing"}), 500
-    data = request.json
+    data = request.json or {}
     text = data.get("text")
-    lang = data.get("lang", "amh")
-    
-    model_map = {
-        "am": "facebook/mms-tts-amh",
-        "om": "facebook/mms-tts-orm",
-        "ti": "facebook/mms-tts-tir",
-        "so": "facebook/mms-tts-som"
-    }
-    model = model_map.get(lang, "facebook/mms-tts-amh")
-    
-    API_URL = f"https://api-inference.huggingface.co/models/{model}"
-    headers = {"Authorization": f"Bearer {HF_API_TOKEN}"}
-    
+    lang = data.get("lang", "am")
+    if not text: return jsonify({"error": "text required"}), 400
+
+    if data.get("chunked"):
+        # Sentence URLs to play in order; synthesis of all of them starts now
+        model = TTS.model(lang)
+        sentences = TTS.sentences(text)
+        for sentence in sentences: TTS.submit(model, sentence)
+        return jsonify({"chunks": [{"text": s, "url": f"/api/tts/chunk?{urlencode({'lang': lang, 'text': s})}"} for s in sentences]})
+
     try:
-        response = requests.post(API_URL, headers=headers, json={"inputs": text})
-        return (response.content, 200, {'Content-Type': 'audio/wav'})
+        with TRACER.span("tts"): audio = TTS.speak(lang, text)
+        return (audio, 200, {'Content-Type': audio_type(audio) or 'audio/wav'})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": str(e)}), 502
+
+@app.route("/api/tts/chunk", methods=["GET"])
+def tts_chunk():
+    text = request.args.get("text", "")
+    if not text: return jsonify({"error": "text required"}), 400
+    model = TTS.model(request.args.get("lang", "am"))
+    try:
+        with TRACER.span("tts"): audio = TTS.synthesize(model, text)
+    except Exception as e: return jsonify({"error": str(e)}), 502
+    # Content-addressed, so browsers and CDNs may keep it
+    return (audio, 200, {'Content-Type': audio_type(audio) or 'audio/wav', 'Cache-Control': 'public, max-age=86400',
+                         'ETag': TTS.cache.key(model, text)})
 
 # ─── Page Routes ─────────────────────────────────────────────────────
 
@@ -699,9 +1174,10 @@ def index(): return render_template("index.html")
 
 @app.errorhandler(Exception)
 def handle_exception(e):
-    print(f"ERROR: {str(e)}")
+    log(f"ERROR: {str(e)}")
     print(traceback.format_exc())
-    return jsonify({"error": str(e)}), 500
+    trace = current_trace()
+    return jsonify({"error": str(e), "request_id": trace.request_id if trace else None}), 500
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)), debug=True)
\ No newline at end of file
@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import app as lucy
+from gemini_client import GeminiClient
+from retrieval import estimate_tokens
+from speech import AudioCache, SpeechToText, StubSpeech, TextToSpeech
+
+# ─── Offline Benchmark ───────────────────────────────────────────────
+# Drives the real Flask app in-process against fake Gemini and Hugging Face
+# upstreams with configurable latency, at several data sizes, and reports
+# throughput, latency percentiles per route and the prompt sizes Gemini would
+# have received. Prompt size should stay flat as records grow; thresholds turn
+# regressions (e.g. the whole database in the prompt) into a non-zero exit.
+#
+#   python bench.py --scales 10,1000,100000 --requests 500 --concurrency 32
+
+FIRST_NAMES = ["Abebe", "Chala", "Muna", "Selam", "Dawit", "Hana", "Yonas", "Fatuma", "Tesfaye", "Liya"]
+LAST_NAMES = ["Balcha", "Guteta", "Ahmed", "Bekele", "Tadesse", "Haile", "Mohammed", "Girma", "Alemu", "Kebede"]
+SERVICES = ["Healthcare - Diabetes Management", "Healthcare - Respiratory Care", "Passport Renewal", "Tax Filing"]
+FAQS = ["What are your opening hours?", "How do I renew my passport?", "Where is your office?",
+        "ቀጠሮ እንዴት እይዛለሁ?", "What documents do I need?", "Do you work on Saturday?"]
+
+# Route mix: name -> weight
+MIX = {"support_faq": 40, "support_lookup": 20, "clients_list": 3, "client_create": 5, "client_update": 5,
+       "appointments_list": 2, "conversations_search": 10, "analytics": 10, "tts": 5}
+
+class FakeModel:
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+
+    def generate_content(self, prompt, request_options=None, stream=False):
+        tokens = estimate_tokens(prompt)
+        self.backend.record(tokens)
+        time.sleep(self.backend.delay())
+        usage = SimpleNamespace(total_token_count=tokens + 40, cached_content_token_count=0)
+        response = SimpleNamespace(text="Thank you for contacting us. " * 4, parts=[True], usage_metadata=usage)
+        return iter([response]) if stream else response
+
+class FakeGenai:
+    # Just enough of google.generativeai for GeminiClient; no caching module, so prompts are sent whole
+    def __init__(self, latency=0.5, jitter=0.3):
+        self.latency = latency
+        self.jitter = jitter
+        self.prompt_tokens = []
+        self.lock = threading.Lock()
+        self.GenerativeModel = lambda name, generation_config=None: FakeModel(self, name)
+        self.types = SimpleNamespace(GenerationConfig=lambda temperature: None)
+
+    def delay(self):
+        return max(0.0, random.gauss(self.latency, self.latency * self.jitter))
+
+    def record(self, tokens):
+        with self.lock: self.prompt_tokens.append(tokens)
+
+def person(i):
+    return f"{FIRST_NAMES[i % 10]} {LAST_NAMES[(i // 10) % 10]} {i}"
+
+def seed(records):
+    clients = {f"CLT{str(i).zfill(3)}": {"name": person(i), "email": f"user{i}@example.com", "phone": f"+2519{i:08d}",
+                                         "service": SERVICES[i % 4], "status": "active", "notes": "Prefers Amharic.",
+                                         "created_at": "2026-01-01"} for i in range(1, records + 1)}
+    appointments = {f"APT{str(i).zfill(3)}": {"client_id": f"CLT{str(i).zfill(3)}", "name": person(i), "medications": [],
+                                              "appointment": f"2026-03-{i % 28 + 1:02d} 10:00 AM", "service_type": SERVICES[i % 4],
+                                              "status": "scheduled", "notes": "", "created_at": "2026-01-01"}
+                    for i in range(1, records + 1)}
+    # At least a few hundred lines so even the smallest scale fills the retrieval budget
+    knowledge = "\n".join(f"Service {i}: {SERVICES[i % 4]} is available at branch {i % 50} from 8:30 to 17:00."
+                          for i in range(max(records, 500)))
+    lucy.STORE.save("clients", clients)
+    lucy.STORE.save("appointments", appointments)
+    lucy.save_config(dict(lucy.DEFAULT_CONFIG, client_api_key="bench-key", knowledge_base=knowledge))
+
+def setup(workdir, records, backend="json", latency=0.5, speech_latency=0.2):
+    # Same isolation as the test fixtures: every file and singleton points into workdir
+    for name, attr in [("clients.json", "CLIENTS_FILE"), ("appointments.json", "APPOINTMENTS_FILE"),
+                       ("conversations.json", "CONVERSATIONS_FILE"), ("bot_config.json", "BOT_CONFIG_FILE"),
+                       ("users.json", "USERS_FILE"), ("sessions.json", "SESSIONS_FILE"), ("lucy.db", "DATABASE_FILE"),
+                       ("tenants.json", "TENANTS_FILE"), ("tenants", "TENANTS_DIR")]:
+        setattr(lucy, attr, os.path.join(workdir, name))
+    lucy.CONVERSATION_LOG_DIR = os.path.join(workdir, "conversation_log")
+    lucy.RESPONSE_CACHE = lucy.TTLCache()
+    lucy.RATE_LIMITER = lucy.make_rate_limiter("memory", limit=10 ** 9)
+    lucy.USAGE_METER = lucy.UsageMeter(os.path.join(workdir, "usage_totals.json"))
+    lucy.ANALYTICS = lucy.Analytics()
+    lucy.CONVERSATION_INDEX = lucy.ConversationIndex()
+    lucy.STORE = lucy.make_store(backend)
+    lucy.TENANTS = lucy.make_tenants()
+    genai = FakeGenai(latency)
+    lucy.GEMINI_AVAILABLE = True
+    lucy.GEMINI = GeminiClient(genai, max_in_flight=lucy.GEMINI_MAX_IN_FLIGHT, timeout=lucy.GEMINI_TIMEOUT)
+    speech = StubSpeech(latency=speech_latency)
+    lucy.ASR = SpeechToText(speech)
+    lucy.TTS = TextToSpeech(speech, AudioCache(os.path.join(workdir, "tts_cache")))
+    seed(records)
+    return genai
+
+def make_client():
+    lucy.app.config["TESTING"] = True
+    client = lucy.app.test_client()
+    with client.session_transaction() as sess: sess["user"] = "bench@example.com"
+    return client
+
+def request(client, route, records, rng):
+    headers = {"X-API-KEY": "bench-key"}
+    i = rng.randint(1, records)
+    if route == "support_faq":
+        return client.post("/api/support", headers=headers, json={"user_query": rng.choice(FAQS), "session_id": f"s{rng.randint(1, 50)}"})
+    if route == "support_lookup":
+        query = f"My name is {person(i)} and my ID is CLT{str(i).zfill(3)}. When is my appointment?"
+        return client.post("/api/support", headers=headers, json={"user_query": query})
+    if route == "clients_list": return client.get("/api/clients")
+    if route == "client_create": return client.post("/api/clients", json={"name": person(records + i)})
+    if route == "client_update": return client.put(f"/api/clients/CLT{str(i).zfill(3)}", json={"notes": "Called back."})
+    if route == "appointments_list": return client.get("/api/appointments")
+    if route == "conversations_search": return client.get(f"/api/conversations?search={rng.choice(['appointment', 'passport', 'ቀጠሮ'])}&limit=20")
+    if route == "analytics": return client.get("/api/analytics")
+    if route == "tts": return client.post("/api/tts", json={"text": rng.choice(FAQS), "lang": "am"})
+    raise ValueError(route)
+
+def percentile(values, p):
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+
+def run(records, requests=200, concurrency=16, latency=0.5, speech_latency=0.2, backend="json", seed_value=1):
+    with tempfile.TemporaryDirectory() as workdir:
+        genai = setup(workdir, records, backend, latency, speech_latency)
+        routes = [route for route, weight in MIX.items() for _ in range(weight)]
+        rng = random.Random(seed_value)
+        plan = [rng.choice(routes) for _ in range(requests)]
+
+        # Warm up: first request builds the knowledge-base and record indexes
+        warm_started = time.perf_counter()
+        request(make_client(), "support_faq", records, random.Random(0))
+        warmup_ms = (time.perf_counter() - warm_started) * 1000
+        genai.prompt_tokens.clear()
+
+        local = threading.local()
+        def one(job):
+            index, route = job
+            if not hasattr(local, "client"): local.client = make_client()
+            started = time.perf_counter()
+            response = request(local.client, route, records, random.Random(seed_value * 100003 + index))
+            return route, response.status_code, (time.perf_counter() - started) * 1000, response.headers.get("X-Cache")
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, enumerate(plan)))
+        elapsed = time.perf_counter() - started
+        lucy.USAGE_METER.flush()
+
+    by_route = defaultdict(list)
+    errors = defaultdict(int)
+    cache = defaultdict(int)
+    for route, status, ms, cache_status in results:
+        by_route[route].append(ms)
+        if status >= 400: errors[route] += 1
+        if cache_status: cache[cache_status] += 1
+    prompts = genai.prompt_tokens
+    return {
+        "records": records,
+        "requests": len(results),
+        "concurrency": concurrency,
+        "throughput_rps": round(len(results) / elapsed, 1),
+        "warmup_ms": round(warmup_ms, 1),
+        "routes": {route: {"count": len(ms), "errors": errors[route], "p50_ms": round(percentile(ms, 50), 1),
+                           "p95_ms": round(percentile(ms, 95), 1), "p99_ms": round(percentile(ms, 99), 1)}
+                   for route, ms in sorted(by_route.items())},
+        "prompt_tokens": {"count": len(prompts), "avg": round(sum(prompts) / len(prompts), 1) if prompts else 0,
+                          "max": max(prompts, default=0)},
+        "support_cache": dict(cache),
+    }
+
+def report(result, out=sys.stdout):
+    prompt = result["prompt_tokens"]
+    out.write(f"\n== {result['records']} records: {result['throughput_rps']} req/s over {result['requests']} requests "
+              f"(concurrency {result['concurrency']}, warm-up {result['warmup_ms']} ms)\n")
+    out.write(f"   prompt tokens avg {prompt['avg']} max {prompt['max']} ({prompt['count']} Gemini calls), "
+              f"support cache {result['support_cache']}\n")
+    out.write(f"   {'route':<22}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}\n")
+    for route, s in result["routes"].items():
+        out.write(f"   {route:<22}{s['count']:>7}{s['errors']:>8}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}\n")
+
+def check(results, max_prompt_tokens=None, max_prompt_growth=None, max_p95_ms=None):
+    # Regression gates; returns a list of failures
+    failures = []
+    for r in results:
+        if max_prompt_tokens and r["prompt_tokens"]["max"] > max_prompt_tokens:
+            failures.append(f"{r['records']} records: prompt max {r['prompt_tokens']['max']} > {max_prompt_tokens} tokens")
+        for route, s in r["routes"].items():
+            if s["errors"]: failures.append(f"{r['records']} records: {s['errors']} errors on {route}")
+            if max_p95_ms and route.startswith("support") and s["p95_ms"] > max_p95_ms:
+                failures.append(f"{r['records']} records: {route} p95 {s['p95_ms']} ms > {max_p95_ms} ms")
+    if max_prompt_growth and len(results) > 1 and results[0]["prompt_tokens"]["avg"]:
+        growth = results[-1]["prompt_tokens"]["avg"] / results[0]["prompt_tokens"]["avg"]
+        if growth > max_prompt_growth:
+            failures.append(f"prompt grew {growth:.1f}x from {results[0]['records']} to {results[-1]['records']} records")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline Lucy AI load test with fake Gemini/HF upstreams")
+    parser.add_argument("--scales", default="10,1000,100000", help="comma-separated record counts")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean fake Gemini latency (s)")
+    parser.add_argument("--speech-latency", type=float, default=0.2, help="fake HF ASR/TTS latency (s)")
+    parser.add_argument("--backend", default="json", choices=["json", "sqlite"])
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--max-prompt-tokens", type=int)
+    parser.add_argument("--max-prompt-growth", type=float, default=1.5, help="largest/smallest scale avg prompt ratio")
+    parser.add_argument("--max-p95-ms", type=float)
+    args = parser.parse_args(argv)
+
+    results = []
+    for records in [int(n) for n in args.scales.split(",") if n.strip()]:
+        results.append(run(records, args.requests, args.concurrency, args.latency, args.speech_latency, args.backend))
+        report(results[-1])
+    if args.json:
+        with open(args.json, "w") as f: json.dump(results, f, indent=2)
+    failures = check(results, args.max_prompt_tokens, args.max_prompt_growth, args.max_p95_ms)
+    for failure in failures: print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+import time
+import threading
+from collections import OrderedDict
+
+# ─── LRU + TTL Cache ─────────────────────────────────────────────────
+
+class TTLCache:
+    def __init__(self, maxsize=1000, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None: del self.data[key]
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0: return
+        with self.lock:
+            self.data[key] = (time.monotonic() + ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self.lock: self.data.clear()
+
+    def __len__(self): return len(self.data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self.data), "max_size": self.maxsize, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": round(self.hits / total, 3) if total else 0.0}
@@ -0,0 +1,33 @@
+import pytest
+import app as lucy
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    for name, attr in [("clients.json", "CLIENTS_FILE"), ("appointments.json", "APPOINTMENTS_FILE"),
+                       ("conversations.json", "CONVERSATIONS_FILE"), ("bot_config.json", "BOT_CONFIG_FILE"),
+                       ("users.json", "USERS_FILE"), ("sessions.json", "SESSIONS_FILE"), ("lucy.db", "DATABASE_FILE"),
+                       ("tenants.json", "TENANTS_FILE"), ("tenants", "TENANTS_DIR")]:
+        monkeypatch.setattr(lucy, attr, str(tmp_path / name))
+    monkeypatch.setattr(lucy, "CONVERSATION_LOG_DIR", str(tmp_path / "conversation_log"))
+    monkeypatch.setattr(lucy, "RESPONSE_CACHE", lucy.TTLCache())
+    monkeypatch.setattr(lucy, "RATE_LIMITER", lucy.make_rate_limiter("memory"))
+    monkeypatch.setattr(lucy, "USAGE_METER", lucy.UsageMeter(str(tmp_path / "usage_totals.json")))
+    monkeypatch.setattr(lucy, "ANALYTICS", lucy.Analytics())
+    monkeypatch.setattr(lucy, "CONVERSATION_INDEX", lucy.ConversationIndex())
+    monkeypatch.setattr(lucy, "STORE", lucy.make_store("json"))
+    monkeypatch.setattr(lucy, "JOBS", lucy.JobQueue(str(tmp_path / "jobs")))
+    monkeypatch.setattr(lucy, "PAGE_CACHE", lucy.PageCache(str(tmp_path / "page_cache.json")))
+    monkeypatch.setattr(lucy, "EXTRACTOR", lucy.DocumentExtractor(str(tmp_path / "extract_cache"), workers=1))
+    monkeypatch.setattr(lucy, "TENANTS", lucy.make_tenants())
+    return tmp_path
+
+@pytest.fixture
+def client(data_dir):
+    lucy.app.config["TESTING"] = True
+    (data_dir / "bot_config.json").write_text('{"client_api_key": "test-key", "knowledge_base": "Lucy AI helps."}')
+    return lucy.app.test_client()
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as sess: sess["user"] = "admin@example.com"
+    return client
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: fall back to the in-process lock only
+    fcntl = None
+
+OFFSET = struct.Struct("<Q")
+
+# ─── Append-only Conversation Log ────────────────────────────────────
+# Records are appended as JSON lines to numbered segment files. Each segment
+# has a sidecar .idx of packed byte offsets so the tail can be paged without
+# scanning, and retention drops whole segments instead of rewriting anything.
+
+class ConversationLog:
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024, max_bytes=None, max_age_days=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, seg, ext): return os.path.join(self.directory, f"{seg:06d}.{ext}")
+
+    def segments(self):
+        return sorted(int(n[:-6]) for n in os.listdir(self.directory) if n.endswith(".jsonl") and n[:-6].isdigit())
+
+    def _offsets(self, seg, start=0, stop=None):
+        try:
+            with open(self._path(seg, "idx"), "rb") as f:
+                f.seek(start * OFFSET.size)
+                raw = f.read(-1 if stop is None else (stop - start) * OFFSET.size)
+        except OSError: return []
+        return [OFFSET.unpack_from(raw, i)[0] for i in range(0, len(raw) - len(raw) % OFFSET.size, OFFSET.size)]
+
+    def _count(self, seg):
+        try: return os.path.getsize(self._path(seg, "idx")) // OFFSET.size
+        except OSError: return 0
+
+    def _locked(self, f):
+        if fcntl: fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def append(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self.lock:
+            segs = self.segments()
+            seg = segs[-1] if segs else 1
+            if segs and os.path.getsize(self._path(seg, "jsonl")) >= self.segment_bytes:
+                seg += 1
+            with open(self._path(seg, "jsonl"), "ab") as data, open(self._path(seg, "idx"), "ab") as idx:
+                self._locked(data)
+                data.seek(0, os.SEEK_END)
+                offset = data.tell()
+                data.write(line)
+                data.flush()
+                idx.write(OFFSET.pack(offset))
+            if seg not in segs: self.enforce_retention()
+
+    def count(self):
+        return sum(self._count(seg) for seg in self.segments())
+
+    def _read_at(self, seg, offsets):
+        # One record per offset, None where a line is unreadable
+        out = []
+        with open(self._path(seg, "jsonl"), "rb") as f:
+            for off in offsets:
+                f.seek(off)
+                try: out.append(json.loads(f.readline()))
+                except ValueError: out.append(None)
+        return out
+
+    def _read(self, seg, offsets):
+        return [r for r in self._read_at(seg, offsets) if r is not None]
+
+    def tail(self, limit=100, skip=0):
+        # Newest first, reading only the segments that cover the requested window
+        out = []
+        for seg in reversed(self.segments()):
+            n = self._count(seg)
+            if skip >= n:
+                skip -= n
+                continue
+            stop = n - skip
+            offsets = self._offsets(seg, max(0, stop - (limit - len(out))), stop)
+            out.extend(reversed(self._read(seg, offsets)))
+            skip = 0
+            if len(out) >= limit: break
+        return out
+
+    def entries_from(self, position=(0, 0)):
+        # (position, record) pairs appended after `position` (segment, record number) plus the new position
+        seg0, n0 = position
+        out, pos = [], position
+        for seg in self.segments():
+            if seg < seg0: continue
+            start = n0 if seg == seg0 else 0
+            offsets = self._offsets(seg, start)
+            for i, record in enumerate(self._read_at(seg, offsets)):
+                if record is not None: out.append(((seg, start + i), record))
+            pos = (seg, start + len(offsets))
+        return out, pos
+
+    def first_position(self):
+        # Oldest position still on disk (None when empty); everything before it was dropped by retention
+        segs = self.segments()
+        return (segs[0], 0) if segs else None
+
+    def read_from(self, position=(0, 0)):
+        entries, pos = self.entries_from(position)
+        return [r for _, r in entries], pos
+
+    def get(self, positions):
+        # Records at the given (segment, record number) positions; None where retention dropped them
+        out = []
+        for seg, n in positions:
+            offsets = self._offsets(seg, n, n + 1)
+            try: out.append(self._read_at(seg, offsets)[0] if offsets else None)
+            except OSError: out.append(None)
+        return out
+
+    def __iter__(self):
+        for seg in self.segments():
+            yield from self._read(seg, self._offsets(seg))
+
+    def enforce_retention(self):
+        segs = self.segments()[:-1]  # never drop the active segment
+        if self.max_age_days:
+            cutoff = time.time() - self.max_age_days * 86400
+            for seg in list(segs):
+                if os.path.getmtime(self._path(seg, "jsonl")) < cutoff:
+                    self._drop(seg)
+                    segs.remove(seg)
+        if self.max_bytes:
+            total = sum(os.path.getsize(self._path(s, "jsonl")) for s in self.segments())
+            for seg in segs:
+                if total <= self.max_bytes: break
+                total -= os.path.getsize(self._path(seg, "jsonl"))
+                self._drop(seg)
+
+    def _drop(self, seg):
+        for ext in ("jsonl", "idx"):
+            try: os.remove(self._path(seg, ext))
+            except OSError: pass
+
+    def import_records(self, records):
+        for r in records: self.append(r)
@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urljoin, urlparse, urlunparse, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+import requests
+from bs4 import BeautifulSoup
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5"
+}
+SKIP_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.svg', '.pdf', '.zip', '.mp3', '.mp4', '.css', '.js')
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid")
+
+def normalize_url(url):
+    if not url.startswith(('http://', 'https://')): url = 'https://' + url
+    return url
+
+def canonicalize(url):
+    p = urlparse(url)
+    host = (p.hostname or "").lower()
+    if p.port and not ((p.scheme == "http" and p.port == 80) or (p.scheme == "https" and p.port == 443)):
+        host = f"{host}:{p.port}"
+    path = p.path or "/"
+    if path != "/" and path.endswith("/"): path = path.rstrip("/")
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(p.query) if not k.lower().startswith(TRACKING_PARAMS)))
+    return urlunparse((p.scheme.lower(), host, path, "", query, ""))
+
+def extract_page_text(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    for el in soup(["script", "style", "nav", "footer", "header", "noscript", "iframe", "svg"]):
+        el.extract()
+    content = soup.find('main') or soup.find('article') or soup.find('div', class_='content') or soup.body
+    if not content: raise Exception("No content found")
+    clean_lines = [line.strip() for line in content.get_text(separator='\n').splitlines() if line.strip()]
+    if not clean_lines: raise Exception("Empty content after cleaning")
+    return "\n".join(clean_lines)
+
+def extract_links(html, base_url, domain):
+    links = []
+    for a in BeautifulSoup(html, 'html.parser').find_all('a', href=True):
+        parsed = urlparse(urljoin(base_url, a['href']))
+        if parsed.netloc == domain and parsed.scheme in ['http', 'https']:
+            if not parsed.path.lower().endswith(SKIP_EXTENSIONS):
+                links.append(canonicalize(parsed.geturl()))
+    return links
+
+# ─── Page Cache ──────────────────────────────────────────────────────
+# Validators (ETag / Last-Modified), a body hash and the extracted text per
+# canonical URL, so re-crawls send conditional requests and skip parsing pages
+# that haven't changed. Losing an entry to a concurrent save only costs a refetch.
+
+class PageCache:
+    def __init__(self, path, max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.dirty = False
+        try:
+            with open(path, 'r', encoding='utf-8') as f: self.entries = json.load(f)
+        except (OSError, ValueError): self.entries = {}
+
+    def get(self, url):
+        with self.lock: return self.entries.get(url)
+
+    def put(self, url, entry):
+        with self.lock:
+            self.entries[url] = entry
+            self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty: return
+            if len(self.entries) > self.max_entries:
+                keep = sorted(self.entries, key=lambda u: self.entries[u].get("fetched_at", 0))[-self.max_entries:]
+                self.entries = {u: self.entries[u] for u in keep}
+            snapshot, self.dirty = dict(self.entries), False
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f: json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e: print(f"Lucy AI: Failed to persist page cache: {e}")
+
+# ─── Concurrent Crawler ──────────────────────────────────────────────
+# Bounded thread pool with a per-host connection cap, a total time budget and
+# canonical-URL dedup. Work that doesn't finish inside the budget is reported
+# as timed out instead of holding the request open.
+
+class Crawler:
+    def __init__(self, max_workers=8, per_host=4, timeout=15, time_budget=60, verify=False, cache=None):
+        self.cache = cache
+        self.unchanged = set()
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.time_budget = time_budget
+        self.verify = verify
+        self.local = threading.local()
+        self.host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self.lock = threading.Lock()
+
+    def _session(self):
+        if not hasattr(self.local, "session"):
+            sess = requests.Session()
+            sess.verify = self.verify
+            sess.headers.update(HEADERS)
+            self.local.session = sess
+        return self.local.session
+
+    def get(self, url, timeout=None, **kwargs):
+        host = urlparse(url).netloc
+        with self.lock: slot = self.host_slots[host]
+        with slot:
+            resp = self._session().get(url, timeout=timeout or self.timeout, **kwargs)
+        return resp
+
+    def _timeout(self, deadline):
+        # Per-request timeout capped by what is left of the budget (None once it is spent)
+        remaining = deadline - time.monotonic() if deadline else self.timeout
+        return min(self.timeout, remaining) if remaining > 0 else None
+
+    def _run(self, tasks, submit_more=None, deadline=None):
+        # Runs (key, fn) tasks, yielding (key, result, error) as each completes
+        deadline = deadline or time.monotonic() + self.time_budget
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        pending = {pool.submit(fn): key for key, fn in tasks}
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    key = pending.pop(fut)
+                    try: result, error = fut.result(), None
+                    except Exception as e: result, error = None, e
+                    yield key, result, error
+                    for k, fn in (submit_more(key, result) if submit_more and result is not None else []):
+                        pending[pool.submit(fn)] = k
+            for key in pending.values():
+                yield key, None, TimeoutError("crawl time budget exceeded")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def robots(self, start_url, deadline=None):
+        p = urlparse(start_url)
+        parser = RobotFileParser()
+        sitemaps = []
+        try:
+            timeout = self._timeout(deadline)
+            if timeout is None: raise TimeoutError("crawl time budget exceeded")
+            resp = self.get(f"{p.scheme}://{p.netloc}/robots.txt", timeout=timeout)
+            if resp.ok:
+                lines = resp.text.splitlines()
+                parser.parse(lines)
+                sitemaps = [l.split(":", 1)[1].strip() for l in lines if l.lower().startswith("sitemap:")]
+            else: parser.parse([])
+        except Exception: parser.parse([])
+        return parser, sitemaps or [f"{p.scheme}://{p.netloc}/sitemap.xml"]
+
+    def sitemap_urls(self, sitemaps, domain, limit, deadline=None):
+        # Nested sitemap indexes are followed only while the time budget lasts
+        urls, queue, seen = [], list(sitemaps), set()
+        while queue and len(urls) < limit:
+            timeout = self._timeout(deadline)
+            if timeout is None: break
+            sm = queue.pop(0)
+            if sm in seen: continue
+            seen.add(sm)
+            try:
+                resp = self.get(sm, timeout=timeout)
+                if not resp.ok: continue
+                root = ET.fromstring(resp.content)
+            except Exception: continue
+            for loc in root.iter():
+                if not loc.tag.endswith("loc") or not loc.text: continue
+                url = loc.text.strip()
+                if root.tag.endswith("sitemapindex"): queue.append(url)
+                elif urlparse(url).netloc == domain: urls.append(canonicalize(url))
+        return urls[:limit]
+
+    def discover(self, start_url, max_depth=1, max_pages=100):
+        # Breadth-first link discovery seeded from sitemap.xml, honouring robots.txt
+        start_url = canonicalize(normalize_url(start_url))
+        domain = urlparse(start_url).netloc
+        # One budget for the whole discovery, robots.txt and sitemaps included
+        deadline = time.monotonic() + self.time_budget
+        robots, sitemaps = self.robots(start_url, deadline)
+        allowed = lambda u: robots.can_fetch(HEADERS["User-Agent"], u)
+        found = {start_url: 0}
+        for url in self.sitemap_urls(sitemaps, domain, max_pages, deadline):
+            if len(found) < max_pages and allowed(url): found.setdefault(url, 1)
+
+        def fetch_links(url):
+            resp = self.get(url)
+            resp.raise_for_status()
+            return extract_links(resp.text, url, domain)
+
+        def expand(url, links):
+            depth = found[url] + 1
+            new = []
+            for link in links:
+                if len(found) >= max_pages: break
+                if link not in found and allowed(link):
+                    found[link] = depth
+                    if depth < max_depth: new.append((link, lambda l=link: fetch_links(l)))
+            return new
+
+        seeds = [(u, lambda u=u: fetch_links(u)) for u, d in found.items() if d < max_depth or u == start_url]
+        errors = []
+        for url, _, error in self._run(seeds, submit_more=expand, deadline=deadline):
+            if error: errors.append(f"{url}: {error}")
+        return sorted(found, key=lambda u: (found[u], u)), errors
+
+    def fetch_page(self, url):
+        # Conditional GET against the page cache; unchanged pages reuse their cached text
+        entry = self.cache.get(url) if self.cache else None
+        headers = {}
+        if entry and entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+        resp = self.get(url, headers=headers) if headers else self.get(url)
+        if entry and resp.status_code == 304:
+            text, digest = entry["text"], entry["hash"]
+        else:
+            resp.raise_for_status()
+            digest = hashlib.sha256(resp.content).hexdigest()
+            text = entry["text"] if entry and entry.get("hash") == digest else extract_page_text(resp.text)
+        if entry and entry.get("hash") == digest:
+            with self.lock: self.unchanged.add(url)
+        if self.cache:
+            self.cache.put(url, {
+                "etag": resp.headers.get("ETag") or (entry or {}).get("etag"),
+                "last_modified": resp.headers.get("Last-Modified") or (entry or {}).get("last_modified"),
+                "hash": digest, "text": text, "fetched_at": time.time(),
+            })
+        return text
+
+    def fetch_pages(self, urls):
+        # Yields (url, text, error) for each page as soon as it's done
+        unique = list(dict.fromkeys(canonicalize(normalize_url(u)) for u in urls))
+        try:
+            for url, text, error in self._run([(u, lambda u=u: self.fetch_page(u)) for u in unique]):
+                yield url, text, error
+        finally:
+            if self.cache: self.cache.save()
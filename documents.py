@@ -0,0 +1,119 @@
+import os
+import re
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pypdf
+
+TEXT_EXTENSIONS = ('.txt', '.md', '.csv')
+PAGE_RANGE_RE = re.compile(r"^\s*(\d+)\s*(?:-\s*(\d*)\s*)?$")
+
+def parse_page_range(spec, page_count):
+    # "1-5,8,20-" -> sorted 0-based page indexes; empty spec means every page
+    if not spec or not str(spec).strip(): return list(range(page_count))
+    pages = set()
+    for part in str(spec).split(","):
+        m = PAGE_RANGE_RE.match(part)
+        if not m: raise ValueError(f"Invalid page range: {part.strip()}")
+        start = int(m.group(1))
+        end = start if m.group(2) is None else (int(m.group(2)) if m.group(2) else page_count)
+        if start < 1 or end < start: raise ValueError(f"Invalid page range: {part.strip()}")
+        pages.update(range(start - 1, min(end, page_count)))
+    return sorted(pages)
+
+def file_hash(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""): h.update(block)
+    return h.hexdigest()
+
+def _extract_pages(path, indexes):
+    # Runs in a worker process: each worker opens its own reader
+    reader = pypdf.PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in indexes]
+
+# ─── Document Extraction ─────────────────────────────────────────────
+# Page-by-page text extraction. Large PDFs are split into page batches across a
+# process pool (pypdf is pure Python, so threads don't help), results stream
+# back in page order, and finished extractions are cached by file hash.
+
+class DocumentExtractor:
+    def __init__(self, cache_dir, workers=2, parallel_min_pages=40, batch_pages=16, max_cached=200):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.parallel_min_pages = parallel_min_pages
+        self.batch_pages = batch_pages
+        self.max_cached = max_cached
+        self.pool = None
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _pool(self):
+        # Spawned rather than forked: forking a threaded Flask worker isn't safe
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self.pool
+
+    def _cache_path(self, digest, pages):
+        key = hashlib.sha1(f"{digest}:{pages or ''}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.txt")
+
+    def pdf_pages(self, path, indexes, reader=None):
+        # Yields (page_number, text) in page order
+        if self.workers > 1 and len(indexes) >= self.parallel_min_pages:
+            batches = [indexes[i:i + self.batch_pages] for i in range(0, len(indexes), self.batch_pages)]
+            futures = [self._pool().submit(_extract_pages, path, batch) for batch in batches]
+            for batch, fut in zip(batches, futures):
+                for i, text in zip(batch, fut.result()): yield i + 1, text
+        else:
+            reader = reader or pypdf.PdfReader(path)
+            for i in indexes: yield i + 1, reader.pages[i].extract_text() or ""
+
+    def iter_chunks(self, path, pages=None, on_progress=None):
+        # Yields text chunks (one per PDF page, or the whole text file) and caches the result
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in ('.pdf',) + TEXT_EXTENSIONS: return
+        cache_path = self._cache_path(file_hash(path), pages if ext == '.pdf' else None)
+        if os.path.exists(cache_path):
+            os.utime(cache_path)
+            with open(cache_path, 'r', encoding='utf-8') as f: text = f.read()
+            if on_progress: on_progress(1, 1)
+            if text: yield text
+            return
+
+        # Only a complete extraction is cached
+        tmp = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as out:
+                if ext == '.pdf':
+                    reader = pypdf.PdfReader(path)
+                    indexes = parse_page_range(pages, len(reader.pages))
+                    for n, (_, text) in enumerate(self.pdf_pages(path, indexes, reader), 1):
+                        chunk = text + "\n"
+                        out.write(chunk)
+                        if on_progress: on_progress(n, len(indexes))
+                        yield chunk
+                else:
+                    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                        for chunk in iter(lambda: f.read(1 << 16), ""):
+                            out.write(chunk)
+                            yield chunk
+                    if on_progress: on_progress(1, 1)
+            os.replace(tmp, cache_path)
+        except BaseException:
+            try: os.remove(tmp)
+            except OSError: pass
+            raise
+        self._evict()
+
+    def extract(self, path, pages=None, on_progress=None):
+        return "".join(self.iter_chunks(path, pages, on_progress)).strip()
+
+    def _evict(self):
+        cached = [os.path.join(self.cache_dir, n) for n in os.listdir(self.cache_dir) if n.endswith(".txt")]
+        cached.sort(key=os.path.getmtime)
+        for p in cached[:max(0, len(cached) - self.max_cached)]:
+            try: os.remove(p)
+            except OSError: pass
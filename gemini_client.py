@@ -0,0 +1,172 @@
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from tracing import log
+
+try:
+    from google.api_core import exceptions as gexc
+    TRANSIENT_ERRORS = (gexc.ServiceUnavailable, gexc.TooManyRequests, gexc.ResourceExhausted,
+                        gexc.DeadlineExceeded, gexc.InternalServerError, gexc.BadGateway, gexc.GatewayTimeout)
+except ImportError:
+    TRANSIENT_ERRORS = ()
+TRANSIENT_ERRORS += (TimeoutError, ConnectionError)
+
+class GeminiBusy(Exception):
+    pass
+
+# ─── Pooled Gemini Client ────────────────────────────────────────────
+# Model objects are reused per (model, temperature); every call is bounded by
+# a deadline, transient failures are retried with jittered backoff, and a
+# semaphore caps in-flight requests so an upstream slowdown can't tie up
+# every worker thread.
+
+class GeminiClient:
+    def __init__(self, genai, max_in_flight=8, timeout=30.0, retries=2, backoff=0.5, queue_timeout=5.0,
+                 max_contexts=8, context_retry_after=600):
+        self.genai = genai
+        self.contexts = OrderedDict()
+        self.max_contexts = max_contexts
+        self.context_retry_after = context_retry_after
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.models = {}
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "retries": 0, "timeouts": 0, "rejected": 0, "errors": 0,
+                      "context_hits": 0, "context_created": 0, "context_fallbacks": 0}
+
+    def model(self, name, temperature):
+        key = (name, float(temperature))
+        with self.lock:
+            if key not in self.models:
+                self.models[key] = self.genai.GenerativeModel(
+                    name, generation_config=self.genai.types.GenerationConfig(temperature=float(temperature)))
+            return self.models[key]
+
+    # ─── Context caching ───
+    # A stable prompt prefix (instructions + knowledge base) is uploaded once as
+    # Gemini cached content and reused until it expires, so only the per-request
+    # suffix is sent and billed at the full rate. The display name is a hash of
+    # model + prefix, so other workers reuse the same cache and a settings change
+    # naturally produces a new one. Any failure falls back to the plain prompt.
+
+    def context_key(self, model_name, prefix):
+        return hashlib.sha256(f"{model_name}\n{prefix}".encode("utf-8")).hexdigest()[:40]
+
+    def context_model(self, model_name, temperature, prefix, ttl):
+        key = self.context_key(model_name, prefix)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.contexts.get(key)
+            if entry and entry["state"] == "ready" and entry["expires"] > now:
+                self.contexts.move_to_end(key)
+                temp = float(temperature)
+                if temp not in entry["models"]:
+                    entry["models"][temp] = self.genai.GenerativeModel.from_cached_content(
+                        cached_content=entry["content"], generation_config=self.genai.types.GenerationConfig(temperature=temp))
+                self.stats["context_hits"] += 1
+                return entry["models"][temp]
+            # Someone else is creating it, or creation failed recently: use the plain prompt for now
+            if entry and entry["expires"] > now: return None
+            self.contexts[key] = {"state": "creating", "expires": now + self.context_retry_after}
+        try:
+            content = self._find_context(key, ttl) or self.genai.caching.CachedContent.create(
+                model=model_name, display_name=key, system_instruction=prefix, ttl=timedelta(seconds=ttl))
+        except Exception as e:
+            log(f"Context cache unavailable, sending full prompts: {e}")
+            return None
+        with self.lock:
+            # Trust the server's expiry (a found cache may be half spent) and refresh up to a minute
+            # early so a request never lands on an expired cache
+            left = (content.expire_time - datetime.now(timezone.utc)).total_seconds()
+            self.contexts[key] = {"state": "ready", "content": content, "models": {}, "expires": now + left - min(60, left / 2)}
+            self.stats["context_created"] += 1
+            # Only the local handle is dropped: the remote cache may serve other tenants' or workers'
+            # requests and expires on its own TTL, and _find_context picks it up again if needed
+            while len(self.contexts) > self.max_contexts: self.contexts.popitem(last=False)
+        return self.context_model(model_name, temperature, prefix, ttl)
+
+    def _find_context(self, key, ttl):
+        # Reuse a cache another worker already created for the same prefix
+        soon = datetime.now(timezone.utc) + timedelta(seconds=min(120, ttl / 2))
+        for content in self.genai.caching.CachedContent.list():
+            if content.display_name == key and content.expire_time > soon: return content
+        return None
+
+    def _delete_context(self, entry):
+        try:
+            if entry.get("content") is not None: entry["content"].delete()
+        except Exception as e: log(f"Failed to delete cached context: {e}")
+
+    def drop_context(self, model_name, prefix):
+        with self.lock: entry = self.contexts.pop(self.context_key(model_name, prefix), None)
+        if entry: self._delete_context(entry)
+
+    def _resolve(self, prompt, model_name, temperature, prefix, suffix, context_ttl):
+        # (model, prompt, prefix) to send: the cached-context model with just the suffix when possible
+        if prefix and suffix is not None and context_ttl:
+            model = self.context_model(model_name, temperature, prefix, context_ttl)
+            if model is not None: return model, suffix, prefix
+        return self.model(model_name, temperature), prompt, None
+
+    def _acquire(self):
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            self.stats["rejected"] += 1
+            raise GeminiBusy("Too many concurrent Gemini requests, try again shortly")
+
+    def _call(self, model, prompt, deadline, **kwargs):
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.stats["timeouts"] += 1
+                raise TimeoutError("Gemini request exceeded its deadline")
+            try:
+                return model.generate_content(prompt, request_options={"timeout": remaining}, **kwargs)
+            except TRANSIENT_ERRORS:
+                if attempt >= self.retries: raise
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                if time.monotonic() + delay >= deadline: raise
+                self.stats["retries"] += 1
+                attempt += 1
+                time.sleep(delay)
+
+    def _call_with_fallback(self, prompt, model_name, temperature, prefix, suffix, context_ttl, deadline, **kwargs):
+        model, text, cached = self._resolve(prompt, model_name, temperature, prefix, suffix, context_ttl)
+        try: return self._call(model, text, deadline, **kwargs)
+        except TRANSIENT_ERRORS: raise
+        except Exception as e:
+            if not cached: raise
+            # Cache deleted or rejected upstream: forget it and send the plain prompt once
+            log(f"Cached context failed ({e}), retrying with the full prompt")
+            self.stats["context_fallbacks"] += 1
+            self.drop_context(model_name, cached)
+            return self._call(self.model(model_name, temperature), prompt, deadline, **kwargs)
+
+    def generate(self, prompt, model_name, temperature, prefix=None, suffix=None, context_ttl=0, **kwargs):
+        self._acquire()
+        self.stats["calls"] += 1
+        try: return self._call_with_fallback(prompt, model_name, temperature, prefix, suffix, context_ttl,
+                                             time.monotonic() + self.timeout, **kwargs)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally: self.slots.release()
+
+    def stream(self, prompt, model_name, temperature, prefix=None, suffix=None, context_ttl=0, **kwargs):
+        # Holds a slot for the life of the stream; retries only happen before the first chunk
+        self._acquire()
+        self.stats["calls"] += 1
+        try:
+            for chunk in self._call_with_fallback(prompt, model_name, temperature, prefix, suffix, context_ttl,
+                                                  time.monotonic() + self.timeout, stream=True, **kwargs):
+                yield chunk
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally: self.slots.release()
@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import time
+import uuid
+import itertools
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+def worker_pool(workers, name):
+    # Under gevent (serve.py --async) patched threads are greenlets on the one hub
+    # thread, so CPU-bound work (pypdf, BeautifulSoup, BM25) would stall every
+    # request; gevent's native threadpool keeps it on real OS threads instead.
+    monkey = sys.modules.get("gevent.monkey")
+    if monkey and monkey.is_module_patched("threading"):
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+        return NativeThreadPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+# ─── Background Jobs ─────────────────────────────────────────────────
+# Long-running ingestion (scraping, document extraction) runs on a small
+# worker pool. Job state is mirrored to disk so a poll that lands on another
+# worker process can still report progress. With inline=True (serverless
+# hosts, where nothing runs after the response and /tmp is per instance) a
+# job runs to completion inside submit() instead.
+
+class Job:
+    def __init__(self, kind, job_id=None, owner=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.status = "queued"
+        self.done = 0
+        self.total = 0
+        self.partial = []
+        self.errors = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.on_change = None
+
+    def progress(self, done=None, total=None, partial=None, error=None):
+        if done is not None: self.done = done
+        if total is not None: self.total = total
+        if partial is not None: self.partial.append(partial)
+        if error is not None: self.errors.append(error)
+        self.touch()
+
+    def touch(self):
+        self.updated_at = time.time()
+        if self.on_change: self.on_change(self)
+
+    def to_dict(self, since=0):
+        return {"id": self.id, "kind": self.kind, "owner": self.owner, "status": self.status,
+                "progress": {"done": self.done, "total": self.total},
+                "partial": self.partial[since:], "errors": self.errors, "result": self.result, "error": self.error,
+                "created_at": self.created_at, "updated_at": self.updated_at}
+
+class JobQueue:
+    def __init__(self, directory, workers=2, keep=200, persist_every=1.0, inline=False):
+        self.directory = directory
+        self.inline = inline
+        self.pool = worker_pool(workers, "lucy-job")
+        self.jobs = OrderedDict()
+        self.keep = keep
+        self.persist_every = persist_every
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id): return os.path.join(self.directory, f"{job_id}.json")
+
+    def _partial_path(self, job_id): return os.path.join(self.directory, f"{job_id}.partial.jsonl")
+
+    def _persist(self, job, force=False):
+        if not force and time.time() - getattr(job, "_persisted_at", 0) < self.persist_every: return
+        job._persisted_at = time.time()
+        # Partial output is appended to a side file, so each write costs only what is new; the
+        # state file records how many lines of it are complete
+        count, flushed = len(job.partial), getattr(job, "_flushed", 0)
+        tmp = self._path(job.id) + ".tmp"
+        try:
+            if count > flushed:
+                with open(self._partial_path(job.id), 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(p) + "\n" for p in job.partial[flushed:count])
+                job._flushed = count
+            with open(tmp, 'w', encoding='utf-8') as f: json.dump(dict(job.to_dict(since=count), partial_count=count), f)
+            os.replace(tmp, self._path(job.id))
+        except OSError as e: print(f"Lucy AI: Failed to persist job {job.id}: {e}")
+
+    def submit(self, kind, fn, owner=None):
+        job = Job(kind, owner=owner)
+        job.on_change = self._persist
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.keep:
+                old_id, _ = self.jobs.popitem(last=False)
+                for path in (self._path(old_id), self._partial_path(old_id)):
+                    try: os.remove(path)
+                    except OSError: pass
+        self._persist(job, force=True)
+        if self.inline: self._run(job, fn)
+        else: self.pool.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        job.status = "running"
+        job.touch()
+        try:
+            job.result = fn(job)
+            job.status = "done"
+        except Exception as e:
+            print(f"Lucy AI: Job {job.id} failed: {e}")
+            print(traceback.format_exc())
+            job.status, job.error = "failed", str(e)
+        job.updated_at = time.time()
+        self._persist(job, force=True)
+
+    def get(self, job_id, since=0):
+        # Partial output from index `since` on
+        with self.lock: job = self.jobs.get(job_id)
+        if job: return job.to_dict(since)
+        # Submitted by another worker process
+        if not all(c.isalnum() for c in job_id): return None
+        try:
+            with open(self._path(job_id), 'r', encoding='utf-8') as f: state = json.load(f)
+            count, state["partial"] = state.pop("partial_count", 0), []
+            if count > since:
+                with open(self._partial_path(job_id), 'r', encoding='utf-8') as f:
+                    state["partial"] = [json.loads(line) for line in itertools.islice(f, since, count)]
+            return state
+        except (OSError, ValueError): return None
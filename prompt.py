@@ -0,0 +1,68 @@
+from retrieval import estimate_tokens
+
+def fit_lines(text, budget, keep="head"):
+    # Whole lines from the start (or end) of text that fit in budget tokens
+    lines = (text or "").splitlines()
+    out, used = [], 0
+    for line in (lines if keep == "head" else reversed(lines)):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget: break
+        out.append(line)
+        used += cost
+    if not out and lines:
+        return lines[0][:budget * 4] if keep == "head" else lines[-1][-budget * 4:]
+    return "\n".join(out if keep == "head" else reversed(out))
+
+# ─── Prompt Budgeting ────────────────────────────────────────────────
+# A prompt is a list of labelled sections. Sections with a priority can be
+# shrunk (lowest priority first, never below their floor) when the estimated
+# total exceeds the budget; sections without one are always sent whole. Every
+# prompt reports per-section token estimates so we can see where tokens go.
+
+class Section:
+    def __init__(self, name, label, body, priority=None, floor=0, keep="head", render=None):
+        self.name = name
+        self.label = label
+        self.body = body or ""
+        self.priority = priority
+        self.floor = floor
+        self.keep = keep
+        self.render = render  # render(budget_tokens) -> body; defaults to trimming whole lines
+
+    @property
+    def text(self): return f"{self.label}{self.body}"
+
+    def shrink(self, target):
+        budget = max(0, target - estimate_tokens(self.label))
+        self.body = self.render(budget) if self.render else fit_lines(self.body, budget, self.keep)
+
+class Prompt:
+    def __init__(self, sections, budget=None):
+        self.sections = [s for s in sections if s is not None]
+        self.budget = budget
+        self.truncated = {}
+        if budget: self._fit(budget)
+
+    def _fit(self, budget):
+        over = self.total_tokens - budget
+        for s in sorted((s for s in self.sections if s.priority is not None), key=lambda s: s.priority):
+            if over <= 0: break
+            before = estimate_tokens(s.text)
+            target = max(s.floor, before - over)
+            if target >= before: continue
+            s.shrink(target)
+            saved = before - estimate_tokens(s.text)
+            if saved > 0:
+                self.truncated[s.name] = saved
+                over -= saved
+
+    @property
+    def text(self): return "\n\n".join(s.text for s in self.sections if s.text)
+
+    @property
+    def total_tokens(self): return estimate_tokens(self.text)
+
+    def metrics(self):
+        return {"total": self.total_tokens, "budget": self.budget,
+                "sections": {s.name: estimate_tokens(s.text) for s in self.sections},
+                "truncated": dict(self.truncated)}
@@ -0,0 +1,102 @@
+import time
+import sqlite3
+import threading
+
+# ─── Sliding-Window Rate Limiter ─────────────────────────────────────
+# Sliding-window counter: each key keeps only the current and previous fixed
+# window counts, and the previous one is weighted by how much of it still
+# overlaps the sliding window. O(1) memory and O(1) work per check.
+
+class MemoryBackend:
+    def __init__(self, evict_every=1000):
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.evict_every = evict_every
+        self.ops = 0
+
+    def acquire(self, key, window_id, prev_weight, limit):
+        with self.lock:
+            win, cur, prev = self.counters.get(key, (window_id, 0, 0))
+            if win != window_id:
+                prev = cur if win == window_id - 1 else 0
+                win, cur = window_id, 0
+            allowed = prev * prev_weight + cur < limit
+            if allowed: cur += 1
+            self.counters[key] = (win, cur, prev)
+            self.ops += 1
+            if self.ops % self.evict_every == 0: self._evict(window_id)
+            return allowed, cur, prev
+
+    def _evict(self, window_id):
+        # Keys idle for two windows carry no weight any more
+        for key in [k for k, (win, _, _) in self.counters.items() if win < window_id - 1]:
+            del self.counters[key]
+
+class SQLiteBackend:
+    # Shared by every worker process pointing at the same file
+    def __init__(self, path, evict_every=1000):
+        self.path = path
+        self.local = threading.local()
+        self.evict_every = evict_every
+        self.ops = 0
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, win INTEGER, cur INTEGER, prev INTEGER)")
+
+    def _conn(self):
+        if not hasattr(self.local, "conn"):
+            self.local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self.local.conn.execute("PRAGMA journal_mode=WAL")
+        return self.local.conn
+
+    def acquire(self, key, window_id, prev_weight, limit):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT win, cur, prev FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            win, cur, prev = row or (window_id, 0, 0)
+            if win != window_id:
+                prev = cur if win == window_id - 1 else 0
+                win, cur = window_id, 0
+            allowed = prev * prev_weight + cur < limit
+            if allowed: cur += 1
+            conn.execute("INSERT OR REPLACE INTO rate_limits (key, win, cur, prev) VALUES (?, ?, ?, ?)", (key, win, cur, prev))
+            self.ops += 1
+            if self.ops % self.evict_every == 0:
+                conn.execute("DELETE FROM rate_limits WHERE win < ?", (window_id - 1,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, cur, prev
+
+class RateLimiter:
+    def __init__(self, backend, limit=100, window=3600):
+        self.backend = backend
+        self.limit = limit
+        self.window = window
+
+    def check(self, key, now=None):
+        now = time.time() if now is None else now
+        window_id = int(now // self.window)
+        elapsed = now - window_id * self.window
+        prev_weight = 1 - elapsed / self.window
+        allowed, cur, prev = self.backend.acquire(key, window_id, prev_weight, self.limit)
+        used = prev * prev_weight + cur
+        reset = int(self.window - elapsed) + 1
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(max(0, int(self.limit - used))),
+            "X-RateLimit-Reset": str(reset),
+        }
+        if not allowed: headers["Retry-After"] = str(self._retry_after(cur, prev, elapsed))
+        return allowed, headers
+
+    def _retry_after(self, cur, prev, elapsed):
+        # Seconds until enough of the previous window has slid out to admit one more request
+        if cur >= self.limit or not prev: return int(self.window - elapsed) + 1
+        needed = (prev * (1 - elapsed / self.window) + cur - self.limit + 1) / prev * self.window
+        return max(1, int(needed) + 1)
+
+def make_rate_limiter(backend="memory", limit=100, window=3600, path="rate_limits.db"):
+    store = SQLiteBackend(path) if backend == "sqlite" else MemoryBackend()
+    return RateLimiter(store, limit=limit, window=window)
@@ -0,0 +1,170 @@
+import re
+import math
+import json
+import hashlib
+from collections import defaultdict, Counter
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def estimate_tokens(text):
+    # Rough chars-per-token heuristic; good enough for budgeting prompt sections
+    return (len(text or "") + 3) // 4
+
+def tokenize(text):
+    return [t.lower() for t in WORD_RE.findall(text or "")]
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# ─── Client / Appointment Index ──────────────────────────────────────
+
+class RecordIndex:
+    FUZZY_CUTOFF = 0.6
+
+    def __init__(self, clients, appointments):
+        self.clients = clients or {}
+        self.appointments = appointments or {}
+        self.ids = {}
+        self.appts_by_client = defaultdict(list)
+        self.name_postings = defaultdict(set)
+        self.name_sizes = {}
+        self.gram_postings = defaultdict(set)
+        for cid, c in self.clients.items():
+            self.ids[cid.upper()] = ("client", cid)
+            self._index_name(("client", cid), c.get("name", ""))
+        for aid, a in self.appointments.items():
+            self.ids[aid.upper()] = ("appointment", aid)
+            if a.get("client_id"): self.appts_by_client[a["client_id"]].append(aid)
+            self._index_name(("appointment", aid), a.get("name", ""))
+
+    def _index_name(self, ref, name):
+        words = set(tokenize(name))
+        self.name_sizes[ref] = len(words)
+        for w in words:
+            if w not in self.name_postings:
+                for g in trigrams(w): self.gram_postings[g].add(w)
+            self.name_postings[w].add(ref)
+
+    def _fuzzy_words(self, word):
+        if word in self.name_postings: return [(word, 1.0)]
+        if len(word) < 3: return []
+        grams = trigrams(word)
+        overlap = defaultdict(int)
+        for g in grams:
+            for cand in self.gram_postings.get(g, ()): overlap[cand] += 1
+        out = []
+        for cand, n in overlap.items():
+            score = n / len(grams | trigrams(cand))
+            if score >= self.FUZZY_CUTOFF: out.append((cand, score))
+        return out
+
+    def lookup(self, text, limit=5):
+        scores = defaultdict(float)
+        words = tokenize(text)
+        for w in words:
+            ref = self.ids.get(w.upper())
+            if ref: scores[ref] += 10.0
+        matched = defaultdict(float)
+        for w in set(words):
+            for cand, score in self._fuzzy_words(w):
+                for ref in self.name_postings[cand]:
+                    matched[ref] += score
+        for ref, total in matched.items():
+            # Require most of the name to be present so a shared first name alone doesn't match
+            size = self.name_sizes.get(ref) or 1
+            if total / size >= 0.75 or total >= 2: scores[ref] += total
+
+        clients, appts = {}, {}
+        for (kind, rid), _ in sorted(scores.items(), key=lambda kv: -kv[1])[:limit]:
+            if kind == "client":
+                clients[rid] = self.clients[rid]
+                for aid in self.appts_by_client.get(rid, []): appts[aid] = self.appointments[aid]
+            else:
+                appt = self.appointments[rid]
+                appts[rid] = appt
+                cid = appt.get("client_id")
+                if cid in self.clients: clients[cid] = self.clients[cid]
+        return clients, appts
+
+def render_records(records, budget_tokens):
+    # Serialize record by record so the section never exceeds its token budget
+    out, used = {}, 2
+    for rid, rec in records.items():
+        cost = estimate_tokens(json.dumps({rid: rec}))
+        if used + cost > budget_tokens: break
+        out[rid] = rec
+        used += cost
+    return json.dumps(out), used
+
+# ─── Knowledge Base Chunks ───────────────────────────────────────────
+
+SOURCE_RE = re.compile(r"^---\s*(?:Source:\s*)?(.+?)\s*---$")
+
+def chunk_text(text, chunk_size=200):
+    # Split on blank lines / source markers, then pack paragraphs up to chunk_size words
+    chunks, buf, size, source = [], [], 0, ""
+
+    def flush():
+        nonlocal buf, size
+        if buf:
+            body = "\n".join(buf)
+            chunks.append({"source": source, "text": f"[{source}]\n{body}" if source else body})
+        buf, size = [], 0
+
+    for para in re.split(r"\n\s*\n", text or ""):
+        lines = [l for l in para.strip().splitlines() if l.strip()]
+        if lines and SOURCE_RE.match(lines[0].strip()):
+            flush()
+            source = SOURCE_RE.match(lines[0].strip()).group(1)
+            lines = lines[1:]
+        for line in lines:
+            words = line.split()
+            while words:
+                room = chunk_size - size
+                if room <= 0:
+                    flush()
+                    room = chunk_size
+                piece, words = words[:room], words[room:]
+                buf.append(" ".join(piece))
+                size += len(piece)
+        if size >= chunk_size // 2: flush()
+    flush()
+    return chunks
+
+class BM25Index:
+    def __init__(self, chunks, k1=1.5, b=0.75, previous=None):
+        # Chunks whose text is unchanged since `previous` reuse its term counts
+        self.chunks = chunks
+        self.k1, self.b = k1, b
+        self.postings = defaultdict(list)
+        self.lengths = []
+        self.term_counts = {}
+        self.stats = {"reused": 0, "indexed": 0}
+        reuse = previous.term_counts if previous else {}
+        for i, chunk in enumerate(chunks):
+            key = hashlib.sha1(chunk["text"].encode("utf-8")).digest()
+            counts = reuse.get(key) or self.term_counts.get(key)
+            if counts is None:
+                counts = Counter(tokenize(chunk["text"]))
+                self.stats["indexed"] += 1
+            else: self.stats["reused"] += 1
+            self.term_counts[key] = counts
+            self.lengths.append(sum(counts.values()))
+            for t, n in counts.items(): self.postings[t].append((i, n))
+        self.avg_len = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+
+    def idf(self, term):
+        n = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.chunks) - n + 0.5) / (n + 0.5))
+
+    def search(self, query, k=4):
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf(term)
+            for i, tf in self.postings.get(term, ()):
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_len or 1))
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores, key=lambda i: -scores[i])[:k]
+        # Keep document order so neighbouring chunks read naturally in the prompt
+        return [self.chunks[i] for i in sorted(ranked)]
@@ -0,0 +1,130 @@
+import re
+import heapq
+import bisect
+import threading
+from array import array
+from itertools import islice
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+ETHIOPIC_RE = re.compile(r"[\u1200-\u139f\u2d80-\u2ddf\uab00-\uab2f]")
+
+# Ethiopic consonant rows (8 vowel orders each) that Amharic and Tigrinya writers
+# use interchangeably: ሐ/ኀ -> ሀ, ሠ -> ሰ, ዐ -> አ, ፀ -> ጸ
+HOMOPHONE_ROWS = {0x1210: 0x1200, 0x1280: 0x1200, 0x1220: 0x1230, 0x12D0: 0x12A0, 0x1340: 0x1338}
+GEEZ_FOLD = {row + i: base + i for row, base in HOMOPHONE_ROWS.items() for i in range(8)}
+
+# Prepositions written attached to the next word (በባንክ "at the bank", የባንክ "of the bank")
+PROCLITICS = ("እንደ", "ስለ", "ወደ", "በ", "ለ", "ከ", "የ")
+
+MAX_EXPANSIONS = 200
+
+def normalize(text):
+    return (text or "").lower().translate(GEEZ_FOLD)
+
+def terms(text):
+    # Index terms: normalized words, plus Ge'ez words with a leading proclitic stripped
+    for word in WORD_RE.findall(normalize(text)):
+        yield word
+        if ETHIOPIC_RE.match(word):
+            for p in PROCLITICS:
+                if word.startswith(p) and len(word) - len(p) >= 2:
+                    yield word[len(p):]
+                    break
+
+def encode_cursor(position):
+    return ".".join(str(n) for n in position)
+
+def decode_cursor(cursor):
+    try: return tuple(int(n) for n in cursor.split("."))
+    except (AttributeError, ValueError): raise ValueError(f"Invalid cursor: {cursor}")
+
+# ─── Conversation Search Index ───────────────────────────────────────
+# In-memory inverted index over the conversation log, folded in incrementally
+# like the analytics counters. Query words match indexed words by prefix and
+# filters are stored as pseudo-terms (language:am), so a search intersects a
+# few posting lists instead of scanning every record. Results are addressed by
+# log position, which is also the pagination cursor and is the same in every
+# worker process. Records arrive in time order, so date filters are a binary
+# search, and records dropped by log retention are pruned from the front.
+
+class ConversationIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.position = (0, 0)
+        self.base = 0          # doc id of positions[0]; doc ids are never reused
+        self.positions = []
+        self.timestamps = []
+        self.postings = {}
+        self.vocab = []
+
+    def _add(self, position, convo):
+        doc = self.base + len(self.positions)
+        self.positions.append(tuple(position))
+        self.timestamps.append(convo.get("timestamp") or "")
+        words = set(terms(f"{convo.get('user_query', '')}\n{convo.get('bot_reply', '')}"))
+        for word in words:
+            if word not in self.postings: bisect.insort(self.vocab, word)
+        fields = {f"{field}:{convo.get(field)}" for field in ("session_id", "language", "sector") if convo.get(field)}
+        for term in words | fields:
+            self.postings.setdefault(term, array("I")).append(doc)
+
+    def _prune(self, count):
+        # Forget the `count` oldest records; posting lists are sorted, so each loses a prefix
+        self.base += count
+        del self.positions[:count], self.timestamps[:count]
+        for term, docs in list(self.postings.items()):
+            cut = bisect.bisect_left(docs, self.base)
+            if cut == len(docs): del self.postings[term]
+            elif cut: self.postings[term] = docs[cut:]
+        self.vocab = [w for w in self.vocab if w in self.postings]
+
+    def catch_up(self, log):
+        with self.lock:
+            entries, self.position = log.entries_from(self.position)
+            for position, convo in entries: self._add(position, convo)
+            first = log.first_position()
+            if first and self.positions and self.positions[0] < first:
+                self._prune(bisect.bisect_left(self.positions, first))
+
+    def _prefix_docs(self, prefix):
+        docs = set()
+        i = bisect.bisect_left(self.vocab, prefix)
+        for word in islice(self.vocab, i, i + MAX_EXPANSIONS):
+            if not word.startswith(prefix): break
+            docs.update(self.postings[word])
+        return docs
+
+    def matches(self, query="", before=None, since=None, until=None, limit=None, **filters):
+        # Positions of matching records, newest first (at most `limit`)
+        with self.lock:
+            hi = bisect.bisect_left(self.positions, tuple(before)) if before else len(self.positions)
+            if until: hi = min(hi, bisect.bisect_right(self.timestamps, until, key=lambda ts: ts[:len(until)]))
+            lo = bisect.bisect_left(self.timestamps, since, key=lambda ts: ts[:len(since)]) if since else 0
+            sets = [self._prefix_docs(w) for w in dict.fromkeys(WORD_RE.findall(normalize(query)))]
+            sets += [set(self.postings.get(f"{k}:{v}", ())) for k, v in filters.items() if v]
+            if sets:
+                docs = (d - self.base for d in set.intersection(*sorted(sets, key=len)))
+                docs = [i for i in docs if lo <= i < hi]
+                candidates = heapq.nlargest(limit, docs) if limit is not None else sorted(docs, reverse=True)
+            else:
+                candidates = range(hi - 1, max(lo, hi - limit if limit is not None else lo) - 1, -1)
+            return [self.positions[i] for i in candidates]
+
+    def page(self, log, limit=50, cursor=None, offset=0, **criteria):
+        # One page of records plus the cursor for the next one (None on the last page)
+        self.catch_up(log)
+        before = decode_cursor(cursor) if cursor else None
+        records, last = [], None
+        while True:
+            # Only the matches this page still needs, plus one to tell whether another page follows
+            want = limit - len(records)
+            matches = self.matches(before=before, limit=offset + want + 1, **criteria)
+            batch = matches[offset:offset + want]
+            for position, convo in zip(batch, log.get(batch)):
+                # Records dropped by retention are skipped rather than shortening the page
+                if convo is not None: records.append(convo)
+                last = position
+            more = len(matches) > offset + want
+            if len(records) >= limit or not more: break
+            before, offset = last, 0
+        return records, (encode_cursor(last) if last and more else None)
@@ -0,0 +1,52 @@
+import os
+import sys
+
+# ─── Server Entry Point ──────────────────────────────────────────────
+# SERVER_MODE=sync runs the threaded Flask server (one request per thread).
+# SERVER_MODE=async runs the same app on gevent: sockets are patched before
+# anything else is imported, so every upstream wait (Gemini, HF ASR/TTS,
+# scraping) yields to other requests and one process can hold hundreds of
+# in-flight calls. Gemini is switched to its REST transport, which goes
+# through patched sockets (gRPC would block the whole process).
+
+ASYNC_DEFAULTS = {
+    "GEMINI_TRANSPORT": "rest",
+    "GEMINI_MAX_IN_FLIGHT": "200",
+}
+
+def server_mode(argv, environ=None):
+    environ = os.environ if environ is None else environ
+    if "--async" in argv: return "async"
+    if "--sync" in argv: return "sync"
+    mode = environ.get("SERVER_MODE", "sync").lower()
+    if mode not in ("sync", "async"): raise SystemExit(f"Lucy AI: Unknown SERVER_MODE {mode!r} (use sync or async)")
+    return mode
+
+def prepare(mode, environ=None):
+    # Must run before app is imported
+    environ = os.environ if environ is None else environ
+    if mode != "async": return
+    from gevent import monkey
+    monkey.patch_all()
+    for key, value in ASYNC_DEFAULTS.items(): environ.setdefault(key, value)
+
+# Under gunicorn (serve:app) argv belongs to gunicorn, so only the env var applies
+MODE = server_mode(sys.argv[1:] if __name__ == "__main__" else [])
+prepare(MODE)
+
+from app import app  # noqa: E402  (gunicorn: serve:app)
+
+def main():
+    port = int(os.getenv("PORT", 5000))
+    if MODE == "async":
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer
+        connections = int(os.getenv("SERVER_MAX_CONNECTIONS", 1000))
+        print(f"Lucy AI: Serving async (gevent) on port {port}, up to {connections} connections")
+        WSGIServer(("0.0.0.0", port), app, spawn=Pool(connections)).serve_forever()
+    else:
+        print(f"Lucy AI: Serving sync (threaded) on port {port}")
+        app.run(host="0.0.0.0", port=port, threaded=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import time
+
+TURN_CHARS = 800
+SUMMARY_CLIP = 160
+
+def clip(text, limit):
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+# ─── Session Memory ──────────────────────────────────────────────────
+# Conversation state per session_id lives in the store, so the widget only
+# sends the new message and any worker (or device) sees the same history.
+# The last few turns are kept verbatim; older ones are folded into a short
+# extractive summary that is trimmed from the front as it grows.
+
+class SessionMemory:
+    def __init__(self, store, window_turns=6, summary_chars=1500, ttl_days=7, purge_every=500):
+        self.store = store
+        self.window_turns = window_turns
+        self.summary_chars = summary_chars
+        self.ttl = ttl_days * 86400
+        self.purge_every = purge_every
+        self.writes = 0
+
+    def get(self, session_id):
+        state = self.store.get("sessions", session_id) if session_id else None
+        if state and self.ttl and time.time() - state.get("updated_at", 0) > self.ttl: return None
+        return state
+
+    def context(self, session_id):
+        state = self.get(session_id)
+        if not state: return ""
+        lines = [f"Summary of earlier conversation: {state['summary']}"] if state.get("summary") else []
+        for turn in state.get("turns", []):
+            lines += [f"user: {turn['user']}", f"assistant: {turn['assistant']}"]
+        return "\n".join(lines)
+
+    def _fold(self, summary, turn):
+        line = f"User: {clip(turn['user'], SUMMARY_CLIP)} Assistant: {clip(turn['assistant'], SUMMARY_CLIP)}"
+        summary = f"{summary} | {line}" if summary else line
+        while len(summary) > self.summary_chars and " | " in summary:
+            summary = summary.split(" | ", 1)[1]
+        return summary[-self.summary_chars:]
+
+    def record(self, session_id, user_query, reply):
+        now = time.time()
+        def update(state):
+            if not state or (self.ttl and now - state.get("updated_at", 0) > self.ttl):
+                state = {"summary": "", "turns": [], "turn_count": 0, "created_at": now}
+            turns = state["turns"] + [{"user": clip(user_query, TURN_CHARS), "assistant": clip(reply, TURN_CHARS)}]
+            summary = state["summary"]
+            while len(turns) > self.window_turns: summary = self._fold(summary, turns.pop(0))
+            return dict(state, summary=summary, turns=turns, turn_count=state["turn_count"] + 1, updated_at=now)
+        state = self.store.modify("sessions", session_id, update)
+        self.writes += 1
+        if self.ttl and self.writes % self.purge_every == 0: self.store.purge("sessions", now - self.ttl)
+        return state
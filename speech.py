@@ -0,0 +1,396 @@
+import io
+import os
+import re
+import sys
+import math
+import time
+import wave
+import tempfile
+import hashlib
+import threading
+import unicodedata
+from concurrent.futures import Future
+from array import array
+from urllib.parse import urlparse
+import requests
+from jobs import worker_pool
+
+try:
+    import audioop
+except ImportError:  # removed in Python 3.13; the pure-Python paths below are used instead
+    audioop = None
+
+HF_INFERENCE_URL = "https://api-inference.huggingface.co/models/"
+# Hosts that may receive the HF token (hosted Inference API and Inference Endpoints)
+HF_HOSTS = ("huggingface.co", "huggingface.cloud")
+# "org/model" ids, as accepted from tenant config; endpoint URLs only come from the operator
+MODEL_ID_RE = re.compile(r"^[A-Za-z0-9][\w.-]*(/[\w.-]+)?$")
+TTS_MODELS = {
+    "am": "facebook/mms-tts-amh",
+    "om": "facebook/mms-tts-orm",
+    "ti": "facebook/mms-tts-tir",
+    "so": "facebook/mms-tts-som"
+}
+ASR_MODEL = "facebook/mms-1b-all"
+# Widget and API callers send either ISO 639-1 or the MMS (639-3) codes
+LANG_CODES = {"amh": "am", "orm": "om", "tir": "ti", "som": "so", "eng": "en"}
+MMS_CODES = {v: k for k, v in LANG_CODES.items()}
+# Ethiopic full stop / question mark as well as Latin punctuation
+SENTENCE_END_RE = re.compile(r"(?<=[።፧?!.])\s+|(?<=[።፧])|\n+")
+
+class SpeechError(Exception):
+    pass
+
+class PayloadTooLarge(SpeechError):
+    pass
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+def split_sentences(text, max_chars=300, min_chars=20):
+    # Sentence-sized chunks for synthesis: short fragments are merged, overlong ones cut at spaces
+    out = []
+    for part in SENTENCE_END_RE.split(normalize_text(text)):
+        part = part.strip()
+        if not part: continue
+        while len(part) > max_chars:
+            cut = part.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            out.append(part[:cut].strip())
+            part = part[cut:].strip()
+        if out and (len(out[-1]) < min_chars or len(part) < min_chars) and len(out[-1]) + len(part) < max_chars:
+            out[-1] = f"{out[-1]} {part}"
+        elif part:
+            out.append(part)
+    return out
+
+def audio_type(data):
+    if data[:4] == b"RIFF": return "audio/wav"
+    if data[:4] == b"fLaC": return "audio/flac"
+    if data[:4] == b"OggS": return "audio/ogg"
+    if data[:3] == b"ID3" or data[:2] == b"\xff\xfb": return "audio/mpeg"
+    return None
+
+def join_wav(parts):
+    # One WAV from several with identical format; None if any part isn't a compatible WAV
+    try:
+        readers = [wave.open(io.BytesIO(p), "rb") for p in parts]
+    except (wave.Error, EOFError):
+        return None
+    params = {r.getparams()[:3] for r in readers}
+    if len(params) != 1: return None
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(readers[0].getnchannels())
+        w.setsampwidth(readers[0].getsampwidth())
+        w.setframerate(readers[0].getframerate())
+        for r in readers: w.writeframes(r.readframes(r.getnframes()))
+    return out.getvalue()
+
+# ─── Audio Cache ─────────────────────────────────────────────────────
+# Content-addressed: the file name is a hash of (model, normalized text), so
+# every worker sharing the directory shares hits. Reads refresh the mtime and
+# the oldest files are removed once the directory exceeds max_bytes.
+
+class AudioCache:
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(os.path.getsize(p) for p in self._files())
+
+    def key(self, model, text):
+        return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()[:32]
+
+    def _files(self):
+        return [os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith(".audio")]
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f: data = f.read()
+            os.utime(path)
+        except OSError:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f: f.write(data)
+        os.replace(tmp, path)
+        with self.lock:
+            self.size += len(data)
+            if self.size > self.max_bytes: self._evict()
+
+    def _evict(self):
+        files = []
+        for p in self._files():
+            try: files.append((os.path.getmtime(p), os.path.getsize(p), p))
+            except OSError: pass
+        files.sort()
+        self.size = sum(size for _, size, _ in files)
+        for _, size, p in files:
+            if self.size <= self.max_bytes * 0.9: break
+            try:
+                os.remove(p)
+                self.size -= size
+                self.stats["evicted"] += 1
+            except OSError: pass
+
+# ─── Speech Backends ────────────────────────────────────────────────────
+
+def is_hf_url(url):
+    host = (urlparse(url).hostname or "").lower()
+    return urlparse(url).scheme == "https" and any(host == h or host.endswith(f".{h}") for h in HF_HOSTS)
+
+class HFSpeech:
+    # Hugging Face Inference API
+    def __init__(self, token, timeout=30):
+        self.token = token
+        self.timeout = timeout
+
+    def synthesize(self, model, text):
+        if not self.token: raise SpeechError("HF Token missing")
+        response = requests.post(HF_INFERENCE_URL + model, headers={"Authorization": f"Bearer {self.token}"},
+                                 json={"inputs": text}, timeout=self.timeout)
+        if response.status_code != 200 or not audio_type(response.content):
+            raise SpeechError(f"TTS upstream returned {response.status_code}: {response.text[:200]}")
+        return response.content
+
+    def transcribe(self, model, body, content_type, target_lang=None):
+        # Dedicated endpoints (URLs) get the MMS language so they can load its adapter; the hosted
+        # Inference API has no such parameter and always runs the model's default adapter
+        endpoint = model.startswith("http")
+        url = model if endpoint else HF_INFERENCE_URL + model
+        params = {"target_lang": target_lang} if endpoint and target_lang else None
+        headers = {"Content-Type": content_type}
+        # The token only ever goes to Hugging Face; self-hosted endpoints are called without it
+        if is_hf_url(url):
+            if not self.token: raise SpeechError("HF Token missing")
+            headers["Authorization"] = f"Bearer {self.token}"
+        response = requests.post(url, headers=headers, params=params, data=body, timeout=self.timeout)
+        try: result = response.json()
+        except ValueError: result = {}
+        if response.status_code != 200 or "text" not in result:
+            raise SpeechError(f"ASR upstream returned {response.status_code}: {response.text[:200]}")
+        return result
+
+class StubSpeech:
+    # Local stand-in for tests, benchmarks and offline development: 20 ms of silence per character
+    def __init__(self, rate=16000, latency=0):
+        self.rate = rate
+        self.latency = latency
+        self.calls = []
+
+    def synthesize(self, model, text):
+        self.calls.append((model, text))
+        if self.latency: time.sleep(self.latency)
+        out = io.BytesIO()
+        with wave.open(out, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.rate)
+            w.writeframes(b"\0\0" * (self.rate // 50) * len(text))
+        return out.getvalue()
+
+    def transcribe(self, model, body, content_type, target_lang=None):
+        data = body if isinstance(body, bytes) else body.read()
+        self.calls.append((model, data, target_lang))
+        if self.latency: time.sleep(self.latency)
+        return {"text": f"stub transcript of {len(data)} bytes"}
+
+def make_speech_backend(name, token=None, timeout=30):
+    if name == "stub": return StubSpeech()
+    return HFSpeech(token, timeout=timeout)
+
+# ─── Text to Speech ──────────────────────────────────────────────────
+# Replies are split into sentences that are synthesized in parallel and cached
+# one by one, so repeated answers (welcome message, FAQs) never reach the
+# upstream and a long reply costs as much as its slowest sentence. Concurrent
+# requests for the same sentence share a single upstream call.
+
+class TextToSpeech:
+    def __init__(self, backend, cache, workers=4, max_chars=300):
+        self.backend = backend
+        self.cache = cache
+        self.max_chars = max_chars
+        self.pool = worker_pool(workers, "tts")
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def model(self, lang):
+        return TTS_MODELS.get(lang, TTS_MODELS["am"])
+
+    def sentences(self, text):
+        return split_sentences(text, self.max_chars)
+
+    def _synthesize(self, model, text, key):
+        try:
+            data = self.backend.synthesize(model, text)
+            self.cache.put(key, data)
+            return data
+        finally:
+            with self.lock: self.pending.pop(key, None)
+
+    def submit(self, model, text):
+        # Future for one sentence: cached, already in flight, or newly started
+        key = self.cache.key(model, text)
+        with self.lock:
+            future = self.pending.get(key)
+            if future is None:
+                data = self.cache.get(key)
+                if data is not None:
+                    future = Future()
+                    future.set_result(data)
+                else:
+                    future = self.pending[key] = self.pool.submit(self._synthesize, model, text, key)
+        return future
+
+    def synthesize(self, model, text):
+        return self.submit(model, text).result()
+
+    def speak(self, lang, text):
+        # Whole reply as one clip. Sentences are joined when the upstream returns WAV;
+        # other formats can't be concatenated, so the text is synthesized in one call.
+        model = self.model(lang)
+        sentences = self.sentences(text)
+        if not sentences: raise SpeechError("text required")
+        if len(sentences) == 1: return self.synthesize(model, sentences[0])
+        parts = [f.result() for f in [self.submit(model, s) for s in sentences]]
+        return join_wav(parts) or self.synthesize(model, normalize_text(text))
+
+# ─── Audio Normalization ─────────────────────────────────────────────
+# 16-bit PCM helpers. audioop does the work when present; otherwise the same
+# conversions run on array('h') (nearest-sample resampling, which ASR tolerates).
+
+def _samples(pcm):
+    samples = array("h", pcm)
+    if sys.byteorder == "big": samples.byteswap()
+    return samples
+
+def _pcm(samples):
+    if sys.byteorder == "big": samples.byteswap()
+    return samples.tobytes()
+
+def to_mono(pcm, channels):
+    if channels == 1: return pcm
+    if audioop and channels == 2: return audioop.tomono(pcm, 2, 0.5, 0.5)
+    s = _samples(pcm)
+    return _pcm(array("h", (sum(s[i:i + channels]) // channels for i in range(0, len(s) - channels + 1, channels))))
+
+def resample(pcm, rate, target):
+    if rate == target: return pcm
+    if audioop: return audioop.ratecv(pcm, 2, 1, rate, target, None)[0]
+    s = _samples(pcm)
+    count = len(s) * target // rate
+    return _pcm(array("h", (s[i * rate // target] for i in range(count))))
+
+def rms(pcm):
+    if audioop: return audioop.rms(pcm, 2)
+    s = _samples(pcm)
+    return int(math.sqrt(sum(x * x for x in s) / len(s))) if s else 0
+
+def wav_bytes(pcm, rate):
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm)
+    return out.getvalue()
+
+def trim_silence(pcm, rate, frame_ms=30, pad_ms=200, min_rms=300):
+    # Energy VAD: drop leading/trailing frames quieter than the noise floor (plus padding)
+    size = rate * frame_ms // 1000 * 2
+    frames = [pcm[i:i + size] for i in range(0, len(pcm), size)]
+    if not frames: return b""
+    levels = [rms(f) for f in frames]
+    floor = sorted(levels)[len(levels) // 10]
+    threshold = max(min_rms, floor * 3)
+    voiced = [i for i, level in enumerate(levels) if level >= threshold]
+    if not voiced: return b""
+    pad = pad_ms // frame_ms
+    return b"".join(frames[max(0, voiced[0] - pad):voiced[-1] + pad + 1])
+
+def normalize_wav(data, rate=16000, vad=True):
+    # 16 kHz mono 16-bit WAV with silence trimmed; None when the input isn't PCM WAV we can read
+    try:
+        with wave.open(io.BytesIO(data) if isinstance(data, bytes) else data, "rb") as w:
+            channels, width, source_rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+            pcm = w.readframes(w.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    if width != 2:
+        if not audioop: return None
+        pcm = audioop.lin2lin(pcm, width, 2)
+        if width == 1: pcm = audioop.bias(pcm, 2, 0)  # 8-bit WAV is unsigned
+    pcm = resample(to_mono(pcm, channels), source_rate, rate)
+    if vad: pcm = trim_silence(pcm, rate)
+    return wav_bytes(pcm, rate)
+
+def read_limited(stream, max_bytes, chunk_size=1 << 16):
+    # Spools an upload to a temp file (memory for small ones) and stops as soon as it exceeds max_bytes
+    out = tempfile.SpooledTemporaryFile(max_size=1 << 20)
+    total = 0
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        total += len(chunk)
+        if total > max_bytes:
+            out.close()
+            raise PayloadTooLarge(f"Audio exceeds {max_bytes // 1024} KB")
+        out.write(chunk)
+    out.seek(0)
+    return out
+
+# ─── Speech to Text ──────────────────────────────────────────────────
+# WAV uploads are normalized to 16 kHz mono and trimmed before forwarding, which
+# cuts upstream bytes several-fold for 44.1/48 kHz stereo recordings. Other
+# formats (browser webm/ogg) are already compressed and are streamed through
+# unchanged. Each language can be routed to its own model or endpoint, and
+# every call carries the MMS (639-3) language for endpoints that serve several.
+# Endpoint URLs are operator settings; per-call overrides (tenant config) may
+# only name models on the hosted Inference API.
+
+class SpeechToText:
+    def __init__(self, backend, models=None, default_model=None, max_bytes=10 * 1024 * 1024, rate=16000):
+        self.backend = backend
+        self.models = dict(models or {})
+        self.default_model = default_model or ASR_MODEL
+        self.max_bytes = max_bytes
+        self.rate = rate
+        self.stats = {"requests": 0, "bytes_in": 0, "bytes_out": 0, "silent": 0}
+
+    def model(self, lang, overrides=None):
+        lang = LANG_CODES.get(lang, lang)
+        override = (overrides or {}).get(lang)
+        if not (isinstance(override, str) and MODEL_ID_RE.match(override)): override = None
+        return override or self.models.get(lang) or self.default_model
+
+    def transcribe(self, lang, upload, content_type=None, overrides=None):
+        upload.seek(0, os.SEEK_END)
+        size = upload.tell()
+        upload.seek(0)
+        self.stats["requests"] += 1
+        self.stats["bytes_in"] += size
+        body, content_type = upload, content_type or "application/octet-stream"
+        if upload.read(4) == b"RIFF":
+            upload.seek(0)
+            wav = normalize_wav(upload, self.rate)
+            if wav is not None:
+                # Only the 44-byte header left: nothing but silence
+                if len(wav) <= 44:
+                    self.stats["silent"] += 1
+                    return {"text": "", "language": LANG_CODES.get(lang, lang)}
+                body, content_type, size = wav, "audio/wav", len(wav)
+        upload.seek(0)
+        self.stats["bytes_out"] += size
+        model, lang = self.model(lang, overrides), LANG_CODES.get(lang, lang)
+        result = self.backend.transcribe(model, body, content_type, target_lang=MMS_CODES.get(lang, lang))
+        return dict(result, language=lang, model=model)
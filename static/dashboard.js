@@ -1,7 +1,24 @@
-const API = { settings: "/api/settings", support: "/api/support", upload: "/api/upload", activity: "/api/activity", scan: "/api/scan-site", scrape: "/api/scrape-pages", clients: "/api/clients", appointments: "/api/appointments", conversations: "/api/conversations", analytics: "/api/analytics" };
+const API = { settings: "/api/settings", support: "/api/support", upload: "/api/upload", activity: "/api/activity", scan: "/api/scan-site", scrape: "/api/scrape-pages", clients: "/api/clients", appointments: "/api/appointments", conversations: "/api/conversations", analytics: "/api/analytics", jobs: "/api/jobs" };
 
 function showToast(msg) { document.getElementById('toastMsg').innerHTML = '<i class="bi bi-check-circle-fill me-2"></i>' + msg; new bootstrap.Toast(document.getElementById('saveToast')).show(); }
 
+// ── Background Jobs ─────────────────────────────────────────────────
+async function pollJob(job, onProgress) {
+    // Jobs run inside the request (Vercel) come back finished
+    if (job.status === 'done') return job.result;
+    if (job.status === 'failed') throw new Error(job.error || 'Job failed');
+    const jobId = job.job_id; let seen = 0;
+    while (true) {
+        const r = await fetch(`${API.jobs}/${jobId}?since=${seen}`); const j = await r.json();
+        if (j.error && !j.status) throw new Error(j.error);
+        seen += (j.partial || []).length;
+        if (onProgress) onProgress(j);
+        if (j.status === 'done') return j.result;
+        if (j.status === 'failed') throw new Error(j.error || 'Job failed');
+        await new Promise(res => setTimeout(res, 1000));
+    }
+}
+
 // ── Knowledge Base ──────────────────────────────────────────────────
 async function scanWebsite() {
     const u = document.getElementById('scanUrl').value.trim(); if (!u) return;
@@ -16,6 +33,19 @@ async function scanWebsite() {
     finally { b.innerText = "Scan"; b.disabled = false; }
 }
 
+// Re-imported pages replace their existing "--- Source: url ---" section instead of duplicating it
+function mergeSources(kb, text) {
+    const sections = text.split(/\n\n(?=--- Source: )/).filter(Boolean);
+    for (const section of sections) {
+        const marker = section.split('\n', 1)[0];
+        const start = kb.indexOf(marker);
+        if (start === -1) { kb = (kb + "\n\n" + section).trim(); continue; }
+        const next = kb.indexOf('\n\n--- Source: ', start + marker.length);
+        kb = kb.slice(0, start) + section + (next === -1 ? '' : kb.slice(next));
+    }
+    return kb.trim();
+}
+
 async function importSelectedLinks() {
     const cb = document.querySelectorAll('#linksList input:checked');
     if (!cb.length) { alert("Select pages."); return; }
@@ -24,11 +54,14 @@ async function importSelectedLinks() {
     b.innerHTML = '<span class="spinner-border spinner-border-sm me-2"></span>Importing...'; b.disabled = true;
     try {
         const r = await fetch(API.scrape, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ urls }) });
-        const d = await r.json(); if (d.error) throw new Error(d.error);
+        const job = await r.json(); if (job.error) throw new Error(job.error);
+        const d = await pollJob(job, j => {
+            b.innerHTML = `<span class="spinner-border spinner-border-sm me-2"></span>Importing ${j.progress.done}/${j.progress.total}...`;
+        });
         const kb = document.getElementById('kbText');
-        kb.value = (kb.value + "\n" + d.text).trim();
+        kb.value = mergeSources(kb.value, d.text);
         document.getElementById('linkSelectionArea').classList.add('d-none');
-        showToast(`Imported ${d.count} pages!`);
+        showToast(d.unchanged ? `Imported ${d.count} pages (${d.unchanged} unchanged)` : `Imported ${d.count} pages!`);
     } catch (e) { alert("Import failed: " + e.message); }
     finally { b.innerHTML = '<i class="bi bi-download me-2"></i>Import Selected'; b.disabled = false; }
 }
@@ -36,9 +69,11 @@ async function importSelectedLinks() {
 async function uploadFile() {
     const f = document.getElementById('fileUpload').files[0]; if (!f) return;
     const fd = new FormData(); fd.append('file', f);
+    const pages = document.getElementById('filePages').value.trim(); if (pages) fd.append('pages', pages);
     try {
         const r = await fetch(API.upload, { method: 'POST', body: fd });
-        const d = await r.json(); if (d.error) throw new Error(d.error);
+        const job = await r.json(); if (job.error) throw new Error(job.error);
+        const d = await pollJob(job, j => { if (j.progress.total > 1) showToast(`Extracting page ${j.progress.done}/${j.progress.total}...`); });
         const kb = document.getElementById('kbText');
         kb.value = (kb.value + "\n\n--- " + d.filename + " ---\n" + d.extracted_text).trim();
         showToast("File imported!"); document.getElementById('fileUpload').value = "";
@@ -164,13 +199,17 @@ async function deleteAppt(id) {
 }
 
 // ── Conversations ───────────────────────────────────────────────────
-async function loadConversations(search = '') {
+let convoCursor = null;
+async function loadConversations(search = '', more = false) {
     try {
-        const url = API.conversations + (search ? '?search=' + encodeURIComponent(search) : '');
-        const r = await fetch(url); const d = await r.json();
+        const params = new URLSearchParams({ limit: 50, cursor: more ? convoCursor : '' });
+        if (search) params.set('search', search);
+        const r = await fetch(API.conversations + '?' + params); const d = await r.json();
+        convoCursor = r.headers.get('X-Next-Cursor');
         const c = document.getElementById('convoList');
-        if (!d.length) { c.innerHTML = '<div class="text-center py-4" style="color:var(--muted)">No conversations yet. Chat with the bot to see logs here.</div>'; return; }
-        c.innerHTML = d.slice(0, 50).map(cv => `<div class="convo-item">
+        document.getElementById('convoMore').classList.toggle('d-none', !convoCursor);
+        if (!d.length && !more) { c.innerHTML = '<div class="text-center py-4" style="color:var(--muted)">No conversations yet. Chat with the bot to see logs here.</div>'; return; }
+        const html = d.map(cv => `<div class="convo-item">
             <div class="convo-q"><i class="bi bi-person-fill me-1" style="color:var(--p2)"></i>${cv.user_query || ''}</div>
             <div class="convo-a"><i class="bi bi-robot me-1"></i>${(cv.bot_reply || '').substring(0, 150)}...</div>
             <div class="convo-meta">
@@ -178,10 +217,12 @@ async function loadConversations(search = '') {
                 <span class="me-3"><i class="bi bi-translate me-1"></i>${cv.language || ''}</span>
                 <span style="color:var(--green)">${cv.tokens || 0} tokens</span>
             </div></div>`).join('');
+        if (more) c.insertAdjacentHTML('beforeend', html); else c.innerHTML = html;
     } catch (e) { console.error(e); }
 }
 
 function searchConversations() { loadConversations(document.getElementById('convoSearch').value.trim()); }
+function moreConversations() { loadConversations(document.getElementById('convoSearch').value.trim(), true); }
 
 // ── Analytics ───────────────────────────────────────────────────────
 async function loadAnalytics() {
@@ -148,6 +148,7 @@
       e.stopPropagation();
       if (confirm("Are you sure you want to clear your chat history?")) {
         localStorage.removeItem('lucy_chat_history');
+        localStorage.removeItem('lucy_session_id');
         document.getElementById('lucy-messages').innerHTML = '';
         loadHistoryAndWelcome();
       }
@@ -175,12 +176,15 @@
           };
 
           mediaRecorder.onstop = async () => {
-            const audioBlob = new Blob(audioChunks, { type: 'audio/wav' });
+            // Sent as recorded (usually compressed webm/ogg), which is the smallest upload on slow networks
+            const type = mediaRecorder.mimeType || 'audio/webm';
+            const audioBlob = new Blob(audioChunks, { type });
             micBtn.classList.add('processing');
 
             try {
-              const res = await fetch(`${BASE_URL}/api/asr?lang=amh`, {
+              const res = await fetch(`${BASE_URL}/api/asr?lang=am`, {
                 method: 'POST',
+                headers: { 'Content-Type': type },
                 body: audioBlob
               });
               const data = await res.json();
@@ -201,17 +205,29 @@
     });
   }
 
+  function playAudio(blob) {
+    return new Promise((resolve) => {
+      const audio = new Audio(URL.createObjectURL(blob));
+      audio.onended = resolve;
+      audio.onerror = resolve;
+      audio.play().catch(resolve);
+    });
+  }
+
   async function speakText(text) {
+    // The reply is synthesized sentence by sentence: start playing the first while the rest download
     try {
       const res = await fetch(`${BASE_URL}/api/tts`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ text: text, lang: 'am' })
+        body: JSON.stringify({ text: text, lang: 'am', chunked: true })
       });
-      const blob = await res.blob();
-      const url = URL.createObjectURL(blob);
-      const audio = new Audio(url);
-      audio.play();
+      const { chunks } = await res.json();
+      const pending = (chunks || []).map(c => fetch(`${BASE_URL}${c.url}`).then(r => r.ok ? r.blob() : null));
+      for (const clip of pending) {
+        const blob = await clip;
+        if (blob) await playAudio(blob);
+      }
     } catch (e) { console.error("TTS Error", e); }
   }
 
@@ -229,6 +245,16 @@
     catch (e) { return []; }
   }
 
+  // History stays on the server under this ID; local history is only for redrawing the chat
+  function getSessionId() {
+    let id = window.__LUCY_SESSION_ID__ || localStorage.getItem('lucy_session_id');
+    if (!id) {
+      id = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+      localStorage.setItem('lucy_session_id', id);
+    }
+    return id;
+  }
+
   function saveHistory(history) {
     localStorage.setItem('lucy_chat_history', JSON.stringify(history.slice(-10)));
   }
@@ -240,6 +266,7 @@
     div.textContent = text;
     messagesEl.appendChild(div);
     messagesEl.scrollTop = messagesEl.scrollHeight;
+    return div;
   }
 
   async function sendMessage(enableTTS = false) {
@@ -251,31 +278,68 @@
     inputEl.value = '';
 
     const history = getHistory();
-    const context = history.map(m => `${m.role}: ${m.content}`).join("\n");
 
     try {
       const res = await fetch(API_URL, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json', 'X-API-KEY': CLIENT_KEY },
+        headers: { 'Content-Type': 'application/json', 'X-API-KEY': CLIENT_KEY, 'Accept': 'text/event-stream' },
         body: JSON.stringify({
           user_query: text,
-          context: context,
+          session_id: getSessionId(),
           language: 'am', // Default to Amharic
-          sector: 'admin_defined'
+          sector: 'admin_defined',
+          stream: true
         })
       });
-      const data = await res.json();
-      appendMsg(data.reply, 'assistant');
 
-      if (enableTTS) speakText(data.reply);
+      let reply = '';
+      const contentType = res.headers.get('Content-Type') || '';
+      if (res.body && contentType.includes('text/event-stream')) {
+        const div = appendMsg('', 'assistant');
+        reply = await readStream(res, (delta) => {
+          div.textContent += delta;
+          const messagesEl = document.getElementById('lucy-messages');
+          messagesEl.scrollTop = messagesEl.scrollHeight;
+        });
+        div.textContent = reply;
+      } else {
+        const data = await res.json();
+        reply = data.reply;
+        appendMsg(reply, 'assistant');
+      }
+
+      if (enableTTS) speakText(reply);
 
       history.push({ role: 'user', content: text });
-      history.push({ role: 'assistant', content: data.reply });
+      history.push({ role: 'assistant', content: reply });
       saveHistory(history);
     } catch (e) {
       appendMsg("Sorry, I'm having trouble connecting.", 'assistant');
     }
   }
 
+  // Parses Server-Sent Events from /api/support and resolves with the final reply
+  async function readStream(res, onDelta) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '', reply = '';
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const frames = buffer.split('\n\n');
+      buffer = frames.pop();
+      for (const frame of frames) {
+        const event = (frame.match(/^event: (.*)$/m) || [])[1];
+        const dataLine = (frame.match(/^data: (.*)$/m) || [])[1];
+        if (!dataLine) continue;
+        const data = JSON.parse(dataLine);
+        if (event === 'done') { reply = data.reply || reply; }
+        else if (data.delta) { reply += data.delta; onDelta(data.delta); }
+      }
+    }
+    return reply;
+  }
+
   initWidget();
 })();
\ No newline at end of file
@@ -0,0 +1,480 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from conversation_log import ConversationLog
+
+RECORD_TABLES = ("users", "clients", "appointments", "sessions", "tenants")
+# Written on every support turn, so the JSON backend keeps one file per record for these
+FILE_PER_RECORD_TABLES = ("sessions",)
+
+def _next_id(key, prefix):
+    return f"{prefix}{str(int(key[len(prefix):]) + 1).zfill(3)}"
+
+def _write_json(path, data, **kwargs):
+    # Readers and crashes only ever see the old file or the new one, never a truncated one
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f: json.dump(data, f, **kwargs)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+
+# ─── JSON Store ──────────────────────────────────────────────────────
+# Development backend: one JSON file per table. Parsed files are shared across
+# requests and only re-read when the file's mtime/size changes; every write
+# rewrites the whole file (via a temp file, so a crash never truncates it), so
+# it is only safe with a single worker process.
+# FILE_PER_RECORD_TABLES are a directory of small files instead (sessions.json
+# becomes sessions/), so a write costs the same however many records there are.
+
+class JSONStore:
+    backend = "json"
+
+    def __init__(self, paths, conversation_dir, legacy_conversations=None):
+        self.paths = dict(paths)
+        self.conversation_dir = conversation_dir
+        self.legacy_conversations = legacy_conversations
+        self.cache = {}
+        self.stats = {"hits": 0, "misses": 0}
+        self.lock = threading.RLock()
+        self.on_change = None
+
+    def _record_dir(self, table):
+        directory = os.path.splitext(self.paths[table])[0]
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+            # One-shot split of a table written before it moved to one file per record
+            legacy = self._read(self.paths[table], dict) if os.path.exists(self.paths[table]) else {}
+            for key, record in legacy.items(): self._write_record(table, key, record)
+        return directory
+
+    def _record_path(self, table, key):
+        # Keys come from clients (session ids), so they are hashed rather than used as file names
+        return os.path.join(self._record_dir(table), hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _read(self, path, default):
+        try:
+            with open(path, 'r', encoding='utf-8') as f: return json.load(f)
+        except FileNotFoundError: return default()
+        except (OSError, ValueError) as e:
+            print(f"Lucy AI: Failed to read {path}: {e}")
+            return default()
+
+    def _read_record(self, table, key):
+        entry = self._read(self._record_path(table, key), lambda: None)
+        return entry["record"] if entry else None
+
+    def _write_record(self, table, key, record):
+        path = self._record_path(table, key)
+        if record is None:
+            try: os.remove(path)
+            except FileNotFoundError: pass
+            return
+        _write_json(path, {"key": key, "record": record}, ensure_ascii=False)
+
+    def version(self, table):
+        if table in FILE_PER_RECORD_TABLES: return None
+        try:
+            st = os.stat(self.paths[table])
+            return (st.st_mtime_ns, st.st_size)
+        except OSError: return None
+
+    def load(self, table, default=dict):
+        if table in FILE_PER_RECORD_TABLES:
+            directory = self._record_dir(table)
+            entries = [self._read(os.path.join(directory, name), lambda: None) for name in sorted(os.listdir(directory)) if name.endswith(".json")]
+            return {e["key"]: e["record"] for e in entries if e}
+        path, sig = self.paths[table], self.version(table)
+        if sig is None: return default()
+        with self.lock:
+            entry = self.cache.get(path)
+            if entry and entry[0] == sig:
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+        try:
+            with open(path, 'r', encoding='utf-8') as f: data = json.load(f)
+        except FileNotFoundError: return default()
+        except (OSError, ValueError) as e:
+            # Never stand in an empty table for an unreadable file: the next write would replace it
+            print(f"Lucy AI: Failed to read {path}: {e}")
+            raise
+        with self.lock: self.cache[path] = (sig, data)
+        return data
+
+    def save(self, table, data):
+        if table in FILE_PER_RECORD_TABLES:
+            with self.lock:
+                for key in set(self.load(table)) - set(data): self._write_record(table, key, None)
+                for key, record in data.items(): self._write_record(table, key, record)
+            return
+        path = self.paths[table]
+        try: _write_json(path, data, indent=2)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Lucy AI: Failed to save {path}: {e}")
+            return
+        with self.lock: self.cache[path] = (self.version(table), data)
+
+    def _apply(self, table, key, fn):
+        # Read-modify-write of one record; returns (old, new, before, after) or None if fn declines
+        if table in FILE_PER_RECORD_TABLES:
+            with self.lock:
+                result = fn(None, self._read_record(table, key))
+                if result is None: return None
+                self._write_record(table, key, result[1])
+                return result + (None, None)
+        with self.lock:
+            # Copy on write: readers may be iterating the cached dict without the lock
+            data = dict(self.load(table))
+            before = self.version(table)
+            result = fn(data, data.get(key))
+            if result is None: return None
+            old, new = result
+            if new is None: data.pop(key, None)
+            else: data[key] = new
+            self.save(table, data)
+            return old, new, before, self.version(table)
+
+    def _notify(self, table, change):
+        # Called with the store lock released: listeners take their own locks and read the store
+        if change and self.on_change: self.on_change(table, *change)
+
+    def _write(self, table, key, fn):
+        change = self._apply(table, key, fn)
+        self._notify(table, change)
+        return change[:2] if change else None
+
+    def get(self, table, key):
+        if table in FILE_PER_RECORD_TABLES: return self._read_record(table, key)
+        return self.load(table).get(key)
+
+    def put(self, table, key, record):
+        return self._write(table, key, lambda data, old: (old, record))[0]
+
+    def update(self, table, key, changes):
+        return self._write(table, key, lambda data, old: None if old is None else (dict(old), {**old, **changes}))
+
+    def delete(self, table, key):
+        result = self._write(table, key, lambda data, old: None if old is None else (old, None))
+        return result[0] if result else None
+
+    def modify(self, table, key, fn):
+        # Atomically replace a record with fn(old), where old is None for a new record
+        return self._write(table, key, lambda data, old: (old, fn(old)))[1]
+
+    def purge(self, table, before):
+        # Drop records whose updated_at is older than `before`
+        with self.lock:
+            data = self.load(table)
+            stale = {k for k, r in data.items() if r.get("updated_at", 0) < before}
+            if table in FILE_PER_RECORD_TABLES:
+                for key in stale: self._write_record(table, key, None)
+            elif stale: self.save(table, {k: r for k, r in data.items() if k not in stale})
+        return len(stale)
+
+    def create(self, table, record, key=None, prefix=None):
+        # With a prefix, IDs like CLT001 are advanced until free; without one an existing key is a conflict
+        with self.lock:
+            data = self.load(table)
+            if prefix:
+                key = key or f"{prefix}{str(len(data) + 1).zfill(3)}"
+                while key in data: key = _next_id(key, prefix)
+            elif key in data: return None
+            change = self._apply(table, key, lambda data, old: (None, record))
+        self._notify(table, change)
+        return key
+
+    def get_config(self):
+        return self.load("config", lambda: None)
+
+    def set_config(self, config):
+        self.save("config", config)
+
+    def conversation_log(self, max_bytes=None, max_age_days=None):
+        log = ConversationLog(self.conversation_dir, max_bytes=max_bytes, max_age_days=max_age_days)
+        # One-shot import of the legacy conversations.json into the empty log
+        if not log.segments() and self.legacy_conversations and os.path.exists(self.legacy_conversations):
+            try:
+                with open(self.legacy_conversations, 'r', encoding='utf-8') as f: log.import_records(json.load(f))
+            except (OSError, ValueError) as e: print(f"Lucy AI: Failed to import {self.legacy_conversations}: {e}")
+        return log
+
+# ─── SQLite Store ────────────────────────────────────────────────────
+# Production backend: one WAL-mode database shared by every worker process.
+# Record writes are single-row transactions, and a per-table version counter
+# bumped in the same transaction replaces the JSON backend's file signatures.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS clients (id TEXT PRIMARY KEY, name TEXT, status TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS clients_status ON clients (status);
+CREATE INDEX IF NOT EXISTS clients_name ON clients (name);
+CREATE TABLE IF NOT EXISTS appointments (id TEXT PRIMARY KEY, client_id TEXT, name TEXT, status TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS appointments_client ON appointments (client_id);
+CREATE INDEX IF NOT EXISTS appointments_status ON appointments (status);
+CREATE TABLE IF NOT EXISTS conversations (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, timestamp TEXT,
+    language TEXT, sector TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS conversations_session ON conversations (session_id, id);
+CREATE INDEX IF NOT EXISTS conversations_timestamp ON conversations (timestamp);
+CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, updated_at REAL, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at);
+CREATE TABLE IF NOT EXISTS tenants (id TEXT PRIMARY KEY, api_key TEXT, data TEXT NOT NULL);
+CREATE UNIQUE INDEX IF NOT EXISTS tenants_api_key ON tenants (api_key);
+CREATE TABLE IF NOT EXISTS config (id INTEGER PRIMARY KEY CHECK (id = 1), data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL);
+"""
+
+COLUMNS = {"users": (), "clients": ("name", "status"), "appointments": ("client_id", "name", "status"), "sessions": ("updated_at",),
+           "tenants": ("api_key",)}
+
+class SQLiteStore:
+    backend = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.cache = {}
+        self.stats = {"hits": 0, "misses": 0}
+        self.lock = threading.Lock()
+        self.on_change = None
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        if not hasattr(self.local, "conn"):
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return self.local.conn
+
+    def _transaction(self, fn):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _version(self, conn, name):
+        row = conn.execute("SELECT version FROM versions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def _bump(self, conn, name):
+        conn.execute("INSERT INTO versions (name, version) VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET version = version + 1", (name,))
+        return self._version(conn, name)
+
+    def version(self, table):
+        return self._version(self._conn(), table)
+
+    def _row(self, table, key, record):
+        cols = COLUMNS[table]
+        return (key,) + tuple(record.get(c) for c in cols) + (json.dumps(record, ensure_ascii=False),)
+
+    def _upsert(self, conn, table, key, record):
+        cols = ("id",) + COLUMNS[table] + ("data",)
+        conn.execute(f"INSERT OR REPLACE INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                     self._row(table, key, record))
+
+    def load(self, table, default=dict):
+        # Whole-table reads are cached per version, like the JSON backend's parsed files
+        version = self.version(table)
+        with self.lock:
+            entry = self.cache.get(table)
+            if entry and entry[0] == version:
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+        data = {k: json.loads(v) for k, v in self._conn().execute(f"SELECT id, data FROM {table} ORDER BY rowid")}
+        with self.lock: self.cache[table] = (version, data)
+        return data
+
+    def save(self, table, data):
+        def replace(conn):
+            conn.execute(f"DELETE FROM {table}")
+            for key, record in data.items(): self._upsert(conn, table, key, record)
+            self._bump(conn, table)
+        self._transaction(replace)
+
+    def _write(self, table, key, fn):
+        def write(conn):
+            row = conn.execute(f"SELECT data FROM {table} WHERE id = ?", (key,)).fetchone()
+            old = json.loads(row[0]) if row else None
+            result = fn(conn, old)
+            if result is None: return None
+            old, new = result
+            before = self._version(conn, table)
+            if new is None: conn.execute(f"DELETE FROM {table} WHERE id = ?", (key,))
+            else: self._upsert(conn, table, key, new)
+            return old, new, before, self._bump(conn, table)
+        result = self._transaction(write)
+        if result is None: return None
+        old, new, before, after = result
+        if self.on_change: self.on_change(table, old, new, before, after)
+        return old, new
+
+    def get(self, table, key):
+        row = self._conn().execute(f"SELECT data FROM {table} WHERE id = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, table, key, record):
+        return self._write(table, key, lambda conn, old: (old, record))[0]
+
+    def update(self, table, key, changes):
+        return self._write(table, key, lambda conn, old: None if old is None else (old, {**old, **changes}))
+
+    def delete(self, table, key):
+        result = self._write(table, key, lambda conn, old: None if old is None else (old, None))
+        return result[0] if result else None
+
+    def modify(self, table, key, fn):
+        return self._write(table, key, lambda conn, old: (old, fn(old)))[1]
+
+    def purge(self, table, before):
+        def delete(conn):
+            n = conn.execute(f"DELETE FROM {table} WHERE updated_at < ?", (before,)).rowcount
+            if n: self._bump(conn, table)
+            return n
+        return self._transaction(delete)
+
+    def create(self, table, record, key=None, prefix=None):
+        # With a prefix, IDs like CLT001 are advanced until free; without one an existing key is a conflict
+        def insert(conn):
+            k = key
+            exists = lambda k: conn.execute(f"SELECT 1 FROM {table} WHERE id = ?", (k,)).fetchone()
+            if prefix:
+                k = k or f"{prefix}{str(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] + 1).zfill(3)}"
+                while exists(k): k = _next_id(k, prefix)
+            elif exists(k): return None
+            before = self._version(conn, table)
+            self._upsert(conn, table, k, record)
+            return k, before, self._bump(conn, table)
+        result = self._transaction(insert)
+        if result is None: return None
+        k, before, after = result
+        if self.on_change: self.on_change(table, None, record, before, after)
+        return k
+
+    def get_config(self):
+        # Read on every request, so parsed once per version like load()
+        version = self.version("config")
+        with self.lock:
+            entry = self.cache.get("config")
+            if entry and entry[0] == version:
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+        row = self._conn().execute("SELECT data FROM config WHERE id = 1").fetchone()
+        config = json.loads(row[0]) if row else None
+        with self.lock: self.cache["config"] = (version, config)
+        return config
+
+    def set_config(self, config):
+        def write(conn):
+            conn.execute("INSERT OR REPLACE INTO config (id, data) VALUES (1, ?)", (json.dumps(config, ensure_ascii=False),))
+            self._bump(conn, "config")
+        self._transaction(write)
+
+    def conversation_log(self, max_bytes=None, max_age_days=None):
+        return SQLiteConversationLog(self, max_bytes=max_bytes, max_age_days=max_age_days)
+
+    def is_migrated(self):
+        return self.version("migrated") > 0
+
+    def migrate_from(self, source):
+        # One-shot copy of every JSON file and the conversation log into the empty database
+        if self.is_migrated(): return False
+        convos = list(source.conversation_log())
+        config = source.get_config()
+        def copy(conn):
+            for table in RECORD_TABLES:
+                for key, record in source.load(table).items(): self._upsert(conn, table, key, record)
+                self._bump(conn, table)
+            if config is not None:
+                conn.execute("INSERT OR REPLACE INTO config (id, data) VALUES (1, ?)", (json.dumps(config, ensure_ascii=False),))
+                self._bump(conn, "config")
+            conn.executemany("INSERT INTO conversations (session_id, timestamp, language, sector, data) VALUES (?, ?, ?, ?, ?)",
+                             [SQLiteConversationLog.row(c) for c in convos])
+            self._bump(conn, "migrated")
+        self._transaction(copy)
+        return True
+
+class SQLiteConversationLog:
+    # Same interface as ConversationLog; positions are (0, last row id)
+    def __init__(self, store, max_bytes=None, max_age_days=None, retention_every=500):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.retention_every = retention_every
+
+    @staticmethod
+    def row(record):
+        return (record.get("session_id"), record.get("timestamp") or datetime.now().isoformat(),
+                record.get("language"), record.get("sector"), json.dumps(record, ensure_ascii=False))
+
+    def append(self, record):
+        conn = self.store._conn()
+        cur = conn.execute("INSERT INTO conversations (session_id, timestamp, language, sector, data) VALUES (?, ?, ?, ?, ?)", self.row(record))
+        if (self.max_bytes or self.max_age_days) and cur.lastrowid % self.retention_every == 0: self.enforce_retention()
+
+    def count(self):
+        return self.store._conn().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def tail(self, limit=100, skip=0):
+        rows = self.store._conn().execute("SELECT data FROM conversations ORDER BY id DESC LIMIT ? OFFSET ?", (limit, skip))
+        return [json.loads(d) for d, in rows]
+
+    def entries_from(self, position=(0, 0)):
+        rows = self.store._conn().execute("SELECT id, data FROM conversations WHERE id > ? ORDER BY id", (position[1],)).fetchall()
+        return [((0, rid), json.loads(d)) for rid, d in rows], ((0, rows[-1][0]) if rows else position)
+
+    def first_position(self):
+        first = self.store._conn().execute("SELECT MIN(id) FROM conversations").fetchone()[0]
+        return (0, first) if first is not None else None
+
+    def read_from(self, position=(0, 0)):
+        entries, pos = self.entries_from(position)
+        return [r for _, r in entries], pos
+
+    def get(self, positions):
+        ids = [rid for _, rid in positions]
+        found = {}
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            rows = self.store._conn().execute(f"SELECT id, data FROM conversations WHERE id IN ({', '.join('?' * len(batch))})", batch)
+            found.update((rid, json.loads(d)) for rid, d in rows)
+        return [found.get(rid) for rid in ids]
+
+    def __iter__(self):
+        for d, in self.store._conn().execute("SELECT data FROM conversations ORDER BY id"):
+            yield json.loads(d)
+
+    def enforce_retention(self):
+        conn = self.store._conn()
+        if self.max_age_days:
+            cutoff = (datetime.now() - timedelta(days=self.max_age_days)).isoformat()
+            conn.execute("DELETE FROM conversations WHERE timestamp < ?", (cutoff,))
+        if self.max_bytes:
+            excess = (conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM conversations").fetchone()[0] or 0) - self.max_bytes
+            if excess <= 0: return
+            dropped, last = 0, None
+            for rid, size in conn.execute("SELECT id, LENGTH(data) FROM conversations ORDER BY id"):
+                dropped, last = dropped + size, rid
+                if dropped >= excess: break
+            if last is not None: conn.execute("DELETE FROM conversations WHERE id <= ?", (last,))
+
+    def import_records(self, records):
+        self.store._conn().executemany("INSERT INTO conversations (session_id, timestamp, language, sector, data) VALUES (?, ?, ?, ?, ?)",
+                                       [self.row(r) for r in records])
+
+def make_store(backend, database, json_paths, conversation_dir, legacy_conversations=None):
+    source = JSONStore(json_paths, conversation_dir, legacy_conversations)
+    if backend != "sqlite": return source
+    store = SQLiteStore(database)
+    if store.migrate_from(source): print(f"Lucy AI: Migrated JSON data into {database}")
+    return store
@@ -0,0 +1,99 @@
+import secrets
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DEFAULT_TENANT = "default"
+
+_CURRENT = contextvars.ContextVar("lucy_tenant", default=None)
+
+def new_api_key():
+    return f"lucy-{secrets.token_hex(16)}"
+
+# ─── Tenants ─────────────────────────────────────────────────────────
+# A tenant is one customer: its own config, clients, appointments, sessions
+# and conversation log in its own store, plus everything derived from them
+# (record/KB indexes, prompt prefix, analytics) memoized per tenant. The
+# "default" tenant is the original single-tenant data and keeps using the
+# root store, so existing deployments carry on unchanged.
+
+class Tenant:
+    def __init__(self, tenant_id, store, analytics=None, conversation_index=None):
+        self.id = tenant_id
+        self.store = store
+        self.analytics = analytics
+        self.conversation_index = conversation_index
+        self.slots = {}
+        self.lock = threading.Lock()
+
+    def slot(self, name):
+        # A dict private to this tenant for one memoized value, e.g. {"key": ..., "index": ...}
+        with self.lock: return self.slots.setdefault(name, {})
+
+class TenantRegistry:
+    # Tenant records (id -> {"name", "api_key", ...}) live in the root store's "tenants"
+    # table. API keys are resolved through an in-memory map rebuilt when that table
+    # changes, and opened tenants are kept in an LRU so only hot tenants hold
+    # indexes and connections.
+
+    def __init__(self, root, open_tenant, max_hot=64):
+        self.root = root                # () -> root store; re-read so a swapped store is picked up
+        self.open_tenant = open_tenant  # tenant id -> Tenant
+        self.max_hot = max_hot
+        self.hot = OrderedDict()
+        self.keys = {"sig": None, "map": {}}
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+        self.lock = threading.RLock()
+
+    def _key_map(self):
+        root = self.root()
+        sig = (id(root), root.version("tenants"))
+        if self.keys["sig"] != sig:
+            self.keys = {"sig": sig, "map": {r["api_key"]: tid for tid, r in root.load("tenants").items() if r.get("api_key")}}
+        return self.keys["map"]
+
+    def lookup(self, api_key):
+        return self._key_map().get(api_key) if api_key else None
+
+    def exists(self, tenant_id):
+        return tenant_id == DEFAULT_TENANT or tenant_id in self.hot or self.root().get("tenants", tenant_id) is not None
+
+    def get(self, tenant_id):
+        with self.lock:
+            tenant = self.hot.get(tenant_id)
+            # The default tenant follows the root store if it is replaced
+            if tenant and not (tenant_id == DEFAULT_TENANT and tenant.store is not self.root()):
+                self.hot.move_to_end(tenant_id)
+                self.stats["hits"] += 1
+                return tenant
+            self.stats["misses"] += 1
+            tenant = self.hot[tenant_id] = self.open_tenant(tenant_id)
+            self.hot.move_to_end(tenant_id)
+            while len(self.hot) > self.max_hot:
+                evicted = next(k for k in self.hot if k != DEFAULT_TENANT)
+                del self.hot[evicted]
+                self.stats["evicted"] += 1
+            return tenant
+
+    def create(self, name, owner=None, api_key=None):
+        record = {"name": name, "owner": owner, "api_key": api_key or new_api_key()}
+        tenant_id = self.root().create("tenants", record, prefix="TEN")
+        return tenant_id, record
+
+    def set_api_key(self, tenant_id, api_key):
+        # False if another tenant already uses the key
+        owner = self.lookup(api_key)
+        if owner not in (None, tenant_id): return False
+        return self.root().update("tenants", tenant_id, {"api_key": api_key}) is not None
+
+    def current(self, fallback=None):
+        # A tenant entered with use() wins over the fallback (the request's tenant)
+        return _CURRENT.get() or fallback or self.get(DEFAULT_TENANT)
+
+    @contextmanager
+    def use(self, tenant):
+        # Makes `tenant` current for code running outside its request (threads, tenant setup)
+        token = _CURRENT.set(tenant)
+        try: yield tenant
+        finally: _CURRENT.reset(token)
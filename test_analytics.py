@@ -0,0 +1,28 @@
+import json
+import app as lucy
+from analytics import LatencyHistogram
+
+def test_histogram_percentiles():
+    hist = LatencyHistogram()
+    for ms in [40] * 50 + [900] * 45 + [4000] * 5: hist.add(ms)
+    assert (hist.percentile(50), hist.percentile(95), hist.percentile(99)) == (50, 1000, 5000)
+
+def test_analytics_tracks_crud_and_conversations(admin_client, data_dir, monkeypatch):
+    (data_dir / "clients.json").write_text(json.dumps({"CLT001": {"name": "Abebe", "status": "active"}}))
+    assert admin_client.get("/api/analytics").get_json()["total_clients"] == 1
+
+    loads = []
+    monkeypatch.setattr(lucy, "load_clients", lambda: loads.append(1) or lucy.STORE.load("clients"))
+    admin_client.post("/api/clients", json={"name": "Chala", "status": "active"})
+    admin_client.put("/api/clients/CLT001", json={"status": "inactive"})
+    lucy.append_conversation({"language": "am", "sector": "banking", "tokens": 12, "latency_ms": 800, "timestamp": "2026-10-18T10:00:00"})
+    lucy.append_conversation({"language": "om", "sector": "banking", "tokens": 3, "latency_ms": 120, "timestamp": "2026-10-18T11:00:00"})
+
+    loads.clear()
+    data = admin_client.get("/api/analytics").get_json()
+    assert (data["total_clients"], data["active_clients"]) == (2, 1)
+    assert data["total_conversations"] == 2 and data["total_tokens"] == 15
+    assert data["conversations_per_language"] == {"am": 1, "om": 1}
+    assert data["conversations_per_sector"] == {"banking": 2}
+    assert data["latency_ms"]["samples"] == 2
+    assert loads == []  # served from counters, no rescan of clients.json
@@ -0,0 +1,24 @@
+import pytest
+import app as lucy
+import bench
+
+@pytest.fixture(autouse=True)
+def restore_app(monkeypatch):
+    # bench.setup rewires the app's globals; put them back afterwards
+    for name in ("CLIENTS_FILE", "APPOINTMENTS_FILE", "CONVERSATIONS_FILE", "BOT_CONFIG_FILE", "USERS_FILE", "SESSIONS_FILE",
+                 "DATABASE_FILE", "TENANTS_FILE", "TENANTS_DIR", "CONVERSATION_LOG_DIR", "TENANTS", "RESPONSE_CACHE", "RATE_LIMITER",
+                 "USAGE_METER", "ANALYTICS", "CONVERSATION_INDEX", "STORE", "GEMINI_AVAILABLE", "GEMINI", "ASR", "TTS"):
+        monkeypatch.setattr(lucy, name, getattr(lucy, name))
+
+def test_small_run_reports_every_route():
+    result = bench.run(10, requests=40, concurrency=4, latency=0, speech_latency=0)
+    assert result["requests"] == 40 and set(result["routes"]) <= set(bench.MIX)
+    assert all(r["errors"] == 0 for r in result["routes"].values())
+    assert 0 < result["prompt_tokens"]["avg"] <= result["prompt_tokens"]["max"] <= 6000
+    assert bench.check([result], max_prompt_tokens=6000) == []
+
+def test_gates_flag_prompt_growth():
+    small = {"records": 10, "prompt_tokens": {"avg": 500, "max": 600}, "routes": {}}
+    large = {"records": 100000, "prompt_tokens": {"avg": 9000, "max": 12000}, "routes": {"support_faq": {"errors": 0, "p95_ms": 900}}}
+    failures = bench.check([small, large], max_prompt_tokens=6000, max_prompt_growth=1.5, max_p95_ms=500)
+    assert len(failures) == 3 and "prompt grew 18.0x" in failures[-1]
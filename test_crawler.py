@@ -0,0 +1,93 @@
+import time
+import pytest
+from crawler import Crawler, PageCache, canonicalize
+
+SITE = {
+    "https://gov.example/robots.txt": "User-agent: *\nDisallow: /private\nSitemap: https://gov.example/sitemap.xml",
+    "https://gov.example/sitemap.xml": "<urlset><url><loc>https://gov.example/tax</loc></url></urlset>",
+    "https://gov.example/": '<body><main>Home</main><a href="/tax/">Tax</a><a href="/id?utm_source=x">ID</a><a href="/private">P</a><a href="https://other.example/">Ext</a></body>',
+    "https://gov.example/tax": '<body><main>Pay your tax online</main><a href="/tax/forms">Forms</a></body>',
+    "https://gov.example/id": "<body><main>Renew your ID</main></body>",
+    "https://gov.example/slow": "<body><main>Slow</main></body>",
+}
+
+class FakeResponse:
+    def __init__(self, body, status_code=None, headers=None):
+        self.ok, self.text = body is not None, body or ""
+        self.status_code = status_code or (200 if self.ok else 404)
+        self.content = self.text.encode()
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if not self.ok: raise Exception("404 Not Found")
+
+class FakeSession:
+    requests = []
+
+    def get(self, url, timeout=None, headers=None):
+        if url.endswith("/slow"): time.sleep(0.5)
+        FakeSession.requests.append((url, headers or {}))
+        body = SITE.get(url)
+        etag = f'"{hash(body)}"'
+        if headers and headers.get("If-None-Match") == etag: return FakeResponse("", 304)
+        return FakeResponse(body, headers={"ETag": etag} if url.endswith("/tax") else {})
+
+def make(**kwargs):
+    crawler = Crawler(**kwargs)
+    crawler._session = lambda: FakeSession()
+    return crawler
+
+def test_canonicalize():
+    assert canonicalize("HTTPS://Gov.Example:443/tax/?b=2&a=1&utm_source=x#top") == "https://gov.example/tax?a=1&b=2"
+
+def test_discover_uses_sitemap_robots_and_dedup():
+    links, _ = make().discover("gov.example", max_depth=1)
+    assert links == ["https://gov.example/", "https://gov.example/id", "https://gov.example/tax"]
+
+def test_discover_goes_deeper_breadth_first():
+    links, _ = make().discover("gov.example", max_depth=2)
+    assert "https://gov.example/tax/forms" in links
+
+def test_discovery_fetches_share_the_time_budget(monkeypatch):
+    index = "<sitemapindex>" + "".join(f"<sitemap><loc>https://gov.example/sm{i}/slow</loc></sitemap>" for i in range(4)) + "</sitemapindex>"
+    monkeypatch.setitem(SITE, "https://gov.example/sitemap.xml", index)
+    timeouts = []
+    class TimedSession(FakeSession):
+        def get(self, url, timeout=None, headers=None):
+            if "robots" in url or "sm" in url: timeouts.append(timeout)
+            return super().get(url, timeout, headers)
+    crawler = make(time_budget=0.3)
+    crawler._session = lambda: TimedSession()
+    started = time.monotonic()
+    links, _ = crawler.discover("gov.example", max_depth=0)
+    # Stops following sitemaps once the budget is gone instead of fetching all four
+    assert time.monotonic() - started < 1.0 and links == ["https://gov.example/"]
+    assert 2 <= len(timeouts) < 5 and all(t <= 0.3 for t in timeouts)
+
+def test_fetch_pages_respects_time_budget():
+    results = {url: (text, error) for url, text, error in make(time_budget=0.2).fetch_pages(
+        ["gov.example/tax", "https://gov.example/tax/", "gov.example/slow"])}
+    assert results["https://gov.example/tax"] == ("Pay your tax online", None)
+    assert isinstance(results["https://gov.example/slow"][1], TimeoutError)
+    assert len(results) == 2
+
+def test_refetch_uses_conditional_get_and_content_hash(tmp_path, monkeypatch):
+    path = str(tmp_path / "pages.json")
+    urls = ["gov.example/tax", "gov.example/id"]
+    first = dict((u, t) for u, t, _ in make(cache=PageCache(path)).fetch_pages(urls))
+
+    FakeSession.requests = []
+    monkeypatch.setattr("crawler.extract_page_text", lambda html: pytest.fail("unchanged page was re-parsed"))
+    crawler = make(cache=PageCache(path))
+    assert dict((u, t) for u, t, _ in crawler.fetch_pages(urls)) == first
+    assert crawler.unchanged == {"https://gov.example/tax", "https://gov.example/id"}
+    sent = dict(FakeSession.requests)
+    assert "If-None-Match" in sent["https://gov.example/tax"] and not sent["https://gov.example/id"]
+
+def test_changed_page_is_reparsed(tmp_path, monkeypatch):
+    path = str(tmp_path / "pages.json")
+    list(make(cache=PageCache(path)).fetch_pages(["gov.example/id"]))
+    monkeypatch.setitem(SITE, "https://gov.example/id", "<body><main>Renew your ID at any office</main></body>")
+    crawler = make(cache=PageCache(path))
+    assert list(crawler.fetch_pages(["gov.example/id"])) == [("https://gov.example/id", "Renew your ID at any office", None)]
+    assert crawler.unchanged == set()
@@ -0,0 +1,45 @@
+import json
+import os
+import app as lucy
+from conversation_log import ConversationLog
+
+def test_load_is_cached_until_file_changes(data_dir):
+    path = data_dir / "clients.json"
+    path.write_text(json.dumps({"CLT001": {"name": "Abebe"}}))
+    assert lucy.load_clients() is lucy.load_clients()
+    assert lucy.STORE.stats == {"hits": 1, "misses": 1}
+
+    path.write_text(json.dumps({"CLT001": {"name": "Abebe"}, "CLT002": {"name": "Chala"}}))
+    os.utime(path, ns=(1, 1))
+    assert len(lucy.load_clients()) == 2
+    assert lucy.STORE.stats["misses"] == 2
+
+def test_save_writes_through_cache(data_dir):
+    lucy.save_appointments({"A101": {"name": "Abebe"}})
+    assert lucy.load_appointments() == {"A101": {"name": "Abebe"}}
+    assert lucy.STORE.stats == {"hits": 1, "misses": 0}
+
+def test_missing_file_returns_default(data_dir):
+    assert lucy.load_conversations() == []
+    assert lucy.load_clients() == {}
+
+def test_conversation_log_tail_pages_newest_first(tmp_path):
+    log = ConversationLog(str(tmp_path), segment_bytes=200)
+    for i in range(25): log.append({"n": i, "user_query": "q" * 20})
+    assert len(log.segments()) > 1
+    assert log.count() == 25
+    assert [r["n"] for r in log.tail(5)] == [24, 23, 22, 21, 20]
+    assert [r["n"] for r in log.tail(5, skip=18)] == [6, 5, 4, 3, 2]
+    assert [r["n"] for r in log] == list(range(25))
+
+def test_conversation_log_retention_drops_old_segments(tmp_path):
+    log = ConversationLog(str(tmp_path), segment_bytes=200, max_bytes=600)
+    for i in range(40): log.append({"n": i, "user_query": "q" * 20})
+    assert sum(os.path.getsize(tmp_path / f"{s:06d}.jsonl") for s in log.segments()) <= 800
+    assert log.tail(1)[0]["n"] == 39
+
+def test_legacy_conversations_are_imported(data_dir):
+    (data_dir / "conversations.json").write_text(json.dumps([{"user_query": "hi"}, {"user_query": "selam"}]))
+    assert [c["user_query"] for c in lucy.load_conversations()] == ["hi", "selam"]
+    lucy.append_conversation({"user_query": "new"})
+    assert lucy.get_conversation_log().tail(1)[0]["user_query"] == "new"
@@ -0,0 +1,50 @@
+import pytest
+import documents
+from documents import DocumentExtractor, parse_page_range
+
+def make_pdf(path, pages):
+    # Minimal PDF with one line of Helvetica text per page
+    objs = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objs.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {len(objs)} 0 R >>")
+        kids.append(f"{len(objs)} 0 R")
+    objs[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out, offsets = "%PDF-1.4\n", []
+    for i, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n" + "".join(f"{o:010d} 00000 n \n" for o in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    path.write_bytes(out.encode("latin-1"))
+    return str(path)
+
+def test_parse_page_range():
+    assert parse_page_range("", 3) == [0, 1, 2]
+    assert parse_page_range("2, 4-5, 9-", 10) == [1, 3, 4, 8, 9]
+    assert parse_page_range("3-100", 4) == [2, 3]
+    with pytest.raises(ValueError): parse_page_range("5-2", 10)
+
+def test_extracts_page_range_and_caches_by_hash(tmp_path, monkeypatch):
+    pdf = make_pdf(tmp_path / "policy.pdf", ["Page one", "Page two", "Page three"])
+    extractor = DocumentExtractor(str(tmp_path / "cache"), workers=1)
+    progress = []
+    assert extractor.extract(pdf, pages="2-3", on_progress=lambda d, t: progress.append((d, t))) == "Page two\nPage three"
+    assert progress == [(1, 2), (2, 2)]
+
+    # Same bytes under another name: served from the cache without opening the PDF
+    copy = tmp_path / "copy.pdf"
+    copy.write_bytes((tmp_path / "policy.pdf").read_bytes())
+    monkeypatch.setattr(documents.pypdf, "PdfReader", lambda path: pytest.fail("cache miss"))
+    assert extractor.extract(str(copy), pages="2-3") == "Page two\nPage three"
+
+def test_large_pdf_pages_run_in_process_pool_in_order(tmp_path):
+    pdf = make_pdf(tmp_path / "manual.pdf", [f"Section {i}" for i in range(1, 8)])
+    extractor = DocumentExtractor(str(tmp_path / "cache"), workers=2, parallel_min_pages=4, batch_pages=2)
+    chunks = list(extractor.iter_chunks(pdf))
+    assert [c.strip() for c in chunks] == [f"Section {i}" for i in range(1, 8)]
+    assert extractor.pool is not None
+    extractor.pool.shutdown()
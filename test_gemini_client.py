@@ -0,0 +1,116 @@
+import time
+import pytest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from gemini_client import GeminiClient, GeminiBusy
+
+class FakeModel:
+    def __init__(self, name, generation_config=None):
+        self.name, self.calls, self.failures, self.cached_content = name, [], 0, None
+
+    def generate_content(self, prompt, request_options=None, stream=False):
+        self.calls.append(request_options["timeout"])
+        if self.failures:
+            self.failures -= 1
+            raise TimeoutError("upstream slow")
+        cached = len(self.cached_content.system_instruction) // 4 if self.cached_content else 0
+        usage = SimpleNamespace(total_token_count=len(prompt) // 4 + cached, cached_content_token_count=cached)
+        return SimpleNamespace(text=f"reply to {prompt}", usage_metadata=usage)
+
+    @classmethod
+    def from_cached_content(cls, cached_content, generation_config=None):
+        model = cls(f"cached:{cached_content.display_name}")
+        model.cached_content = cached_content
+        if cached_content.broken: model.generate_content = lambda *a, **k: (_ for _ in ()).throw(LookupError("cache gone"))
+        return model
+
+class FakeCachedContent:
+    # Stands in for genai.caching.CachedContent: a shared server-side list
+    server = []
+
+    def __init__(self, display_name, system_instruction, ttl):
+        self.display_name, self.system_instruction, self.broken = display_name, system_instruction, False
+        self.expire_time = datetime.now(timezone.utc) + ttl
+
+    @classmethod
+    def create(cls, model, display_name, system_instruction, ttl):
+        if len(system_instruction) < 10: raise ValueError("cached content is too small")
+        cls.server.append(cls(display_name, system_instruction, ttl))
+        return cls.server[-1]
+
+    @classmethod
+    def list(cls): return list(cls.server)
+
+    def delete(self): self.server.remove(self)
+
+fake_genai = SimpleNamespace(GenerativeModel=FakeModel, types=SimpleNamespace(GenerationConfig=lambda temperature: None),
+                             caching=SimpleNamespace(CachedContent=FakeCachedContent))
+
+@pytest.fixture(autouse=True)
+def empty_server():
+    FakeCachedContent.server = []
+
+def test_models_are_reused_per_name_and_temperature():
+    client = GeminiClient(fake_genai)
+    assert client.model("m", 0.7) is client.model("m", "0.7")
+    assert client.model("m", 0.2) is not client.model("m", 0.7)
+
+def test_transient_errors_are_retried_within_deadline():
+    client = GeminiClient(fake_genai, retries=2, backoff=0.001, timeout=5)
+    client.model("m", 0.7).failures = 2
+    assert client.generate("hi", "m", 0.7).text == "reply to hi"
+    assert client.stats["retries"] == 2
+    assert all(0 < t <= 5 for t in client.model("m", 0.7).calls)
+
+def test_concurrency_cap_rejects_when_saturated():
+    client = GeminiClient(fake_genai, max_in_flight=1, queue_timeout=0.01)
+    client.model("m", 0.7).generate_content = lambda *a, **k: iter(["chunk"])
+    stream = client.stream("hi", "m", 0.7)
+    assert next(stream) == "chunk"
+    with pytest.raises(GeminiBusy):
+        client.generate("again", "m", 0.7)
+    stream.close()
+    assert client.generate("again", "m", 0.7)
+
+def test_cached_prefix_sends_only_the_suffix():
+    client = GeminiClient(fake_genai)
+    reply = client.generate("PREFIX long instructions\nquery", "m", 0.7, prefix="PREFIX long instructions", suffix="query", context_ttl=600)
+    assert reply.text == "reply to query"
+    assert len(FakeCachedContent.server) == 1 and client.stats["context_created"] == 1
+    client.generate("PREFIX long instructions\nagain", "m", 0.7, prefix="PREFIX long instructions", suffix="again", context_ttl=600)
+    assert client.stats["context_hits"] == 2 and len(FakeCachedContent.server) == 1
+
+    # A second worker finds the cache by its display name instead of creating another
+    other = GeminiClient(fake_genai)
+    other.generate("x", "m", 0.7, prefix="PREFIX long instructions", suffix="q", context_ttl=600)
+    assert len(FakeCachedContent.server) == 1
+
+def test_found_context_keeps_its_server_expiry():
+    # Another worker's cache has 200s left: refresh against that, not against a fresh TTL
+    client = GeminiClient(fake_genai)
+    FakeCachedContent.create("m", client.context_key("m", "PREFIX long instructions"), "PREFIX long instructions", timedelta(seconds=200))
+    client.generate("x", "m", 0.7, prefix="PREFIX long instructions", suffix="q", context_ttl=3600)
+    left = next(iter(client.contexts.values()))["expires"] - time.monotonic()
+    assert len(FakeCachedContent.server) == 1 and 130 < left <= 140
+
+def test_falls_back_to_plain_prompt():
+    client = GeminiClient(fake_genai)
+    # Too small to cache: plain prompt, and no retry until the back-off passes
+    assert client.generate("full", "m", 0.7, prefix="tiny", suffix="q", context_ttl=600).text == "reply to full"
+    assert client.generate("full", "m", 0.7, prefix="tiny", suffix="q", context_ttl=600).text == "reply to full"
+    assert client.stats["context_created"] == 0
+
+    # Cache rejected upstream: dropped, and the request is answered from the full prompt
+    client.generate("full", "m", 0.7, prefix="PREFIX long instructions", suffix="q", context_ttl=600)
+    FakeCachedContent.server[0].broken = True
+    client.contexts.clear()
+    assert client.generate("full", "m", 0.7, prefix="PREFIX long instructions", suffix="q", context_ttl=600).text == "reply to full"
+    assert client.stats["context_fallbacks"] == 1 and FakeCachedContent.server == []
+
+def test_evicted_contexts_are_kept_upstream_and_reused():
+    client = GeminiClient(fake_genai, max_contexts=2)
+    for i in range(3): client.generate("p", "m", 0.7, prefix=f"knowledge base v{i}", suffix="q", context_ttl=600)
+    assert len(client.contexts) == 2 and len(FakeCachedContent.server) == 3
+    # The tenant whose handle fell out of the LRU finds its cache again instead of paying for a new one
+    client.generate("p", "m", 0.7, prefix="knowledge base v0", suffix="q", context_ttl=600)
+    assert len(FakeCachedContent.server) == 3 and client.stats["context_hits"] == 4
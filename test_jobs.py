@@ -0,0 +1,99 @@
+import io
+import os
+import time
+import app as lucy
+from jobs import JobQueue
+
+def wait_for(get, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = get(job_id)
+        if job["status"] in ("done", "failed"): return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+def test_job_reports_progress_and_result(tmp_path):
+    queue = JobQueue(str(tmp_path))
+    def work(job):
+        job.progress(total=2)
+        for i in range(2): job.progress(done=i + 1, partial=i)
+        return "ok"
+    job = wait_for(queue.get, queue.submit("demo", work).id)
+    assert job["result"] == "ok" and job["partial"] == [0, 1] and job["progress"] == {"done": 2, "total": 2}
+
+def test_failed_job_visible_from_another_process(tmp_path):
+    queue = JobQueue(str(tmp_path))
+    job_id = queue.submit("demo", lambda job: 1 / 0).id
+    wait_for(queue.get, job_id)
+    other = JobQueue(str(tmp_path))
+    assert other.get(job_id)["status"] == "failed"
+    assert "division" in other.get(job_id)["error"]
+
+def test_partial_output_is_appended_not_rewritten(tmp_path):
+    queue = JobQueue(str(tmp_path), persist_every=0)
+    sizes = []
+    def work(job):
+        for i in range(200):
+            job.progress(done=i + 1, partial=f"page {i}")
+            sizes.append(os.path.getsize(queue._path(job.id)))
+    job_id = wait_for(queue.get, queue.submit("demo", work).id)["id"]
+    # Every persist rewrites only the small state file, however much output came before
+    assert max(sizes) < 1000
+    other = JobQueue(str(tmp_path))
+    assert len(other.get(job_id)["partial"]) == 200
+    assert other.get(job_id, since=198)["partial"] == ["page 198", "page 199"]
+
+def test_scrape_pages_returns_job(admin_client, monkeypatch):
+    pages = [("https://gov.example/a", "Alpha", None), ("https://gov.example/b", None, Exception("404"))]
+    monkeypatch.setattr(lucy.Crawler, "fetch_pages", lambda self, urls: iter(pages))
+    res = admin_client.post("/api/scrape-pages", json={"urls": ["gov.example/a", "gov.example/b"]})
+    assert res.status_code == 202
+    job = wait_for(lambda i: admin_client.get(f"/api/jobs/{i}").get_json(), res.get_json()["job_id"])
+    assert job["result"]["count"] == 1 and "Alpha" in job["result"]["text"]
+    assert job["errors"] == ["https://gov.example/b: 404"]
+    assert admin_client.get(f"/api/jobs/{job['id']}?since=1").get_json()["partial"] == []
+
+def test_upload_extracts_in_background(admin_client, data_dir, monkeypatch):
+    monkeypatch.setitem(lucy.app.config, "UPLOAD_FOLDER", str(data_dir))
+    res = admin_client.post("/api/upload", data={"file": (io.BytesIO(b"Branch hours: 8-5\n"), "faq.txt")})
+    assert res.status_code == 202
+    job = wait_for(lambda i: admin_client.get(f"/api/jobs/{i}").get_json(), res.get_json()["job_id"])
+    assert job["result"] == {"filename": "faq.txt", "extracted_text": "Branch hours: 8-5"}
+
+def test_uploads_never_share_a_path(admin_client, data_dir, monkeypatch):
+    monkeypatch.setitem(lucy.app.config, "UPLOAD_FOLDER", str(data_dir / "uploads"))
+    upload = lambda body, name: admin_client.post("/api/upload", data={"file": (io.BytesIO(body), name)}).get_json()["job_id"]
+    first, second = upload(b"First document", "faq.txt"), upload(b"Second document", "faq.txt")
+    escape = upload(b"Sneaky", "../../escape.txt")
+    jobs = [wait_for(lambda i: admin_client.get(f"/api/jobs/{i}").get_json(), j) for j in (first, second, escape)]
+    assert [j["result"]["extracted_text"] for j in jobs] == ["First document", "Second document", "Sneaky"]
+    # Files stay inside the tenant's folder and are removed once extracted
+    assert not (data_dir / "escape.txt").exists() and list((data_dir / "uploads" / "default").iterdir()) == []
+
+def test_upload_streams_pages_to_pollers(admin_client, data_dir, monkeypatch):
+    from test_documents import make_pdf
+    monkeypatch.setitem(lucy.app.config, "UPLOAD_FOLDER", str(data_dir / "uploads"))
+    pdf = make_pdf(data_dir / "policy.pdf", ["Page one", "Page two", "Page three"])
+    with open(pdf, "rb") as f:
+        job_id = admin_client.post("/api/upload", data={"file": (f, "policy.pdf"), "pages": "1-2"}).get_json()["job_id"]
+    job = wait_for(lambda i: admin_client.get(f"/api/jobs/{i}").get_json(), job_id)
+    assert [p.strip() for p in job["partial"]] == ["Page one", "Page two"]
+    assert job["result"]["extracted_text"] == "Page one\nPage two"
+    assert [p.strip() for p in admin_client.get(f"/api/jobs/{job_id}?since=1").get_json()["partial"]] == ["Page two"]
+
+def test_inline_jobs_finish_before_submit_returns(admin_client, data_dir, monkeypatch):
+    monkeypatch.setattr(lucy, "JOBS", JobQueue(str(data_dir / "jobs"), inline=True))
+    monkeypatch.setitem(lucy.app.config, "UPLOAD_FOLDER", str(data_dir / "uploads"))
+    res = admin_client.post("/api/upload", data={"file": (io.BytesIO(b"Branch hours: 8-5\n"), "faq.txt")})
+    body = res.get_json()
+    assert res.status_code == 200 and body["status"] == "done" and body["job_id"] == body["id"]
+    assert body["result"] == {"filename": "faq.txt", "extracted_text": "Branch hours: 8-5"}
+
+def test_failed_extraction_fails_the_job(admin_client, data_dir, monkeypatch):
+    monkeypatch.setitem(lucy.app.config, "UPLOAD_FOLDER", str(data_dir / "uploads"))
+    res = admin_client.post("/api/upload", data={"file": (io.BytesIO(b"%PDF-1.4 truncated"), "broken.pdf")})
+    job = wait_for(lambda i: admin_client.get(f"/api/jobs/{i}").get_json(), res.get_json()["job_id"])
+    assert job["status"] == "failed" and job["error"] and job["result"] is None
+    assert list((data_dir / "uploads" / "default").iterdir()) == []
+    assert admin_client.get(f"/api/jobs/{job['id']}?since=abc").status_code == 400
+    assert admin_client.get(f"/api/jobs/{job['id']}?since=-1").status_code == 400
@@ -0,0 +1,70 @@
+import app as lucy
+from prompt import Prompt, Section, fit_lines
+from retrieval import estimate_tokens
+
+HEADERS = {"X-API-KEY": "test-key"}
+
+def sections(history_lines=50, kb_lines=50):
+    return [
+        Section("core", "CORE: ", "Be polite. " * 20),
+        Section("knowledge_base", "KB:\n", "\n".join(f"kb fact {i} " * 5 for i in range(kb_lines)), priority=20, floor=40),
+        Section("history", "HISTORY:\n", "\n".join(f"user: turn {i}" for i in range(history_lines)), priority=10, keep="tail"),
+        Section("query", "QUERY: ", "hello"),
+    ]
+
+def test_under_budget_is_untouched():
+    prompt = Prompt(sections(2, 2), budget=5000)
+    assert prompt.truncated == {}
+    assert prompt.metrics()["sections"]["history"] == estimate_tokens("HISTORY:\nuser: turn 0\nuser: turn 1")
+
+def test_lowest_priority_is_trimmed_first_and_keeps_recent_history():
+    full = Prompt(sections()).total_tokens
+    prompt = Prompt(sections(), budget=full - 100)
+    assert list(prompt.truncated) == ["history"]
+    assert prompt.total_tokens <= full - 100
+    history = prompt.sections[2].body
+    assert history.endswith("turn 49") and "turn 0\n" not in history
+
+def test_floors_and_fixed_sections_hold():
+    prompt = Prompt(sections(), budget=50)
+    assert set(prompt.truncated) == {"history", "knowledge_base"}
+    assert prompt.sections[0].body == "Be polite. " * 20
+    assert 0 < prompt.metrics()["sections"]["knowledge_base"] <= 40
+
+def test_fit_lines_cuts_an_oversized_line():
+    assert fit_lines("x" * 100, 5) == "x" * 20
+
+def test_prompt_metrics_reach_log_and_analytics(admin_client, monkeypatch):
+    monkeypatch.setattr(lucy, "call_gemini", lambda p, l: {"reply": "ok", "usage": {"total_tokens": 2}})
+    admin_client.post("/api/support", headers=HEADERS, json={"user_query": "hi"})
+    metrics = lucy.get_conversation_log().tail(1)[0]["prompt"]
+    assert metrics["budget"] == 6000 and metrics["total"] > 0
+    assert {"core", "knowledge_base", "history", "query"} <= set(metrics["sections"])
+    stats = admin_client.get("/api/analytics").get_json()["prompt_tokens"]
+    assert stats["prompts"] == 1 and stats["avg_total"] == metrics["total"]
+
+def test_large_knowledge_base_is_sent_as_cached_prefix(client, monkeypatch):
+    from test_gemini_client import fake_genai, FakeCachedContent
+    monkeypatch.setattr(lucy, "GEMINI_AVAILABLE", True)
+    monkeypatch.setattr(lucy, "GEMINI", lucy.GeminiClient(fake_genai))
+    monkeypatch.setattr(FakeCachedContent, "server", [])
+    config = lucy.load_config()
+    config["knowledge_base"] = "\n".join(f"Office {i} opens at 8:30." for i in range(400))
+    lucy.save_config(config)
+    body = client.post("/api/support", headers=HEADERS, json={"user_query": "When do you open?"}).get_json()
+    reply = body["reply"]
+    assert body["usage"]["cached_tokens"] > 1000
+    assert reply.startswith("reply to CLIENT DATABASE:") and "KNOWLEDGE BASE" not in reply
+    assert "Office 399 opens" in FakeCachedContent.server[0].system_instruction
+
+    config["context_cache_ttl"] = 0
+    lucy.save_config(config)
+    reply = client.post("/api/support", headers=HEADERS, json={"user_query": "When do you close?"}).get_json()["reply"]
+    assert reply.startswith("reply to CORE INSTRUCTIONS")
+
+    # Knowledge bases over the cap keep top-k retrieval instead of riding along whole
+    config.update(context_cache_ttl=3600, context_cache_max_tokens=2000)
+    lucy.save_config(config)
+    body = client.post("/api/support", headers=HEADERS, json={"user_query": "Is office 7 open?"}).get_json()
+    assert "cached_tokens" not in body["usage"] and body["reply"].startswith("reply to CORE INSTRUCTIONS")
+    assert "Office 399 opens" not in body["reply"] and len(FakeCachedContent.server) == 1
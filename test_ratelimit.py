@@ -0,0 +1,30 @@
+import pytest
+from ratelimit import RateLimiter, MemoryBackend, SQLiteBackend
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    return MemoryBackend(evict_every=1) if request.param == "memory" else SQLiteBackend(str(tmp_path / "rl.db"), evict_every=1)
+
+def test_limit_enforced_within_window(backend):
+    limiter = RateLimiter(backend, limit=3, window=60)
+    results = [limiter.check("k", now=10)[0] for _ in range(4)]
+    assert results == [True, True, True, False]
+    allowed, headers = limiter.check("k", now=10)
+    assert not allowed and int(headers["Retry-After"]) > 0
+    assert headers["X-RateLimit-Remaining"] == "0"
+    assert limiter.check("other", now=10)[0]
+
+def test_previous_window_slides_out(backend):
+    limiter = RateLimiter(backend, limit=4, window=60)
+    for _ in range(4): limiter.check("k", now=50)
+    # Just after the boundary almost all of the previous window still counts
+    assert [limiter.check("k", now=61)[0] for _ in range(2)] == [True, False]
+    # Near the end of the next window only ~17% of it remains
+    assert [limiter.check("k", now=110)[0] for _ in range(4)] == [True, True, True, False]
+
+def test_idle_keys_are_evicted():
+    backend = MemoryBackend(evict_every=1)
+    limiter = RateLimiter(backend, limit=5, window=60)
+    limiter.check("idle", now=0)
+    limiter.check("busy", now=500)
+    assert "idle" not in backend.counters
@@ -0,0 +1,62 @@
+import json
+from retrieval import RecordIndex, BM25Index, chunk_text, render_records, estimate_tokens
+
+CLIENTS = {
+    "CLT001": {"name": "Abebe Balcha", "status": "active"},
+    "CLT002": {"name": "Chala Guteta", "status": "active"},
+    "CLT003": {"name": "Abebe Kebede", "status": "inactive"},
+}
+APPTS = {
+    "A101": {"client_id": "CLT001", "name": "Abebe Balcha", "appointment": "2026-02-15 10:00 AM"},
+    "B202": {"client_id": "CLT002", "name": "Chala Guteta", "appointment": "2026-02-20 02:30 PM"},
+}
+
+def test_lookup_by_id_pulls_linked_records():
+    clients, appts = RecordIndex(CLIENTS, APPTS).lookup("My ID is a101")
+    assert list(appts) == ["A101"]
+    assert list(clients) == ["CLT001"]
+
+def test_lookup_by_fuzzy_full_name():
+    clients, appts = RecordIndex(CLIENTS, APPTS).lookup("I am Chala Gutetta, where is my booking?")
+    assert list(clients) == ["CLT002"]
+    assert "B202" in appts
+
+def test_first_name_alone_does_not_match():
+    clients, appts = RecordIndex(CLIENTS, APPTS).lookup("Hi, this is Abebe")
+    assert clients == {} and appts == {}
+
+def test_render_records_respects_budget():
+    big = {f"CLT{i:03d}": {"name": "x" * 200} for i in range(50)}
+    out, used = render_records(big, 300)
+    assert used <= 300
+    assert estimate_tokens(out) <= 300
+    assert 0 < len(json.loads(out)) < 50
+
+KB = """Lucy AI provides multilingual support.
+
+--- Source: https://bank.example/password ---
+To reset your bank password open the mobile app and tap Forgot Password.
+You will receive an SMS code.
+
+--- Source: https://telecom.example/topup ---
+Top up airtime by dialing *805# and following the prompts."""
+
+def test_chunk_text_tags_sources():
+    chunks = chunk_text(KB, chunk_size=20)
+    assert [c["source"] for c in chunks] == ["", "https://bank.example/password", "https://telecom.example/topup"]
+    assert chunks[1]["text"].startswith("[https://bank.example/password]")
+
+def test_chunk_text_splits_long_paragraphs():
+    chunks = chunk_text(" ".join(["word"] * 45), chunk_size=20)
+    assert [len(c["text"].split()) for c in chunks] == [20, 20, 5]
+
+def test_bm25_returns_relevant_chunk():
+    index = BM25Index(chunk_text(KB, chunk_size=20))
+    hits = index.search("how do I reset my password", k=1)
+    assert hits[0]["source"] == "https://bank.example/password"
+
+def test_bm25_reuses_unchanged_chunks():
+    old = BM25Index(chunk_text(KB, chunk_size=20))
+    new = BM25Index(chunk_text(KB + "\n\n--- Source: https://bank.example/loans ---\nApply for loans in any branch.", chunk_size=20), previous=old)
+    assert new.stats == {"reused": len(old.chunks), "indexed": 1}
+    assert new.search("loans", k=1)[0]["text"].endswith("any branch.")
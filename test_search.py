@@ -0,0 +1,67 @@
+import app as lucy
+from conversation_log import ConversationLog
+from search import ConversationIndex, terms
+
+def test_geez_terms_fold_homophones_and_proclitics():
+    assert list(terms("ሠላም")) == list(terms("ሰላም"))
+    assert "ባንክ" in terms("በባንክ")
+    assert list(terms("Refunds, please")) == ["refunds", "please"]
+
+def fill(log):
+    rows = [("s1", "am", "banking", "2026-10-01", "ሠላም የባንክ ሂሳቤን እንዴት እከፍታለሁ?"),
+            ("s2", "en", "telecom", "2026-10-05", "How do I top up airtime?"),
+            ("s1", "am", "banking", "2026-10-10", "Refunds for card payments"),
+            ("s3", "om", "banking", "2026-10-15", "Akkaataa herrega banankaa itti banuu")]
+    for sid, lang, sector, day, query in rows:
+        log.append({"session_id": sid, "language": lang, "sector": sector, "timestamp": f"{day}T09:00:00",
+                    "user_query": query, "bot_reply": "ok"})
+
+def test_search_filters_and_prefix_match(tmp_path):
+    log = ConversationLog(str(tmp_path))
+    fill(log)
+    index = ConversationIndex()
+    page = lambda **kw: [c["user_query"] for c in index.page(log, **kw)[0]]
+    assert page(query="ሰላም ባንክ") == ["ሠላም የባንክ ሂሳቤን እንዴት እከፍታለሁ?"]
+    assert page(query="refund") == ["Refunds for card payments"]
+    assert len(page(session_id="s1")) == 2
+    assert len(page(sector="banking", since="2026-10-05", until="2026-10-12")) == 1
+    assert page(language="en", query="airtime") == ["How do I top up airtime?"]
+
+def test_cursor_pages_newest_first_across_appends(tmp_path):
+    log = ConversationLog(str(tmp_path), segment_bytes=300)
+    for i in range(7): log.append({"n": i, "user_query": f"question {i}"})
+    index = ConversationIndex()
+    first, cursor = index.page(log, limit=3, query="question")
+    log.append({"n": 7, "user_query": "question 7"})
+    second, cursor = index.page(log, limit=3, cursor=cursor, query="question")
+    third, last = index.page(log, limit=3, cursor=cursor, query="question")
+    assert [c["n"] for c in first + second + third] == [6, 5, 4, 3, 2, 1, 0]
+    assert last is None
+
+def test_conversations_route_cursor(admin_client):
+    fill(lucy.get_conversation_log())
+    res = admin_client.get("/api/conversations?sector=banking&limit=2")
+    assert [c["session_id"] for c in res.get_json()] == ["s3", "s1"]
+    res = admin_client.get(f"/api/conversations?sector=banking&limit=2&cursor={res.headers['X-Next-Cursor']}")
+    assert [c["timestamp"][:10] for c in res.get_json()] == ["2026-10-01"]
+    assert "X-Next-Cursor" not in res.headers
+    assert admin_client.get("/api/conversations?cursor=bogus").status_code == 400
+
+def test_pages_stop_early_and_retention_is_pruned(tmp_path):
+    log = ConversationLog(str(tmp_path), segment_bytes=200, max_bytes=400)
+    for i in range(8): log.append({"n": i, "user_query": f"question {i}", "timestamp": f"2026-10-{i + 1:02d}T09:00:00"})
+    index = ConversationIndex()
+    index.catch_up(log)
+    oldest = log.first_position()
+    assert oldest > (1, 0) and index.positions[0] == oldest  # retention already dropped segments
+    assert len(index.matches(query="question", limit=3)) == 3
+    assert index.matches(since="2026-10-07", until="2026-10-07") == [index.positions[-2]]
+
+    for i in range(8, 16): log.append({"n": i, "user_query": f"question {i}", "timestamp": f"2026-10-{i + 1:02d}T09:00:00"})
+    records, _ = index.page(log, limit=50, query="question")
+    assert index.positions[0] == log.first_position() and len(index.positions) == len(records)
+    assert all(docs[0] >= index.base for docs in index.postings.values())
+
+def test_conversations_route_rejects_bad_paging(admin_client):
+    assert admin_client.get("/api/conversations?limit=ten").status_code == 400
+    assert admin_client.get("/api/conversations?search=x&offset=-1").status_code == 400
@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+import socket
+import subprocess
+import pytest
+import requests
+from serve import server_mode
+
+def test_flag_and_env_pick_the_mode():
+    assert server_mode([], {}) == "sync"
+    assert server_mode([], {"SERVER_MODE": "ASYNC"}) == "async"
+    assert server_mode(["--sync"], {"SERVER_MODE": "async"}) == "sync"
+    with pytest.raises(SystemExit):
+        server_mode([], {"SERVER_MODE": "trio"})
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def test_async_server_serves_requests_and_jobs(tmp_path):
+    pytest.importorskip("gevent")
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), SPEECH_BACKEND="stub", PDF_WORKERS="1")
+    # Own process and working directory: monkey-patching must not leak into the test run
+    server = subprocess.Popen([sys.executable, os.path.abspath("serve.py"), "--async"], cwd=tmp_path, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base, http = f"http://127.0.0.1:{port}", requests.Session()
+    try:
+        for _ in range(200):
+            try:
+                if http.get(f"{base}/api/widget-config", timeout=1).status_code == 200: break
+            except requests.ConnectionError: time.sleep(0.05)
+        else: pytest.fail("async server did not start")
+        assert http.post(f"{base}/api/signup", json={"email": "a@example.com", "password": "pw"}).status_code == 200
+        job_id = http.post(f"{base}/api/upload", files={"file": ("faq.txt", b"Open 8-5")}).json()["job_id"]
+        for _ in range(200):
+            job = http.get(f"{base}/api/jobs/{job_id}").json()
+            if job["status"] in ("done", "failed"): break
+            time.sleep(0.05)
+        assert job["result"]["extracted_text"] == "Open 8-5"
+    finally:
+        server.terminate()
+        server.wait(10)
@@ -0,0 +1,57 @@
+import app as lucy
+from sessions import SessionMemory
+import os
+import json
+from storage import SQLiteStore, JSONStore
+
+HEADERS = {"X-API-KEY": "test-key"}
+
+def test_window_and_rolling_summary(tmp_path):
+    memory = SessionMemory(SQLiteStore(str(tmp_path / "lucy.db")), window_turns=2, summary_chars=80)
+    for i in range(5): memory.record("s1", f"question {i}", f"answer {i}")
+    state = memory.get("s1")
+    assert [t["user"] for t in state["turns"]] == ["question 3", "question 4"]
+    assert state["turn_count"] == 5 and len(state["summary"]) <= 80
+    assert "question 2" in state["summary"] and "question 0" not in state["summary"]
+    context = memory.context("s1")
+    assert context.startswith("Summary of earlier conversation:") and context.endswith("assistant: answer 4")
+
+def test_expired_session_starts_over(tmp_path):
+    memory = SessionMemory(SQLiteStore(str(tmp_path / "lucy.db")), ttl_days=1)
+    memory.record("s1", "hi", "selam")
+    memory.store.modify("sessions", "s1", lambda s: dict(s, updated_at=0))
+    assert memory.context("s1") == ""
+    assert memory.record("s1", "again", "ok")["turn_count"] == 1
+    assert memory.store.purge("sessions", before=10 ** 12) == 1
+
+def test_json_turn_writes_do_not_grow_with_sessions(tmp_path):
+    (tmp_path / "sessions.json").write_text(json.dumps({"old": {"summary": "", "turns": [], "turn_count": 1, "updated_at": 1}}))
+    memory = SessionMemory(JSONStore({"sessions": str(tmp_path / "sessions.json")}, str(tmp_path / "log")), ttl_days=0)
+    assert memory.get("old")["turn_count"] == 1
+    for i in range(200): memory.record(f"s{i}", "question", "answer")
+    directory = tmp_path / "sessions"
+    before = {p.name: (p.stat().st_mtime_ns, p.stat().st_size) for p in directory.iterdir()}
+    memory.record("s7", "again", "ok")
+    changed = [p for p in directory.iterdir() if (p.stat().st_mtime_ns, p.stat().st_size) != before.get(p.name)]
+    # One small file per turn, however many sessions there are
+    assert len(before) == 201 and len(changed) == 1 and changed[0].stat().st_size < 1000
+    assert memory.get("s7")["turn_count"] == 2 and len(memory.store.load("sessions")) == 201
+    assert memory.store.purge("sessions", before=10) == 1 and len(os.listdir(directory)) == 200
+
+def test_support_keeps_history_server_side(client, monkeypatch):
+    prompts = []
+    def fake_call(prompt, language):
+        prompts.append(prompt)
+        return {"reply": f"reply {len(prompts)}", "usage": {"total_tokens": 3}}
+    monkeypatch.setattr(lucy, "call_gemini", fake_call)
+    first = client.post("/api/support", headers=HEADERS, json={"user_query": "My name is Abebe"})
+    session_id = first.get_json()["session_id"]
+    assert first.headers["X-Session-Id"] == session_id
+    client.post("/api/support", headers=HEADERS, json={"user_query": "What is my name?", "session_id": session_id})
+    assert "user: My name is Abebe\nassistant: reply 1" in prompts[1]
+    assert "My name is Abebe" not in prompts[0].split("USER QUERY")[0]
+
+def test_error_replies_are_not_remembered(client, monkeypatch):
+    monkeypatch.setattr(lucy, "call_gemini", lambda p, l: {"reply": "Gemini Error: boom", "usage": {"tokens": 0}})
+    client.post("/api/support", headers=HEADERS, json={"user_query": "hi", "session_id": "s9"})
+    assert lucy.get_session_memory(lucy.load_config()).get("s9") is None
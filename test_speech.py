@@ -0,0 +1,108 @@
+import io
+import wave
+import pytest
+import app as lucy
+import speech
+from speech import AudioCache, SpeechToText, StubSpeech, TextToSpeech, normalize_wav, split_sentences
+
+def frames(data):
+    with wave.open(io.BytesIO(data), "rb") as w: return w.getnframes()
+
+def test_split_sentences_on_ethiopic_punctuation():
+    text = "ሰላም። እንኳን ደህና መጡ ወደ ሉሲ የደንበኞች አገልግሎት። ቀጠሮዎን ለመቀየር መቼ ይፈልጋሉ? እሺ። " + "ረጅም " * 100
+    chunks = split_sentences(text, max_chars=120)
+    assert chunks[0] == "ሰላም። እንኳን ደህና መጡ ወደ ሉሲ የደንበኞች አገልግሎት።"
+    assert chunks[1] == "ቀጠሮዎን ለመቀየር መቼ ይፈልጋሉ? እሺ።"  # short fragments are merged
+    assert all(len(c) <= 120 for c in chunks) and len(chunks) > 3
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=250)
+    for i in range(3): cache.put(f"k{i}", b"x" * 100)
+    assert cache.get("k0") is None and cache.get("k2") == b"x" * 100
+    assert cache.stats["evicted"] == 1 and cache.size <= 250
+
+def test_sentences_are_synthesized_once_and_joined(tmp_path):
+    backend = StubSpeech()
+    tts = TextToSpeech(backend, AudioCache(str(tmp_path)))
+    text = "Welcome to Lucy support today. How can we help you with your appointment?"
+    audio = tts.speak("am", text)
+    assert len(backend.calls) == 2
+    assert frames(audio) == (16000 // 50) * sum(len(s) for s in tts.sentences(text))
+    assert tts.speak("am", text) == audio and len(backend.calls) == 2
+
+def test_tts_routes(client, monkeypatch, tmp_path):
+    backend = StubSpeech()
+    monkeypatch.setattr(lucy, "TTS", TextToSpeech(backend, AudioCache(str(tmp_path / "tts"))))
+    res = client.post("/api/tts", json={"text": "ሰላም እንዴት ነዎት። ምን ልርዳዎት እችላለሁ?", "lang": "am"})
+    assert res.status_code == 200 and res.headers["Content-Type"] == "audio/wav"
+
+    chunks = client.post("/api/tts", json={"text": "First sentence is here. Second sentence is here.", "chunked": True}).get_json()["chunks"]
+    assert [c["text"] for c in chunks] == ["First sentence is here.", "Second sentence is here."]
+    clip = client.get(chunks[1]["url"])
+    assert clip.status_code == 200 and "max-age" in clip.headers["Cache-Control"]
+    assert [t for _, t in backend.calls].count("Second sentence is here.") == 1
+
+def tone(rate, channels, seconds, silence=0.5):
+    # Silence, a loud square wave, then silence again
+    quiet = b"\0\0" * channels * int(rate * silence)
+    loud = (b"\x00\x40" * channels + b"\x00\xc0" * channels) * int(rate * seconds / 2)
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(quiet + loud + quiet)
+    return out.getvalue()
+
+@pytest.mark.parametrize("use_audioop", [True, False])
+def test_wav_is_downsampled_and_trimmed(monkeypatch, use_audioop):
+    if not use_audioop: monkeypatch.setattr(speech, "audioop", None)
+    wav = normalize_wav(io.BytesIO(tone(48000, 2, 1.0)))
+    with wave.open(io.BytesIO(wav), "rb") as w:
+        assert (w.getnchannels(), w.getframerate()) == (1, 16000)
+        assert 16000 <= w.getnframes() <= 16000 * 1.5  # 1 s of speech plus padding, silence dropped
+    assert len(wav) < len(tone(48000, 2, 1.0)) / 6
+
+def test_asr_route_limits_routes_and_skips_silence(client, monkeypatch):
+    backend = StubSpeech()
+    monkeypatch.setattr(lucy, "ASR", SpeechToText(backend, max_bytes=400 * 1024))
+    res = client.post("/api/asr?lang=am", data=tone(44100, 1, 1.0), content_type="audio/wav")
+    assert res.get_json()["language"] == "am" and backend.calls[0][1][:4] == b"RIFF"
+    assert backend.calls[0][2] == "amh"  # MMS target language
+    assert len(backend.calls[0][1]) < 50000  # 176 KB uploaded
+
+    config = lucy.load_config()
+    config["asr_models"] = {"om": "example/oromo-asr"}
+    lucy.save_config(config)
+    res = client.post("/api/asr?lang=om", data=b"webm-bytes", content_type="audio/webm")
+    assert res.get_json()["model"] == "example/oromo-asr" and backend.calls[1][1] == b"webm-bytes"
+
+    assert client.post("/api/asr", data=tone(16000, 1, 0, silence=1), content_type="audio/wav").get_json()["text"] == ""
+    assert len(backend.calls) == 2
+    assert client.post("/api/asr", data=b"x" * (401 * 1024), content_type="audio/webm").status_code == 413
+
+def test_endpoints_receive_the_target_language(monkeypatch):
+    sent = []
+    class Reply:
+        status_code, text = 200, ""
+        def json(self): return {"text": "selam"}
+    monkeypatch.setattr(speech.requests, "post", lambda url, **kw: sent.append((url, kw["params"], kw["headers"].get("Authorization"))) or Reply())
+    asr = SpeechToText(speech.HFSpeech("token"), default_model="https://mms.example/asr")
+    assert asr.transcribe("ti", io.BytesIO(b"webm"), "audio/webm")["text"] == "selam"
+    asr.transcribe("om", io.BytesIO(b"webm"), "audio/webm", overrides={"om": "example/oromo-asr"})
+    assert sent == [("https://mms.example/asr", {"target_lang": "tir"}, None),
+                    (speech.HF_INFERENCE_URL + "example/oromo-asr", None, "Bearer token")]
+
+def test_tenant_config_cannot_redirect_asr(client, monkeypatch):
+    sent = []
+    class Reply:
+        status_code, text = 200, ""
+        def json(self): return {"text": "selam"}
+    monkeypatch.setattr(speech.requests, "post", lambda url, **kw: sent.append(url) or Reply())
+    monkeypatch.setattr(lucy, "ASR", SpeechToText(speech.HFSpeech("hf-secret")))
+    config = lucy.load_config()
+    config["asr_models"] = {"am": "https://attacker.example/collect"}
+    lucy.save_config(config)
+    assert client.post("/api/asr?lang=am", data=b"webm-bytes", content_type="audio/webm").status_code == 200
+    assert sent == [speech.HF_INFERENCE_URL + speech.ASR_MODEL]
+    assert not speech.is_hf_url("https://huggingface.co.attacker.example/x") and speech.is_hf_url("https://x.endpoints.huggingface.cloud/")
@@ -0,0 +1,114 @@
+import json
+import threading
+import pytest
+import app as lucy
+from storage import SQLiteStore, JSONStore
+
+def test_migrates_json_files_once(data_dir, monkeypatch):
+    (data_dir / "clients.json").write_text(json.dumps({"CLT001": {"name": "Abebe", "status": "active"}}))
+    (data_dir / "users.json").write_text(json.dumps({"a@example.com": {"password": "x"}}))
+    (data_dir / "bot_config.json").write_text(json.dumps({"bot_name": "Lucy"}))
+    (data_dir / "conversations.json").write_text(json.dumps([{"user_query": "selam", "session_id": "s1"}]))
+    store = lucy.make_store("sqlite")
+    assert store.load("clients") == {"CLT001": {"name": "Abebe", "status": "active"}}
+    assert store.get("users", "a@example.com") == {"password": "x"}
+    assert store.get_config() == {"bot_name": "Lucy"}
+    assert [c["user_query"] for c in store.conversation_log()] == ["selam"]
+
+    # Later JSON edits are not re-imported
+    (data_dir / "clients.json").write_text("{}")
+    assert list(lucy.make_store("sqlite").load("clients")) == ["CLT001"]
+
+def test_crud_routes_on_sqlite(admin_client, monkeypatch):
+    monkeypatch.setattr(lucy, "STORE", lucy.make_store("sqlite"))
+    assert admin_client.post("/api/clients", json={"name": "Chala"}).get_json()["id"] == "CLT001"
+    assert admin_client.put("/api/clients/CLT001", json={"status": "inactive"}).status_code == 200
+    assert admin_client.put("/api/clients/CLT999", json={"status": "x"}).status_code == 404
+    assert admin_client.get("/api/clients").get_json()["CLT001"]["status"] == "inactive"
+    assert admin_client.get("/api/analytics").get_json()["total_clients"] == 1
+    assert admin_client.delete("/api/clients/CLT001").status_code == 200
+    assert admin_client.get("/api/analytics").get_json()["total_clients"] == 0
+
+def test_signup_conflict_is_atomic(client, monkeypatch):
+    monkeypatch.setattr(lucy, "STORE", lucy.make_store("sqlite"))
+    assert client.post("/api/signup", json={"email": "a@example.com", "password": "pw"}).status_code == 200
+    assert client.post("/api/signup", json={"email": "a@example.com", "password": "pw2"}).status_code == 400
+    assert client.post("/api/login", json={"email": "a@example.com", "password": "pw"}).status_code == 200
+
+def test_concurrent_creates_do_not_lose_writes(tmp_path):
+    store = SQLiteStore(str(tmp_path / "lucy.db"))
+    ids = []
+    def work():
+        for _ in range(10): ids.append(store.create("clients", {"name": "x"}, prefix="CLT"))
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert len(set(ids)) == 40 and len(store.load("clients")) == 40
+    assert store.version("clients") == 40
+
+def test_sqlite_conversation_log_matches_file_log(tmp_path):
+    store = SQLiteStore(str(tmp_path / "lucy.db"))
+    logs = [store.conversation_log(), JSONStore({}, str(tmp_path / "log")).conversation_log()]
+    for log in logs:
+        for i in range(5): log.append({"n": i, "timestamp": f"2026-10-18T10:00:0{i}"})
+        assert [r["n"] for r in log.tail(2, skip=1)] == [3, 2]
+        records, pos = log.read_from((0, 0))
+        assert [r["n"] for r in records] == list(range(5))
+        log.append({"n": 5})
+        assert [r["n"] for r in log.read_from(pos)[0]] == [5]
+        assert log.count() == 6
+        entries, _ = log.entries_from((0, 0))
+        assert [r["n"] for r in log.get([p for p, _ in entries[1:3]])] == [1, 2]
+
+def test_sqlite_conversation_retention(tmp_path):
+    store = SQLiteStore(str(tmp_path / "lucy.db"))
+    log = store.conversation_log(max_bytes=300, max_age_days=1)
+    log.append({"n": 0, "timestamp": "2000-01-01T00:00:00"})
+    for i in range(1, 20): log.append({"n": i, "user_query": "q" * 20})
+    log.enforce_retention()
+    kept = [r["n"] for r in log]
+    assert 0 not in kept and kept[-1] == 19
+    assert sum(len(json.dumps(r)) for r in log) <= 300
+
+def test_creates_and_analytics_reads_do_not_deadlock(admin_client):
+    # Record hooks must run without the store lock held, or they deadlock against /api/analytics
+    errors = []
+    def creates():
+        for i in range(20): admin_client.post("/api/clients", json={"name": f"c{i}"})
+    def reads():
+        for _ in range(20):
+            if admin_client.get("/api/analytics").status_code != 200: errors.append(1)
+    threads = [threading.Thread(target=f, daemon=True) for f in (creates, reads, creates, reads)]
+    for t in threads: t.start()
+    for t in threads: t.join(timeout=10)
+    assert not any(t.is_alive() for t in threads) and not errors
+    assert admin_client.get("/api/analytics").get_json()["total_clients"] == 40
+
+def test_json_writes_do_not_mutate_loaded_tables(data_dir):
+    store = lucy.make_store("json")
+    store.create("clients", {"name": "a"}, prefix="CLT")
+    loaded = store.load("clients")
+    store.create("clients", {"name": "b"}, prefix="CLT")
+    assert list(loaded) == ["CLT001"] and list(store.load("clients")) == ["CLT001", "CLT002"]
+
+def test_sqlite_config_is_parsed_once_per_version(tmp_path):
+    store, other = SQLiteStore(str(tmp_path / "lucy.db")), SQLiteStore(str(tmp_path / "lucy.db"))
+    store.set_config({"bot_name": "Lucy", "knowledge_base": "x" * 1000})
+    first = store.get_config()
+    assert store.get_config() is first and store.stats["hits"] == 1
+    # A write from another worker bumps the version and is picked up
+    other.set_config({"bot_name": "Selam"})
+    assert store.get_config() == {"bot_name": "Selam"}
+
+def test_unreadable_json_table_is_never_replaced(tmp_path):
+    path = tmp_path / "clients.json"
+    store = JSONStore({"clients": str(path)}, str(tmp_path / "log"))
+    store.put("clients", "CLT001", {"name": "Abebe"})
+    # A failed write leaves the previous file whole
+    store.save("clients", {"CLT001": {"name": object()}})
+    assert json.loads(path.read_text()) == {"CLT001": {"name": "Abebe"}} and list(tmp_path.glob("*.tmp")) == []
+
+    # A truncated file is an error, not an empty table the next write would overwrite
+    path.write_text('{"CLT001": {"na')
+    with pytest.raises(ValueError): store.put("clients", "CLT002", {"name": "Chala"})
+    assert path.read_text() == '{"CLT001": {"na'
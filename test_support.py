@@ -0,0 +1,60 @@
+import json
+import app as lucy
+
+HEADERS = {"X-API-KEY": "test-key"}
+
+def fake_stream(prompt, language, result):
+    for word in ["Selam", " there"]: yield word
+    result.update({"reply": "Selam there", "usage": {"total_tokens": 7}})
+
+def test_support_requires_key(client):
+    assert client.post("/api/support", json={"user_query": "hi"}).status_code == 401
+
+def test_support_streams_sse_and_logs_once(client, monkeypatch):
+    monkeypatch.setattr(lucy, "stream_gemini", fake_stream)
+    res = client.post("/api/support", headers=HEADERS, json={"user_query": "hi", "stream": True, "session_id": "s1"})
+    assert res.mimetype == "text/event-stream"
+    frames = [f for f in res.get_data(as_text=True).split("\n\n") if f]
+    assert [json.loads(f.split("data: ")[1])["delta"] for f in frames[:-1]] == ["Selam", " there"]
+    assert frames[-1].startswith("event: done")
+    stored = lucy.get_conversation_log().tail(5)
+    assert len(stored) == 1
+    assert stored[0]["bot_reply"] == "Selam there" and stored[0]["tokens"] == 7
+
+def test_repeated_faq_is_served_from_cache(client, monkeypatch):
+    calls = []
+    def fake_call(prompt, language):
+        calls.append(prompt)
+        return {"reply": "Open the app and tap Forgot Password.", "usage": {"total_tokens": 42}}
+    monkeypatch.setattr(lucy, "call_gemini", fake_call)
+    body = {"user_query": "How do I reset my password?", "language": "am", "sector": "banking"}
+    first = client.post("/api/support", headers=HEADERS, json=body)
+    second = client.post("/api/support", headers=HEADERS, json=dict(body, user_query="how do i reset my password"))
+    assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("MISS", "HIT")
+    assert second.get_json()["reply"] == first.get_json()["reply"]
+    assert len(calls) == 1
+
+def test_personal_lookup_bypasses_cache(client, data_dir, monkeypatch):
+    (data_dir / "clients.json").write_text(json.dumps({"CLT001": {"name": "Abebe Balcha"}}))
+    monkeypatch.setattr(lucy, "call_gemini", lambda p, l: {"reply": "Found you.", "usage": {"total_tokens": 5}})
+    res = client.post("/api/support", headers=HEADERS, json={"user_query": "My ID is CLT001"})
+    assert res.headers["X-Cache"] == "BYPASS"
+
+def test_rate_limit_headers_and_429(client, monkeypatch):
+    monkeypatch.setattr(lucy, "RATE_LIMITER", lucy.make_rate_limiter("memory", limit=2))
+    monkeypatch.setattr(lucy, "call_gemini", lambda p, l: {"reply": "ok", "usage": {"total_tokens": 1}})
+    first = client.post("/api/support", headers=HEADERS, json={"user_query": "one"})
+    assert first.headers["X-RateLimit-Limit"] == "2"
+    client.post("/api/support", headers=HEADERS, json={"user_query": "two"})
+    blocked = client.post("/api/support", headers=HEADERS, json={"user_query": "three"})
+    assert blocked.status_code == 429 and "Retry-After" in blocked.headers
+
+def test_demo_key_is_limited_per_dashboard_user(data_dir, monkeypatch):
+    monkeypatch.setattr(lucy, "RATE_LIMITER", lucy.make_rate_limiter("memory", limit=1))
+    monkeypatch.setattr(lucy, "call_gemini", lambda p, l: {"reply": "ok", "usage": {"total_tokens": 1}})
+    demo = {"X-API-KEY": "dashboard-demo-key"}
+    users = [lucy.app.test_client() for _ in range(2)]
+    for i, user in enumerate(users):
+        with user.session_transaction() as sess: sess["user"] = f"user{i}@example.com"
+    assert [u.post("/api/support", headers=demo, json={"user_query": "hi"}).status_code for u in users] == [200, 200]
+    assert users[0].post("/api/support", headers=demo, json={"user_query": "again"}).status_code == 429
@@ -0,0 +1,98 @@
+import io
+import pytest
+import app as lucy
+from tenants import DEFAULT_TENANT, Tenant, TenantRegistry
+
+def sign_up(email):
+    dashboard = lucy.app.test_client()
+    assert dashboard.post("/api/signup", json={"email": email, "password": "pw"}).status_code == 200
+    return dashboard, dashboard.get("/api/settings").get_json()["client_api_key"]
+
+@pytest.fixture
+def tenants(client, monkeypatch):
+    prompts = []
+    monkeypatch.setattr(lucy, "call_gemini", lambda p, l: prompts.append(p) or {"reply": "ok", "usage": {"total_tokens": 2}})
+    (a, key_a), (b, key_b) = sign_up("a@example.com"), sign_up("b@example.com")
+    return a, key_a, b, key_b, prompts
+
+def ask(key, query):
+    return lucy.app.test_client().post("/api/support", json={"user_query": query}, headers={"X-API-KEY": key})
+
+def test_data_and_prompts_are_isolated(tenants):
+    a, key_a, b, key_b, prompts = tenants
+    assert key_a != key_b and key_a.startswith("lucy-")
+    a.post("/api/clients", json={"name": "Abebe Kebede"})
+    a.post("/api/settings", json={"knowledge_base": "Tenant A sells coffee."})
+    assert list(a.get("/api/clients").get_json().values())[0]["name"] == "Abebe Kebede"
+    assert b.get("/api/clients").get_json() == {}
+
+    assert ask(key_b, "Is Abebe Kebede a client?").status_code == 200
+    assert "Abebe" not in prompts[-1].split("USER QUERY")[0] and "coffee" not in prompts[-1]
+    ask(key_a, "Is Abebe Kebede a client?")
+    assert "Abebe Kebede" in prompts[-1].split("USER QUERY")[0] and "coffee" in prompts[-1]
+
+    assert len(a.get("/api/conversations").get_json()) == 1 and len(b.get("/api/conversations").get_json()) == 1
+    assert a.get("/api/analytics").get_json()["total_clients"] == 1
+    assert b.get("/api/analytics").get_json()["total_clients"] == 0
+    # The original single-tenant data and key are untouched
+    assert ask("test-key", "hello").status_code == 200 and lucy.load_clients() == {}
+
+def test_response_cache_is_partitioned(tenants):
+    _, key_a, _, key_b, _ = tenants
+    assert ask(key_a, "opening hours?").headers["X-Cache"] == "MISS"
+    assert ask(key_b, "opening hours?").headers["X-Cache"] == "MISS"
+    assert ask(key_a, "opening hours?").headers["X-Cache"] == "HIT"
+
+def test_api_keys_identify_tenants(tenants):
+    a, key_a, b, key_b, _ = tenants
+    assert ask("lucy-unknown", "hi").status_code == 401
+    assert a.post("/api/settings", json={"client_api_key": key_b}).status_code == 400
+    # Nor can a tenant take over the default tenant's key (kept in its config) or the reserved ones
+    for taken in ("test-key", lucy.CLIENT_API_KEY, "dashboard-demo-key"):
+        assert a.post("/api/settings", json={"client_api_key": taken}).status_code == 400
+    assert ask("test-key", "hi").status_code == 200 and lucy.get_conversation_log().tail(1)[0]["user_query"] == "hi"
+    assert a.post("/api/settings", json={"client_api_key": "a-rotated"}).status_code == 200
+    assert ask(key_a, "hi").status_code == 401 and ask("a-rotated", "hi").status_code == 200
+    assert lucy.app.test_client().get("/api/widget-config?key=a-rotated").get_json()["bot_name"] == "a@example.com"
+
+def test_dashboard_users_stay_in_their_tenant(tenants):
+    a, key_a, _, _, _ = tenants
+    # A stray or forged key never moves a logged-in user into another tenant
+    for key in ("bogus", "test-key"):
+        settings = a.get("/api/settings", headers={"X-API-KEY": key}).get_json()
+        assert settings["client_api_key"] == key_a
+        a.post("/api/clients", json={"name": "Abebe Kebede"}, headers={"X-API-KEY": key})
+    assert lucy.load_clients() == {} and len(a.get("/api/clients").get_json()) == 2
+    assert lucy.app.test_client().get("/api/widget-config?key=bogus").status_code == 401
+
+def test_usage_is_scoped_to_the_tenant(tenants, admin_client, monkeypatch):
+    a, key_a, b, key_b, _ = tenants
+    monkeypatch.setattr(lucy, "USAGE_LOGS", lucy.deque(maxlen=10))
+    ask(key_a, "hi"); ask(key_b, "hi")
+    a.post("/api/settings", json={"client_api_key": "a-rotated"})
+    ask("a-rotated", "hi")
+    # Usage under the rotated-out key still belongs to A
+    assert a.get("/api/usage").get_json().keys() == {key_a, "a-rotated"}
+    assert a.get("/api/analytics").get_json()["usage"]["all_time"]["requests"] == 2
+    assert [e["key"] for e in a.get("/api/activity").get_json()] == ["a-rotated", key_a]
+    # Pre-tenant accounts live in the default tenant but are not admins
+    assert admin_client.get("/api/usage").get_json() == {} and admin_client.get("/api/activity").get_json() == []
+    monkeypatch.setattr(lucy, "ADMIN_EMAILS", {"admin@example.com"})
+    assert len(admin_client.get("/api/activity").get_json()) == 3
+    assert admin_client.get("/api/analytics").get_json()["usage"]["all_time"]["requests"] == 3
+    assert a.post("/api/settings", json={"client_api_key": "a/b"}).status_code == 400
+
+def test_jobs_are_private(tenants, data_dir, monkeypatch):
+    a, _, b, _, _ = tenants
+    monkeypatch.setitem(lucy.app.config, "UPLOAD_FOLDER", str(data_dir))
+    job_id = a.post("/api/upload", data={"file": (io.BytesIO(b"hours"), "faq.txt")}).get_json()["job_id"]
+    assert a.get(f"/api/jobs/{job_id}").status_code == 200
+    assert b.get(f"/api/jobs/{job_id}").status_code == 404
+
+def test_hot_tenants_are_bounded(data_dir):
+    opened = []
+    registry = TenantRegistry(lambda: lucy.STORE, lambda t: opened.append(t) or Tenant(t, lucy.STORE), max_hot=3)
+    for tenant_id in (DEFAULT_TENANT, "TEN001", "TEN002", "TEN001", "TEN003"): registry.get(tenant_id)
+    # Least recently used goes first; the default tenant is never evicted
+    assert list(registry.hot) == [DEFAULT_TENANT, "TEN001", "TEN003"]
+    assert opened == [DEFAULT_TENANT, "TEN001", "TEN002", "TEN003"] and registry.stats["evicted"] == 1
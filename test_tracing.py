@@ -0,0 +1,95 @@
+import threading
+import time
+import app as lucy
+from tracing import Metrics, SamplingProfiler, Tracer, log, new_request_id
+
+def test_request_ids_are_kept_or_minted():
+    assert new_request_id("abc-123") == "abc-123"
+    assert len(new_request_id("bad id\n")) == 16
+    assert new_request_id(None) != new_request_id(None)
+
+def test_histograms_render_in_prometheus_format():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.observe("lat", 0.05, "Latency", route="/a")
+    metrics.observe("lat", 0.5, "Latency", route="/a")
+    metrics.inc("hits", 2, "Hits", status="200")
+    text = metrics.render()
+    assert '# TYPE lat histogram' in text
+    assert 'lat_bucket{route="/a",le="0.1"} 1' in text and 'lat_bucket{route="/a",le="+Inf"} 2' in text
+    assert 'lat_count{route="/a"} 2' in text and 'hits{status="200"} 2' in text
+
+def test_spans_feed_the_trace_and_stage_histogram(capsys):
+    tracer = Tracer(Metrics())
+    token = tracer.begin("rid-1", "/api/x")
+    with tracer.span("compose"): log("working")
+    trace = tracer.end(token)
+    assert [name for name, _ in trace.spans] == ["compose"] and trace.server_timing().startswith("compose;dur=")
+    assert "Lucy AI [rid-1]: working" in capsys.readouterr().out
+    assert 'lucy_stage_duration_seconds_count{stage="compose"} 1' in tracer.metrics.render()
+
+def test_profiler_samples_tracked_threads():
+    profiler = SamplingProfiler()
+    ready, done = threading.Event(), threading.Event()
+    def busy_request():
+        profiler.track("/api/support")
+        ready.set()
+        done.wait(5)
+    worker = threading.Thread(target=busy_request)
+    worker.start()
+    ready.wait(5)
+    profiler.sample()
+    done.set()
+    worker.join()
+    assert profiler.samples == 1 and profiler.collapsed().startswith("/api/support;")
+    assert "test_tracing:busy_request" in profiler.collapsed()
+
+def fresh_tracer():
+    # Keeps the app's collectors, drops recorded histograms
+    metrics = Metrics()
+    metrics.collectors = lucy.TRACER.metrics.collectors
+    return Tracer(metrics)
+
+def test_support_request_is_traced(client, monkeypatch):
+    monkeypatch.setattr(lucy, "TRACER", fresh_tracer())
+    monkeypatch.setattr(lucy, "call_gemini", lambda p, l: {"reply": "ok", "usage": {"total_tokens": 3}})
+    res = client.post("/api/support", json={"user_query": "hi"}, headers={"X-API-KEY": "test-key", "X-Request-ID": "req-42"}, buffered=True)
+    assert res.headers["X-Request-ID"] == "req-42"
+    assert "compose_prompt;dur=" in res.headers["Server-Timing"]
+    assert lucy.load_conversations()[-1]["request_id"] == "req-42"
+
+    text = client.get("/metrics").get_data(as_text=True)
+    assert 'lucy_http_request_duration_seconds_count{method="POST",route="/api/support"} 1' in text
+    assert 'lucy_http_requests_total{method="POST",route="/api/support",status="200"} 1' in text
+    assert 'lucy_stage_duration_seconds_count{stage="match_records"} 1' in text
+    assert 'lucy_tts_cache_events{event="hits"}' in text
+
+def test_streamed_request_is_timed_to_the_end(client, monkeypatch):
+    monkeypatch.setattr(lucy, "TRACER", fresh_tracer())
+    def slow_stream(prompt, language, result, **cache_parts):
+        time.sleep(0.02)
+        result.update({"reply": "ok", "usage": {"total_tokens": 3}})
+        yield "ok"
+    monkeypatch.setattr(lucy, "stream_gemini", slow_stream)
+    res = client.post("/api/support", json={"user_query": "hi", "stream": True}, headers={"X-API-KEY": "test-key"},
+                      buffered=True)
+    assert "event: done" in res.get_data(as_text=True) and len(res.headers["X-Request-ID"]) == 16
+    series = lucy.TRACER.metrics.histograms["lucy_http_request_duration_seconds"]
+    assert sum(row[-2] for row in series.values()) >= 0.02
+
+def test_metrics_token_is_enforced(client, monkeypatch):
+    monkeypatch.setattr(lucy, "METRICS_TOKEN", "scrape-me")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-me"}).status_code == 200
+
+def test_rejected_keys_are_traced(client, monkeypatch):
+    monkeypatch.setattr(lucy, "TRACER", fresh_tracer())
+    res = client.post("/api/support", json={"user_query": "hi"}, headers={"X-API-KEY": "nope", "X-Request-ID": "req-401"}, buffered=True)
+    assert res.status_code == 401 and res.headers["X-Request-ID"] == "req-401"
+    assert 'lucy_http_requests_total{method="POST",route="/api/support",status="401"} 1' in client.get("/metrics").get_data(as_text=True)
+
+def test_profile_is_for_operators_only(admin_client, monkeypatch):
+    monkeypatch.setattr(lucy, "METRICS_TOKEN", "scrape-me")
+    assert admin_client.get("/api/profile").status_code == 401
+    assert admin_client.get("/api/profile", headers={"Authorization": "Bearer scrape-me"}).status_code == 404
+    monkeypatch.setattr(lucy, "ADMIN_EMAILS", {"admin@example.com"})
+    assert admin_client.get("/api/profile").status_code == 404
@@ -0,0 +1,33 @@
+import json
+import app as lucy
+from usage import UsageMeter
+
+def test_meter_merges_deltas_across_processes(tmp_path):
+    path = str(tmp_path / "totals.json")
+    a, b = UsageMeter(path, flush_interval=3600), UsageMeter(path, flush_interval=3600)
+    a.record("key1", tokens=10, day="2026-01-01")
+    b.record("key1", tokens=5, cached=True, day="2026-01-01")
+    assert a.snapshot()["key1"]["2026-01-01"]["tokens"] == 10
+    a.flush(); b.flush()
+    totals = json.load(open(path))
+    assert totals["key1"]["2026-01-01"] == {"requests": 2, "tokens": 15, "cached": 1}
+
+def test_usage_logs_are_bounded(data_dir, monkeypatch):
+    monkeypatch.setattr(lucy, "USAGE_LOGS", lucy.deque(maxlen=3))
+    for i in range(10): lucy.log_usage("k", "/api/support", {"query": f"q{i}", "reply": "x" * 1000, "usage": {"total_tokens": 2}})
+    assert [l["payload"]["query"] for l in lucy.USAGE_LOGS] == ["q7", "q8", "q9"]
+    assert len(lucy.USAGE_LOGS[-1]["payload"]["reply"]) == 200
+    assert lucy.USAGE_METER.summary()["today"] == {"requests": 10, "tokens": 20, "cached": 0}
+
+def test_summary_uses_running_totals(tmp_path):
+    meter = UsageMeter(str(tmp_path / "totals.json"), flush_interval=3600)
+    meter.record("key1", tokens=4, day="2026-01-01")
+    meter.record("key1", tokens=6, cached=True, day="2026-01-02", scope="TEN001")
+    meter.flush()
+    meter.record("key1", tokens=1, day="2026-01-02")
+    assert meter.all_time == {"key1": {"requests": 1, "tokens": 4, "cached": 0},
+                              "TEN001/key1": {"requests": 1, "tokens": 6, "cached": 1}}
+    summary = meter.summary(day="2026-01-02")
+    assert summary == {"all_time": {"requests": 3, "tokens": 11, "cached": 1}, "today": {"requests": 2, "tokens": 7, "cached": 1}}
+    assert meter.summary(day="2026-01-02", scope="TEN001")["all_time"] == {"requests": 1, "tokens": 6, "cached": 1}
+    assert meter.summary(day="2026-01-02", scope=None)["today"] == {"requests": 1, "tokens": 1, "cached": 0}
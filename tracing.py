@@ -0,0 +1,219 @@
+import os
+import re
+import sys
+import time
+import uuid
+import random
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+_TRACE = contextvars.ContextVar("lucy_trace", default=None)
+
+def new_request_id(incoming=None):
+    # Honour an upstream proxy's ID when it looks sane, otherwise mint one
+    return incoming if incoming and REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex[:16]
+
+def current_trace():
+    return _TRACE.get()
+
+def log(message):
+    trace = _TRACE.get()
+    print(f"Lucy AI [{trace.request_id}]: {message}" if trace else f"Lucy AI: {message}")
+
+# ─── Metrics ─────────────────────────────────────────────────────────
+# In-process counters and histograms rendered in the Prometheus text format.
+# Each worker process keeps its own registry, so scrape every worker.
+
+def _labels(labels):
+    if not labels: return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.help = {}
+        self.counters = {}    # name -> {labels tuple: value}
+        self.histograms = {}  # name -> {labels tuple: [bucket counts..., sum, count]}
+        self.collectors = []
+
+    def inc(self, name, value=1, help="", **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.help.setdefault(name, help)
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, help="", **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.help.setdefault(name, help)
+            series = self.histograms.setdefault(name, {})
+            row = series.get(key)
+            if row is None: row = series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound: row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def collector(self, fn):
+        # fn() yields (name, type, help, labels, value) for values owned elsewhere (e.g. client stats)
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        with self.lock:
+            counters = {n: dict(s) for n, s in self.counters.items()}
+            histograms = {n: {k: list(r) for k, r in s.items()} for n, s in self.histograms.items()}
+        for name, series in sorted(counters.items()):
+            lines += [f"# HELP {name} {self.help.get(name, '')}", f"# TYPE {name} counter"]
+            lines += [f"{name}{_labels(dict(k))} {v}" for k, v in sorted(series.items())]
+        for name, series in sorted(histograms.items()):
+            lines += [f"# HELP {name} {self.help.get(name, '')}", f"# TYPE {name} histogram"]
+            for key, row in sorted(series.items()):
+                labels = dict(key)
+                for bound, count in zip(self.buckets, row):
+                    lines.append(f"{name}_bucket{_labels(dict(labels, le=f'{bound:g}'))} {count}")
+                lines.append(f"{name}_bucket{_labels(dict(labels, le='+Inf'))} {row[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {row[-2]:.6f}")
+                lines.append(f"{name}_count{_labels(labels)} {row[-1]}")
+        seen = set()
+        for fn in self.collectors:
+            try: samples = list(fn())
+            except Exception as e:
+                log(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, help, labels, value in samples:
+                if name not in seen:
+                    lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                    seen.add(name)
+                lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+# ─── Sampling Profiler ───────────────────────────────────────────────
+# Opt-in: a background thread snapshots the stacks of threads that are serving
+# sampled requests every `interval` seconds and counts them in collapsed-stack
+# form ("route;module:function;..."), ready for flamegraph tools. Threads only:
+# under gevent, greenlets sharing a thread are not told apart.
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005, max_stacks=5000, max_depth=64):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self.threads = {}
+        self.stacks = Counter()
+        self.samples = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def track(self, label):
+        self.threads[threading.get_ident()] = label
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="lucy-profiler", daemon=True)
+                    self.thread.start()
+
+    def untrack(self):
+        self.threads.pop(threading.get_ident(), None)
+
+    def _collapse(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+            names.append(f"{module}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def sample(self):
+        frames = sys._current_frames()
+        for ident, label in list(self.threads.items()):
+            frame = frames.get(ident)
+            if frame is None: continue
+            stack = f"{label};{self._collapse(frame)}"
+            with self.lock:
+                self.samples += 1
+                if stack in self.stacks or len(self.stacks) < self.max_stacks: self.stacks[stack] += 1
+                else: self.stacks[f"{label};(other)"] += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+
+    def collapsed(self, limit=None):
+        with self.lock: top = self.stacks.most_common(limit)
+        return "".join(f"{stack} {count}\n" for stack, count in top)
+
+    def reset(self):
+        with self.lock:
+            self.stacks.clear()
+            self.samples = 0
+
+# ─── Request Tracing ─────────────────────────────────────────────────
+# One Trace per request (held in a contextvar) collects named stage spans.
+# Every span also feeds a per-stage latency histogram, so /metrics shows where
+# time goes across requests and Server-Timing shows it for a single one.
+
+class Trace:
+    def __init__(self, request_id, route):
+        self.request_id = request_id
+        self.route = route
+        self.started = time.perf_counter()
+        self.spans = []
+        self.status = None
+        self.profiled = False
+
+    def server_timing(self):
+        totals = Counter()
+        for name, seconds in self.spans: totals[name] += seconds
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+class Tracer:
+    def __init__(self, metrics=None, profiler=None, sample_rate=1.0):
+        self.metrics = metrics or Metrics()
+        self.profiler = profiler
+        self.sample_rate = sample_rate
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def begin(self, request_id, route):
+        trace = Trace(request_id, route)
+        with self.lock: self.in_flight += 1
+        if self.profiler and random.random() < self.sample_rate:
+            trace.profiled = True
+            self.profiler.track(route)
+        return _TRACE.set(trace)
+
+    def end(self, token):
+        trace = _TRACE.get()
+        if trace is None: return None
+        with self.lock: self.in_flight -= 1
+        if trace.profiled: self.profiler.untrack()
+        try: _TRACE.reset(token)
+        except (ValueError, RuntimeError): _TRACE.set(None)  # token from another context (streamed responses)
+        return trace
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try: yield
+        finally:
+            seconds = time.perf_counter() - started
+            trace = _TRACE.get()
+            if trace is not None: trace.spans.append((name, seconds))
+            self.metrics.observe("lucy_stage_duration_seconds", seconds, "Time spent in each request stage", stage=name)
+
+    def observe_request(self, route, method, status, seconds):
+        self.metrics.observe("lucy_http_request_duration_seconds", seconds, "HTTP request latency by route",
+                             route=route, method=method)
+        self.metrics.inc("lucy_http_requests_total", 1, "HTTP requests by route and status",
+                         route=route, method=method, status=str(status))
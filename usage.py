@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ─── Usage Metering ──────────────────────────────────────────────────
+# Per-key, per-day request/token counters for billing. Each process keeps
+# deltas in memory and merges them into the JSON totals file under a lock,
+# so several workers can meter into the same file without losing counts.
+
+FIELDS = ("requests", "tokens", "cached")
+ALL_SCOPES = "*"
+
+# Usage is stored per "<scope>/<key>" so a tenant keeps its history when it
+# rotates its API key. Unscoped keys (the default tenant's) are stored as-is.
+def scoped_key(scope, key):
+    return f"{scope}/{key}" if scope else key
+
+def split_key(stored):
+    # -> (scope, key); scope is None for unscoped keys
+    scope, sep, key = stored.partition("/")
+    return (scope, key) if sep else (None, stored)
+
+class UsageMeter:
+    def __init__(self, path, flush_interval=10.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.pending = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+        self.totals = self._read()
+        self.all_time = self._roll_up(self.totals)
+        self.last_flush = time.monotonic()
+        atexit.register(self.flush)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f: return json.load(f)
+        except (OSError, ValueError): return {}
+
+    @staticmethod
+    def _roll_up(totals):
+        # Per-key all-time sums, rebuilt only when persisted totals change (flush), not per summary()
+        return {key: {f: sum(e.get(f, 0) for e in days.values()) for f in FIELDS} for key, days in totals.items()}
+
+    def record(self, key, tokens=0, cached=False, day=None, scope=None):
+        day = day or datetime.now().strftime("%Y-%m-%d")
+        with self.lock:
+            entry = self.pending[(scoped_key(scope, key or "anonymous"), day)]
+            entry["requests"] += 1
+            entry["tokens"] += int(tokens or 0)
+            entry["cached"] += int(bool(cached))
+            due = time.monotonic() - self.last_flush >= self.flush_interval
+        if due: self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+            self.last_flush = time.monotonic()
+        if not pending: return
+        try:
+            with open(self.path, 'a+', encoding='utf-8') as f:
+                if fcntl: fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                f.seek(0)
+                try: totals = json.loads(f.read() or "{}")
+                except ValueError: totals = {}
+                for (key, day), delta in pending.items():
+                    entry = totals.setdefault(key, {}).setdefault(day, dict.fromkeys(FIELDS, 0))
+                    for field in FIELDS: entry[field] = entry.get(field, 0) + delta[field]
+                f.seek(0)
+                f.truncate()
+                json.dump(totals, f)
+        except OSError as e:
+            print(f"Lucy AI: Failed to persist usage totals: {e}")
+            with self.lock:
+                for k, delta in pending.items():
+                    for field in FIELDS: self.pending[k][field] += delta[field]
+            return
+        all_time = self._roll_up(totals)
+        with self.lock: self.totals, self.all_time = totals, all_time
+
+    def snapshot(self, scope=ALL_SCOPES):
+        # Persisted totals plus this process's unflushed deltas. With a scope, only that
+        # scope's keys are returned, unprefixed.
+        with self.lock:
+            totals = {k: {d: dict(v) for d, v in days.items()} for k, days in self.totals.items()}
+            for (key, day), delta in self.pending.items():
+                entry = totals.setdefault(key, {}).setdefault(day, dict.fromkeys(FIELDS, 0))
+                for field in FIELDS: entry[field] = entry.get(field, 0) + delta[field]
+        if scope == ALL_SCOPES: return totals
+        return {split_key(k)[1]: days for k, days in totals.items() if split_key(k)[0] == scope}
+
+    def summary(self, day=None, scope=ALL_SCOPES):
+        # Running all-time sums plus the one requested day, so the cost doesn't grow with history
+        out = {"all_time": dict.fromkeys(FIELDS, 0), "today": dict.fromkeys(FIELDS, 0)}
+        day = day or datetime.now().strftime("%Y-%m-%d")
+        visible = lambda key: scope == ALL_SCOPES or split_key(key)[0] == scope
+        with self.lock:
+            rows = [(sums, self.totals[key].get(day)) for key, sums in self.all_time.items() if visible(key)]
+            rows += [(delta, delta if d == day else None) for (key, d), delta in self.pending.items() if visible(key)]
+            for all_time, today in rows:
+                for field in FIELDS:
+                    out["all_time"][field] += all_time.get(field, 0)
+                    if today: out["today"][field] += today.get(field, 0)
+        return out